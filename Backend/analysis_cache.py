@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ResultCache:
+    """
+    Disk-backed JSON cache stored in SQLite.
+
+    Entries expire after their TTL, and once the store grows past `max_bytes`
+    the least recently used entries are evicted first.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, default_ttl=24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """Store a JSON-serialisable value under `key`"""
+        payload = json.dumps(value)
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), expires_at, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self, now):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logging.info(f"Cache eviction removed {evicted} entries from {self.path}")
+
+
+def frame_fingerprint(df):
+    """Content fingerprint of a records DataFrame, independent of row and column order"""
+    df = df[sorted(df.columns)].astype(str)
+    row_hashes = np.sort(pd.util.hash_pandas_object(df, index=False).to_numpy())
+    digest = hashlib.sha256(",".join(df.columns).encode("utf-8"))
+    digest.update(row_hashes.tobytes())
+    return f"sha256:{digest.hexdigest()}"
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Shared cache for region analyses
+analysis_cache = ResultCache(
+    os.getenv("ANALYSIS_CACHE_PATH", os.path.join(BASE_DIR, "cache", "analysis_cache.sqlite3")),
+    max_bytes=int(float(os.getenv("ANALYSIS_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    default_ttl=float(os.getenv("ANALYSIS_CACHE_TTL", str(24 * 3600)))
+)
+# LLM sections depend only on the data package content, so they can live longer
+LLM_SECTION_TTL = float(os.getenv("ANALYSIS_CACHE_LLM_TTL", str(7 * 24 * 3600)))
+
+# Medical image analyses, keyed by image content hash (plus a URL -> ETag/hash index)
+image_cache = ResultCache(
+    os.getenv("IMAGE_CACHE_PATH", os.path.join(BASE_DIR, "cache", "image_cache.sqlite3")),
+    max_bytes=int(float(os.getenv("IMAGE_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    default_ttl=float(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+)
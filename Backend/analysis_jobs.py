@@ -0,0 +1,151 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from table_analysis import analyze_health_records, get_region_data_package
+
+# Response section name -> (analysis result key, title)
+ANALYSIS_SECTIONS = {
+    "metrics": ("metrics_analysis", "Health Metrics Analysis"),
+    "relationships": ("relationships_analysis", "Health Indicators Relationships"),
+    "patterns": ("patterns_analysis", "Health Patterns Identified"),
+    "recommendations": ("recommendations", "Healthcare Recommendations")
+}
+SECTION_BY_RESULT_KEY = {result_key: name for name, (result_key, _) in ANALYSIS_SECTIONS.items()}
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class AnalysisJob:
+    """State of one background region analysis, published section by section"""
+
+    def __init__(self, region_id):
+        self.id = uuid.uuid4().hex
+        self.region_id = region_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.statistics = None
+        self.sections = {}
+        self.error = None
+        # Append-only event log, so pollers and SSE streams can resume from any offset
+        self.events = []
+        self._condition = threading.Condition()
+
+    def publish(self, event, data):
+        with self._condition:
+            self.events.append({"event": event, "data": data})
+            self._condition.notify_all()
+
+    def finish(self, status, error=None):
+        """Mark the job finished and publish the final status atomically"""
+        with self._condition:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self.events.append({"event": "status", "data": {"status": status, "error": error}})
+            self._condition.notify_all()
+
+    def wait_for_events(self, offset, timeout):
+        """Return events after `offset`, waiting up to `timeout` seconds for new ones"""
+        with self._condition:
+            if len(self.events) <= offset and not self.done:
+                self._condition.wait(timeout)
+            return self.events[offset:]
+
+    @property
+    def done(self):
+        return self.status in ("completed", "failed")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "region_id": self.region_id,
+            "status": self.status,
+            "analysis_sections": dict(self.sections),
+            "statistics": self.statistics,
+            "error": self.error
+        }
+
+
+class AnalysisJobManager:
+    """
+    Runs region analyses on a bounded worker pool, separate from the HTTP workers.
+    Submissions beyond `max_pending` unfinished jobs are rejected.
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, job_ttl=3600):
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, region_id):
+        """Queue an analysis for a region, reusing an unfinished job for the same region"""
+        with self._lock:
+            self._prune()
+            for job in self._jobs.values():
+                if job.region_id == region_id and not job.done:
+                    return job
+            if sum(1 for job in self._jobs.values() if not job.done) >= self.max_pending:
+                raise JobQueueFull("Too many analyses in progress, try again later")
+            job = AnalysisJob(region_id)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        logging.info(f"Queued analysis job {job.id} for region {region_id}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.done and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        job.status = "running"
+        job.publish("status", {"status": job.status})
+        try:
+            data_package, total_records = get_region_data_package(job.region_id)
+            if not total_records:
+                raise ValueError("No health records found")
+            if not data_package:
+                raise ValueError("Data validation failed")
+
+            # Publish the statistics before any LLM section is ready
+            job.statistics = {
+                "total_records": total_records,
+                "features": data_package.get("features", []),
+                "risk_scores": data_package.get("risk_scores", {})
+            }
+            job.publish("statistics", job.statistics)
+
+            def on_section(result_key, content):
+                name = SECTION_BY_RESULT_KEY[result_key]
+                job.sections[name] = {"title": ANALYSIS_SECTIONS[name][1], "content": content}
+                job.publish("section", {"name": name, **job.sections[name]})
+
+            result = analyze_health_records(None, data_package=data_package, on_section=on_section)
+            # Failures come back as {"error": ...} or {"analysis": ...} instead of the section keys
+            if "error" in result or "analysis" in result:
+                job.finish("failed", result.get("error") or result.get("analysis"))
+            else:
+                job.finish("completed")
+        except Exception as e:
+            logging.error(f"Analysis job {job.id} failed: {str(e)}")
+            job.finish("failed", str(e))
+
+
+job_manager = AnalysisJobManager(
+    max_workers=int(os.getenv("ANALYSIS_JOB_WORKERS", "2")),
+    max_pending=int(os.getenv("ANALYSIS_JOB_MAX_PENDING", "16")),
+    job_ttl=float(os.getenv("ANALYSIS_JOB_TTL", "3600"))
+)
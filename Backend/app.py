@@ -1,11 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import medical_chat
 import logging
 from supabase_client import supabase
-from table_analysis import analyze_health_records, fetch_health_records
+from table_analysis import analyze_health_records, get_region_data_package
 from individual_analysis import main as get_individual_analysis
 from datetime import datetime
+import json
+import time
+from analysis_jobs import job_manager, JobQueueFull, ANALYSIS_SECTIONS
+from region_stats import refresh_region_stats
+from batch_analysis import analyze_regions, BATCH_MAX_REGIONS
+from specialist_classifier import routing_metrics
+from semantic_cache import semantic_cache
+from metrics import metrics, log_payload, payload_size
+from heart_registry import heart_registry, HEART_BATCH_CHUNK_ROWS
+import io
+import csv
+import shutil
+import tempfile
+import os
 
 # Configure logging
 logging.basicConfig(
@@ -13,10 +27,14 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+CORS_ORIGINS = ["http://localhost:5173"]
+# Load the heart-disease ensemble at startup instead of on the first prediction
+HEART_MODELS_PRELOAD = os.getenv("HEART_MODELS_PRELOAD", "true").lower() == "true"
+
 app = Flask(__name__)
 CORS(app, resources={
     r"/*": {
-        "origins": ["http://localhost:5173"],
+        "origins": CORS_ORIGINS,
         "methods": ["GET", "POST", "OPTIONS"],
         "allow_headers": ["Content-Type"]
     }
@@ -26,18 +44,15 @@ CORS(app, resources={
 def get_ai_response():
     try:
         data = request.json
-        logging.info("----------------------------------------")
-        logging.info("Received Frontend Data:")
-        logging.info(f"Question: {data.get('question')}")
-        logging.info(f"Option Selected: {data.get('option')}")
-        logging.info(f"Image URL: {data.get('imgurl')}")
-        logging.info(f"Conversation History Length: {len(data.get('conversationsNew', []))}")
-        logging.info("----------------------------------------")
-        
+        log_payload("chat_received", question_chars=payload_size(data.get("question")),
+                    option=data.get("option"), has_image=bool(data.get("imgurl")),
+                    history_messages=len(data.get("conversationsNew", [])))
+
         user_input = data.get("question")
         conversation = data.get("conversationsNew", [])
         option = data.get("option", "")
         img_url = data.get("imgurl", "")  # Get image URL from request
+        session_id = data.get("sessionId")  # Optional, scopes cached conversation summaries
 
         if not user_input:
             logging.error("No question provided")
@@ -50,9 +65,8 @@ def get_ai_response():
             logging.error(f"Supabase connection error: {str(e)}")
             return jsonify({"error": "Database connection error"}), 500
 
-        logging.info(f"Processing question: {user_input}")
-        response = medical_chat.medical_assistant(user_input, conversation, option, img_url)
-        logging.info(f"AI response: {response}")
+        response = medical_chat.medical_assistant(user_input, conversation, option, img_url, session_id)
+        log_payload("chat_response", response_chars=payload_size(response))
         
         return jsonify({"response": response}), 200
 
@@ -60,6 +74,160 @@ def get_ai_response():
         logging.error(f"Error in get_ai_response: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/doctor/chat-ai/stream', methods=['POST'])
+def stream_ai_response():
+    """
+    Server-Sent Events version of /doctor/chat-ai: `token` events carry the
+    answer as it is generated, then `done` carries the full text and timings.
+    """
+    data = request.json or {}
+    user_input = data.get("question")
+    conversation = data.get("conversationsNew", [])
+    option = data.get("option", "")
+    img_url = data.get("imgurl", "")
+    session_id = data.get("sessionId")
+
+    if not user_input:
+        logging.error("No question provided")
+        return jsonify({"error": "No question provided"}), 400
+
+    log_payload("chat_stream_received", question_chars=payload_size(user_input),
+                option=option, has_image=bool(img_url), history_messages=len(conversation))
+
+    def generate():
+        start = time.perf_counter()
+        first_token = None
+        pieces = []
+        stages = {}
+        try:
+            for piece in medical_chat.medical_assistant_stream(user_input, conversation, option, img_url,
+                                                               session_id, stage_timings=stages):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    metrics.observe("chat_time_to_first_token_seconds", first_token,
+                                    help_text="Streamed chat time to first token in seconds")
+                pieces.append(piece)
+                yield f"event: token\ndata: {json.dumps({'text': piece})}\n\n"
+        except Exception as e:
+            logging.error(f"Error in stream_ai_response: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            return
+        response = "".join(pieces)
+        total = time.perf_counter() - start
+        logging.info(f"Streamed answer in {total:.3f}s (first token after {first_token or 0:.3f}s)")
+        log_payload("chat_response", response_chars=payload_size(response), seconds=round(total, 3))
+        done = {
+            "response": response,
+            "time_to_first_token": round(first_token, 3) if first_token is not None else None,
+            "total_seconds": round(total, 3),
+            "stages": stages
+        }
+        yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/doctor/chat-ai/routing-metrics', methods=['GET'])
+def get_routing_metrics():
+    """How often specialist routing was answered locally vs by the LLM"""
+    return jsonify(routing_metrics.snapshot()), 200
+
+@app.route('/doctor/chat-ai/cache-metrics', methods=['GET'])
+def get_semantic_cache_metrics():
+    """Semantic answer cache hits, misses, evictions and hit rate"""
+    return jsonify(semantic_cache.snapshot()), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage latency histograms and counters in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/predict/heart', methods=['POST'])
+def predict_heart_disease():
+    """
+    Heart disease prediction from the resident ensemble. The body is either
+    {"record": {...}} keyed by feature name, {"record": "40, male, ata, ..."}
+    or the feature object itself.
+    """
+    try:
+        data = request.json or {}
+        record = data.get("record", data)
+        result = heart_registry.predict(record)
+        if result is None:
+            return jsonify({"error": "Heart models are not loaded", **heart_registry.info()}), 503
+        return jsonify(result), 200
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error in predict_heart_disease: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/predict/heart/batch', methods=['POST'])
+def predict_heart_disease_batch():
+    """
+    Score many patients at once. A JSON array (or {"records": [...]}) returns
+    JSON with per-row probabilities; a CSV upload (multipart field "file" or a
+    text/csv body, with the feature columns as headers) streams back a CSV
+    with the probabilities, read and scored HEART_BATCH_CHUNK_ROWS at a time.
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is None and request.mimetype != 'text/csv':
+            data = request.json
+            records = data.get("records") if isinstance(data, dict) else data
+            if not isinstance(records, list) or not records:
+                return jsonify({"error": "No records provided"}), 400
+            result = heart_registry.predict_batch(records)
+            if result is None:
+                return jsonify({"error": "Heart models are not loaded", **heart_registry.info()}), 503
+            return jsonify(result), 200
+
+        # Spooled to our own temp file: the upload is closed when the view returns, before the
+        # response body is streamed
+        csv_file = tempfile.TemporaryFile()
+        shutil.copyfileobj(upload.stream if upload else request.stream, csv_file)
+        csv_file.seek(0)
+        lines = io.TextIOWrapper(csv_file, encoding='utf-8-sig', newline='')
+        scored = heart_registry.iter_csv_scores(lines, HEART_BATCH_CHUNK_ROWS)
+        if scored is None:
+            lines.close()
+            return jsonify({"error": "Heart models are not loaded", **heart_registry.info()}), 503
+        version, header, chunks = scored
+
+        def generate():
+            try:
+                yield ",".join(header) + "\n"
+                for rows in chunks:
+                    output = io.StringIO()
+                    csv.writer(output, lineterminator="\n").writerows(rows)
+                    yield output.getvalue()
+            finally:
+                lines.close()
+
+        return Response(generate(), mimetype='text/csv',
+                        headers={'X-Model-Version': version})
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error in predict_heart_disease_batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/predict/heart/models', methods=['GET'])
+def get_heart_models():
+    """Loaded ensemble version, load time and checksum of each artifact"""
+    return jsonify(heart_registry.info()), 200
+
+@app.route('/predict/heart/reload', methods=['POST'])
+def reload_heart_models():
+    """Reload the ensemble from disk now instead of waiting for the change check"""
+    try:
+        heart_registry.load()
+        return jsonify(heart_registry.info()), 200
+    except Exception as e:
+        return jsonify({"error": str(e), **heart_registry.info()}), 500
+
 @app.route('/chronic-disease', methods=['POST'])
 def get_chronic_disease_analysis():
     try:
@@ -71,39 +239,28 @@ def get_chronic_disease_analysis():
         if not region_id:
             return jsonify({"error": "No region ID provided"}), 400
 
-        # Fetch records first
-        records = fetch_health_records(region_id)
-        if not records:
+        # Data package is served from the cache while the region's records are unchanged
+        data_package, total_records = get_region_data_package(region_id)
+        if not total_records:
             return jsonify({
                 "error": "No health records found",
                 "region_id": region_id
             }), 404
 
         # Get analysis using analyze_health_records from table_analysis
-        analysis_result = analyze_health_records(records)
+        analysis_result = analyze_health_records(None, data_package=data_package)
         
         # Structure the response with all four sections
         response = {
             "analysis_sections": {
-                "metrics": {
-                    "title": "Health Metrics Analysis",
-                    "content": analysis_result.get("metrics_analysis")
-                },
-                "relationships": {
-                    "title": "Health Indicators Relationships",
-                    "content": analysis_result.get("relationships_analysis")
-                },
-                "patterns": {
-                    "title": "Health Patterns Identified",
-                    "content": analysis_result.get("patterns_analysis")
-                },
-                "recommendations": {
-                    "title": "Healthcare Recommendations",
-                    "content": analysis_result.get("recommendations")
+                name: {
+                    "title": title,
+                    "content": analysis_result.get(result_key)
                 }
+                for name, (result_key, title) in ANALYSIS_SECTIONS.items()
             },
             "statistics": {
-                "total_records": len(records),
+                "total_records": total_records,
                 "features": analysis_result.get("data_package", {}).get("features", []),
                 "risk_scores": analysis_result.get("data_package", {}).get("risk_scores", {})
             }
@@ -119,6 +276,145 @@ def get_chronic_disease_analysis():
             "region_id": region_id if 'region_id' in locals() else None
         }), 500
 
+@app.route('/chronic-disease/statistics', methods=['POST'])
+def get_region_statistics():
+    """Region statistics and correlations from the incrementally maintained accumulator"""
+    try:
+        data = request.json
+        region_id = data.get('region_id')
+
+        if not region_id:
+            return jsonify({"error": "No region ID provided"}), 400
+
+        accumulator = refresh_region_stats(region_id)
+        if not accumulator.total_rows:
+            return jsonify({
+                "error": "No health records found",
+                "region_id": region_id
+            }), 404
+
+        return jsonify({
+            "region_id": region_id,
+            "total_records": accumulator.total_rows,
+            "statistics": accumulator.statistics(),
+            "correlations": accumulator.correlations(),
+            "quantiles": accumulator.quantiles()
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error in get_region_statistics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/chronic-disease/batch', methods=['POST'])
+def get_batch_chronic_disease_analysis():
+    """Analyse several regions from one combined fetch; statistics_only skips the LLM"""
+    try:
+        data = request.json
+        region_ids = data.get('region_ids')
+        statistics_only = bool(data.get('statistics_only', False))
+
+        if not region_ids or not isinstance(region_ids, list):
+            return jsonify({"error": "No region IDs provided"}), 400
+        region_ids = list(dict.fromkeys(region_ids))
+        if len(region_ids) > BATCH_MAX_REGIONS:
+            return jsonify({"error": f"At most {BATCH_MAX_REGIONS} regions per batch"}), 400
+
+        logging.info(f"Processing batch analysis for {len(region_ids)} regions (statistics_only={statistics_only})")
+        results = analyze_regions(region_ids, statistics_only=statistics_only)
+
+        regions = {}
+        for region_id, result in results.items():
+            data_package = result["data_package"]
+            region = {
+                "statistics": {
+                    "total_records": result["total_records"],
+                    "features": data_package.get("features", []),
+                    "risk_scores": data_package.get("risk_scores", {}),
+                    "summary": data_package.get("statistics", {}),
+                    "data_quality": data_package.get("data_quality", {})
+                }
+            }
+            if not statistics_only:
+                analysis = result.get("analysis", {})
+                region["analysis_sections"] = {
+                    name: {
+                        "title": title,
+                        "content": analysis.get(result_key)
+                    }
+                    for name, (result_key, title) in ANALYSIS_SECTIONS.items()
+                }
+            regions[region_id] = region
+
+        return jsonify({
+            "regions": regions,
+            "missing_regions": [region_id for region_id in region_ids if region_id not in results]
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error in get_batch_chronic_disease_analysis: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/chronic-disease/jobs', methods=['POST'])
+def submit_chronic_disease_job():
+    """Start a background region analysis and return its job id immediately"""
+    try:
+        data = request.json
+        region_id = data.get('region_id')
+
+        if not region_id:
+            return jsonify({"error": "No region ID provided"}), 400
+
+        job = job_manager.submit(region_id)
+        return jsonify({
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/chronic-disease/jobs/{job.id}",
+            "events_url": f"/chronic-disease/jobs/{job.id}/events"
+        }), 202
+
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        logging.error(f"Error in submit_chronic_disease_job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/chronic-disease/jobs/<job_id>', methods=['GET'])
+def get_chronic_disease_job(job_id):
+    """Poll a job; statistics and finished sections are included as they become available"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/chronic-disease/jobs/<job_id>/events', methods=['GET'])
+def stream_chronic_disease_job(job_id):
+    """Server-Sent Events stream of a job's statistics, sections and status changes"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+
+    def generate():
+        offset = start
+        while True:
+            events = job.wait_for_events(offset, timeout=15)
+            if not events:
+                if job.done:
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield f"id: {offset}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                offset += 1
+            if job.done and offset >= len(job.events):
+                break
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
 @app.route('/analysis', methods=['POST'])
 def get_patient_analysis():
     try:
@@ -148,6 +444,9 @@ def get_patient_analysis():
         logging.error(f"Error in get_patient_analysis: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+if HEART_MODELS_PRELOAD:
+    heart_registry.preload()
+
 if __name__ == '__main__':
     app.run(port=5000, debug=True)
 
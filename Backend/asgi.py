@@ -0,0 +1,182 @@
+"""
+ASGI entry point, for serving many concurrent chats from one process:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The chat endpoints are served by async views: the answer is awaited on the
+async LLM client, so an in-flight chat holds no thread while the model
+generates. Only the short preparation work (routing, image analysis, context)
+runs on a bounded thread pool. Every other route is the unchanged Flask app,
+mounted through a2wsgi's WSGI adapter on its own pool of ASGI_WSGI_THREADS
+threads, so Flask requests (and each open job event stream) run side by side
+as under the threaded Flask server. Request and response bodies match app.py.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import anyio
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+import medical_chat
+from app import app as flask_app, CORS_ORIGINS
+from llm_gateway import llm_gateway
+from metrics import metrics, log_payload, payload_size
+from semantic_cache import semantic_cache
+from supabase_client import supabase
+
+# Chats being answered at once; further requests wait their turn
+ASGI_MAX_CHATS = int(os.getenv("ASGI_MAX_CHATS", "500"))
+# Threads for the blocking preparation stages
+ASGI_PREP_THREADS = int(os.getenv("ASGI_PREP_THREADS", "32"))
+# Threads serving the mounted Flask routes; an open SSE stream holds one for its lifetime
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "64"))
+
+_chat_slots = None
+_prep_limiter = None
+
+
+def _limits():
+    # Created lazily so they belong to the serving event loop
+    global _chat_slots, _prep_limiter
+    if _chat_slots is None:
+        _chat_slots = asyncio.Semaphore(ASGI_MAX_CHATS)
+        _prep_limiter = anyio.CapacityLimiter(ASGI_PREP_THREADS)
+    return _chat_slots, _prep_limiter
+
+
+async def _blocking(func, *args):
+    return await anyio.to_thread.run_sync(lambda: func(*args), limiter=_limits()[1])
+
+
+def _cors(request, response):
+    """Same CORS answer as flask_cors gives the Flask routes (preflights are answered by Flask)"""
+    origin = request.headers.get("origin")
+    if origin in CORS_ORIGINS:
+        response.headers["Access-Control-Allow-Origin"] = origin
+        response.headers["Vary"] = "Origin"
+    return response
+
+
+async def _read_chat_request(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    return (data.get("question"), data.get("conversationsNew", []), data.get("option", ""),
+            data.get("imgurl", ""), data.get("sessionId"))
+
+
+async def _prepare(user_input, conversation, option, img_url, session_id):
+    """(model, messages, category, timings, cacheable, cached answer) for one chat request"""
+    model, messages, category, timings = await _blocking(
+        medical_chat.build_chat_request, user_input, conversation, option, img_url, session_id
+    )
+    cacheable = medical_chat.is_standalone_query(conversation, img_url)
+    cached = await _blocking(semantic_cache.lookup, user_input, category) if cacheable else None
+    return model, messages, category, timings, cacheable, cached
+
+
+async def chat(request):
+    return _cors(request, await _chat(request))
+
+
+async def _chat(request):
+    user_input, conversation, option, img_url, session_id = await _read_chat_request(request)
+    log_payload("chat_received", question_chars=payload_size(user_input), option=option,
+                has_image=bool(img_url), history_messages=len(conversation))
+    if not user_input:
+        logging.error("No question provided")
+        return JSONResponse({"error": "No question provided"}, status_code=400)
+
+    try:
+        await _blocking(supabase.auth.get_session)
+    except Exception as e:
+        logging.error(f"Supabase connection error: {str(e)}")
+        return JSONResponse({"error": "Database connection error"}, status_code=500)
+
+    async with _limits()[0]:
+        try:
+            model, messages, category, _, cacheable, cached = await _prepare(
+                user_input, conversation, option, img_url, session_id
+            )
+        except Exception as e:
+            logging.error(f"Error in medical_assistant: {str(e)}")
+            return JSONResponse({"response": "I apologize, but I'm having trouble processing your request. "
+                                             "Please try again."}, status_code=200)
+        if cached:
+            return JSONResponse({"response": cached}, status_code=200)
+        try:
+            response = await llm_gateway.acomplete(messages, model=model)
+        except Exception as e:
+            logging.error(f"Error calling Groq API: {str(e)}")
+            response = None
+        if cacheable and response:
+            await _blocking(semantic_cache.store, user_input, category, response)
+
+    log_payload("chat_response", response_chars=payload_size(response))
+    return JSONResponse({"response": response}, status_code=200)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def chat_stream(request):
+    user_input, conversation, option, img_url, session_id = await _read_chat_request(request)
+    if not user_input:
+        logging.error("No question provided")
+        return _cors(request, JSONResponse({"error": "No question provided"}, status_code=400))
+    log_payload("chat_stream_received", question_chars=payload_size(user_input), option=option,
+                has_image=bool(img_url), history_messages=len(conversation))
+
+    async def generate():
+        async with _limits()[0]:
+            start = time.perf_counter()
+            first_token = None
+            pieces = []
+            try:
+                model, messages, category, stages, cacheable, cached = await _prepare(
+                    user_input, conversation, option, img_url, session_id
+                )
+                answer = _single(cached) if cached else llm_gateway.astream(messages, model=model)
+                async for piece in answer:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                        metrics.observe("chat_time_to_first_token_seconds", first_token,
+                                        help_text="Streamed chat time to first token in seconds")
+                    pieces.append(piece)
+                    yield _sse("token", {"text": piece})
+            except Exception as e:
+                logging.error(f"Error in stream_ai_response: {str(e)}")
+                yield _sse("error", {"error": str(e)})
+                return
+            response = "".join(pieces)
+            if cacheable and not cached:
+                await _blocking(semantic_cache.store, user_input, category, response)
+            total = time.perf_counter() - start
+            logging.info(f"Streamed answer in {total:.3f}s (first token after {first_token or 0:.3f}s)")
+            log_payload("chat_response", response_chars=payload_size(response), seconds=round(total, 3))
+            yield _sse("done", {
+                "response": response,
+                "time_to_first_token": round(first_token, 3) if first_token is not None else None,
+                "total_seconds": round(total, 3),
+                "stages": stages
+            })
+
+    return _cors(request, StreamingResponse(generate(), media_type="text/event-stream",
+                                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}))
+
+
+async def _single(text):
+    yield text
+
+
+app = Starlette(routes=[
+    Route("/doctor/chat-ai", chat, methods=["POST"]),
+    Route("/doctor/chat-ai/stream", chat_stream, methods=["POST"]),
+    Mount("/", app=WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS))
+])
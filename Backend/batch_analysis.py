@@ -0,0 +1,177 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from table_analysis import analyze_health_records, fetch_regions_frame
+
+REGION_COLUMN = "region_id"
+RISK_FACTORS = ['heart_rate', 'systolic_bp', 'bmi', 'blood_glucose']
+SUMMARY_STATS = ['mean', 'median', 'std', 'min', 'max']
+
+BATCH_MAX_REGIONS = int(os.getenv("BATCH_MAX_REGIONS", "50"))
+# Regions analysed by the LLM at once; prompts still share the Groq rate limiter
+BATCH_LLM_PARALLELISM = int(os.getenv("BATCH_LLM_PARALLELISM", "2"))
+
+
+def _group_mode(values, groups):
+    """Most frequent non-null value of a column within each group"""
+    counts = pd.DataFrame({"group": groups, "value": values}).dropna()\
+        .groupby(["group", "value"], sort=False).size().reset_index(name="n")
+    counts = counts.sort_values("n", ascending=False, kind="stable").drop_duplicates("group")
+    return counts.set_index("group")["value"]
+
+
+def _group_standardize(df, groups):
+    """Per-group StandardScaler: zero-variance columns are only centred"""
+    grouped = df.groupby(groups)
+    std = grouped.transform("std", ddof=0)
+    return (df - grouped.transform("mean")) / std.mask(std == 0, 1)
+
+
+def preprocess_regions(df):
+    """
+    Region-wise equivalent of preprocess_data over a combined frame.
+    Imputation (median / most frequent) and scaling are computed per region
+    with groupby transforms instead of fitting one pipeline per region.
+    Returns (scaled_df, raw_df, groups, dummy_available), the last being a
+    region x dummy-column frame of which one-hot columns a region would have
+    had on its own (drop_first drops each region's own first category).
+    """
+    groups = df[REGION_COLUMN]
+    df = df.drop(columns=[REGION_COLUMN])
+
+    numerical_cols = df.select_dtypes(include=np.number).columns
+    categorical_cols = df.select_dtypes(include='object').columns
+
+    if not numerical_cols.empty:
+        df[numerical_cols] = df[numerical_cols].fillna(df[numerical_cols].groupby(groups).transform('median'))
+
+    dummy_available = pd.DataFrame(index=pd.Index(groups.unique()))
+    if not categorical_cols.empty:
+        for col in categorical_cols:
+            values = df[col].fillna(groups.map(_group_mode(df[col], groups)))
+            dummies = pd.get_dummies(values, prefix=col, drop_first=True)
+            # Category codes in get_dummies' order, which also sorts mixed values (True, "yes")
+            codes = pd.Series(pd.Categorical(values).codes, index=values.index)
+            region_first = codes.where(codes >= 0).groupby(groups).min()
+            present = dummies.groupby(groups).any()
+            for code, dummy in enumerate(dummies.columns, start=1):
+                dummy_available[dummy] = present[dummy] & (region_first != code)
+            df[col] = values
+        df = pd.get_dummies(df, columns=categorical_cols.tolist(), drop_first=True)
+
+    raw_df = df.copy()
+    num_cols = df.select_dtypes(include=np.number).columns
+    df[num_cols] = _group_standardize(df[num_cols], groups)
+    return df, raw_df, groups, dummy_available
+
+
+def create_region_features(df, groups):
+    """Region-wise equivalent of create_features on scaled data"""
+    if all(col in df.columns for col in RISK_FACTORS):
+        df['cv_risk_score'] = _group_standardize(df[RISK_FACTORS], groups).mean(axis=1).round(2)
+    if 'respiratory_rate' in df.columns and 'oxygen_saturation' in df.columns:
+        df['respiratory_health'] = (df['respiratory_rate'] / 20 + df['oxygen_saturation'] / 100).round(2)
+    else:
+        df['respiratory_health'] = np.nan
+    return df
+
+
+def _risk_scores(scaled_df, groups):
+    scores = {}
+    if all(col in scaled_df.columns for col in RISK_FACTORS) and 'cv_risk_score' in scaled_df.columns:
+        scores["cardiovascular"] = scaled_df['cv_risk_score'].groupby(groups).describe()
+    if all(col in scaled_df.columns for col in ['respiratory_rate', 'oxygen_saturation']):
+        scores["respiratory"] = scaled_df['respiratory_health'].groupby(groups).describe()
+    return scores
+
+
+def build_region_data_packages(df, multiplier=1.5):
+    """
+    Build every region's data package from one combined frame (with a region_id
+    column) in a single groupby pass, in the same shape as validate_and_format_data.
+    Returns {region_id: (data_package, total_records)}.
+    """
+    scaled_df, raw_df, groups, dummy_available = preprocess_regions(df)
+    scaled_df = create_region_features(scaled_df, groups)
+
+    # A column counts for a region if it has values there (dummies: see preprocess_regions)
+    available = raw_df.notna().groupby(groups).any()
+    if not dummy_available.empty:
+        available[dummy_available.columns] = dummy_available.reindex(available.index)
+
+    num_cols = raw_df.select_dtypes(include=np.number).columns.tolist()
+    grouped = raw_df[num_cols].groupby(groups)
+    stats = grouped.agg(SUMMARY_STATS).round(2)
+    correlations = grouped.corr().round(2) if len(num_cols) > 1 else None
+
+    # IQR outliers: per-region quartiles broadcast back to the rows
+    q1 = grouped.quantile(0.25)
+    q3 = grouped.quantile(0.75)
+    iqr = q3 - q1
+    lower = (q1 - multiplier * iqr).reindex(groups).to_numpy()
+    upper = (q3 + multiplier * iqr).reindex(groups).to_numpy()
+    values = raw_df[num_cols].to_numpy(dtype=np.float64)
+    outlier_counts = pd.DataFrame((values < lower) | (values > upper), columns=num_cols)\
+        .groupby(groups.to_numpy()).sum()
+    sizes = groups.value_counts()
+    risk_scores = _risk_scores(scaled_df, groups)
+
+    packages = {}
+    for region_id in groups.unique():
+        region_available = available.loc[region_id]
+        valid_num_cols = [col for col in num_cols if region_available[col]]
+        total = int(sizes[region_id])
+        package = {
+            "features": [col for col in raw_df.columns if region_available[col]],
+            "statistics": {
+                col: {stat: float(stats.at[region_id, (col, stat)]) for stat in SUMMARY_STATS}
+                for col in valid_num_cols
+            },
+            "correlations": {},
+            "risk_scores": {
+                name: frame.loc[region_id].to_dict() for name, frame in risk_scores.items()
+            },
+            "data_quality": {
+                "outliers": {
+                    col: {
+                        "outlier_count": int(outlier_counts.at[region_id, col]),
+                        "total_count": total,
+                        "outlier_percentage": round(int(outlier_counts.at[region_id, col]) / total * 100, 2)
+                    }
+                    for col in valid_num_cols
+                }
+            }
+        }
+        if correlations is not None and len(valid_num_cols) > 1:
+            package["correlations"] = correlations.loc[region_id].loc[valid_num_cols, valid_num_cols].to_dict()
+        packages[region_id] = (package, total)
+    return packages
+
+
+def analyze_regions(region_ids, statistics_only=False):
+    """
+    Fetch and analyse several regions together. Returns {region_id: result},
+    where result has the data package and total record count, plus the LLM
+    analysis unless statistics_only is set. Regions without records are omitted.
+    """
+    df = fetch_regions_frame(region_ids)
+    if df is None:
+        return {}
+    packages = build_region_data_packages(df)
+    results = {
+        region_id: {"data_package": package, "total_records": total}
+        for region_id, (package, total) in packages.items()
+    }
+    if statistics_only or not results:
+        return results
+
+    def analyze(region_id):
+        return region_id, analyze_health_records(None, data_package=results[region_id]["data_package"])
+
+    with ThreadPoolExecutor(max_workers=max(1, min(BATCH_LLM_PARALLELISM, len(results)))) as executor:
+        for region_id, analysis in executor.map(analyze, list(results)):
+            results[region_id]["analysis"] = analysis
+    logging.info(f"Batch analysis completed for {len(results)} regions")
+    return results
@@ -0,0 +1,186 @@
+"""
+Time and memory benchmarks for the table_analysis pipeline on synthetic records.
+
+    python Backend/benchmarks/run_benchmarks.py --sizes 1000 100000 1000000
+    python Backend/benchmarks/run_benchmarks.py --sizes 1000 --compare old.json
+
+Each stage is timed (best of --repeat runs) and then run once more under
+tracemalloc to record its peak Python/NumPy allocation. Results are written
+as JSON, tagged with the git commit, so runs can be compared across commits.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import warnings
+import resource
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# The pipeline modules create their API clients at import; no calls are made here
+os.environ.setdefault("SUPABASE_URL", "https://benchmark.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ.setdefault("ANALYSIS_CACHE_PATH", os.path.join(BACKEND_DIR, "benchmarks", "results", "cache.sqlite3"))
+
+import numpy as np
+import pandas as pd
+from table_analysis import (
+    HEALTH_RECORD_COLUMNS, flatten_records, preprocess_data, create_features,
+    validate_and_format_data, detect_outliers
+)
+from quantile_sketch import KLLSketch, sketch_outliers
+from benchmarks.synthetic_records import generate_records
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def _outliers_exact(raw_df):
+    return {col: detect_outliers(raw_df[col]) for col in raw_df.select_dtypes(include=np.number).columns}
+
+
+def _outliers_sketch(raw_df):
+    return {col: sketch_outliers(KLLSketch().update(raw_df[col].to_numpy(dtype=np.float64)))
+            for col in raw_df.select_dtypes(include=np.number).columns}
+
+
+def pipeline_stages():
+    """
+    (name, function) pairs in pipeline order. Each function takes the previous
+    stage's outputs from `state` and stores its own, so stages run in isolation.
+    """
+    def flatten(state):
+        state["flat"] = flatten_records(state["records"])
+
+    def preprocess(state):
+        state["scaled"], state["raw"] = preprocess_data(state["flat"])
+
+    def features(state):
+        state["features"] = create_features(state["scaled"].copy())
+
+    def validate(state):
+        validate_and_format_data(state["features"], state["raw"])
+
+    def outliers(state):
+        _outliers_exact(state["raw"])
+
+    def outliers_sketch(state):
+        _outliers_sketch(state["raw"])
+
+    return [
+        ("flatten_records", flatten),
+        ("preprocess_data", preprocess),
+        ("create_features", features),
+        ("validate_and_format_data", validate),
+        ("detect_outliers", outliers),
+        ("detect_outliers[sketch]", outliers_sketch)
+    ]
+
+
+def benchmark_size(rows, repeat=1, seed=0):
+    """Run every stage on `rows` synthetic records and return one result per stage"""
+    print(f"Generating {rows} records...", flush=True)
+    records = [{column: record.get(column) for column in HEALTH_RECORD_COLUMNS}
+               for record in generate_records(rows, seed=seed)]
+    state = {"records": records}
+    results = []
+    for name, stage in pipeline_stages():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            stage(state)
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        stage(state)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+
+        result = {
+            "rows": rows,
+            "stage": name,
+            "seconds": round(min(timings), 6),
+            "seconds_all": [round(t, 6) for t in timings],
+            "peak_mb": round(peak / 1024 ** 2, 2)
+        }
+        print(f"  {name:<34} {result['seconds']:>10.4f}s {result['peak_mb']:>10.1f} MB", flush=True)
+        results.append(result)
+    return results
+
+
+def compare(current, previous_path):
+    """Print per-stage time and memory ratios against an earlier results file"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    old = {(r["rows"], r["stage"]): r for r in previous["results"]}
+    print(f"\nCompared with {previous['meta'].get('commit')} ({previous_path}):")
+    for result in current["results"]:
+        before = old.get((result["rows"], result["stage"]))
+        if not before:
+            continue
+        time_ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("nan")
+        memory_ratio = result["peak_mb"] / before["peak_mb"] if before["peak_mb"] else float("nan")
+        print(f"  {result['rows']:>8} {result['stage']:<34} time x{time_ratio:.2f}  memory x{memory_ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    commit = _git_commit()
+    results = []
+    for rows in args.sizes:
+        results.extend(benchmark_size(rows, args.repeat, args.seed))
+
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "repeat": args.repeat,
+            "seed": args.seed
+        },
+        "results": results
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{commit or 'nocommit'}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import uuid
+import random
+from datetime import datetime, timedelta
+from health_records import JSONB_SCHEMA
+
+# Share of records where a plain column is null
+SCALAR_MISSING_RATES = {
+    "heart_rate": 0.05,
+    "blood_pressure": 0.08,
+    "respiratory_rate": 0.15,
+    "body_temperature": 0.05,
+    "bmi": 0.20,
+    "blood_glucose": 0.25,
+    "oxygen_saturation": 0.10,
+    "gender": 0.02
+}
+# Share of records where a whole JSONB column is null / an empty object
+JSONB_MISSING_RATE = 0.05
+JSONB_EMPTY_RATE = 0.05
+# Share of keys left out of a present JSONB object, and of keys sent as null
+KEY_MISSING_RATE = 0.10
+KEY_NULL_RATE = 0.05
+
+# Choices offered by the health report form
+TEXT_CHOICES = {
+    ("general_health", "main_complaint"): ["fever", "cough", "headache", "body ache", "fatigue", "breathlessness"],
+    ("general_health", "symptom_duration"): ["hours", "days", "weeks", "months"],
+    ("pain_discomfort", "pain_location"): ["head", "chest", "abdomen", "back", "joints"],
+    ("pain_discomfort", "pain_triggers"): ["movement", "eating", "stress", "none"],
+    ("digestion_appetite", "diarrhea"): ["yes", "no", "sometimes"],
+    ("digestion_appetite", "constipation"): ["yes", "no", "sometimes"],
+    ("chronic_conditions", "current_medications"): ["none", "metformin", "amlodipine", "aspirin"],
+    ("chronic_conditions", "known_allergies"): ["none", "penicillin", "dust", "pollen"],
+    ("lifestyle_habits", "meal_frequency"): ["1-2", "3", "4+"],
+    ("lifestyle_habits", "diet"): ["vegetarian", "non-vegetarian", "mixed"],
+    ("lifestyle_habits", "physical_activity"): ["none", "light", "moderate", "heavy"],
+    ("womens_health", "last_menstrual_period"): ["within a month", "1-3 months", "over 3 months"],
+    ("mental_health", "emotional_state"): ["good", "okay", "stressed", "depressed"],
+    ("mental_health", "stressful_events"): ["none", "job loss", "bereavement", "illness"],
+    ("mental_health", "sleep_duration"): ["less_than_6", "6_to_8", "8_to_10", "more_than_10"],
+    ("heart_health", "chest_pain_type"): ["ATA", "NAP", "ASY", "TA"],
+    ("heart_health", "resting_ecg"): ["Normal", "ST", "LVH"],
+    ("heart_health", "st_slope"): ["Up", "Flat", "Down"]
+}
+# (mean, std, low, high, decimals) of numeric JSONB keys
+NUMBER_RANGES = {
+    ("pain_discomfort", "pain_level"): (3, 2.5, 0, 10, 0),
+    ("heart_health", "resting_bp"): (132, 18, 80, 200, 0),
+    ("heart_health", "cholesterol"): (200, 45, 100, 400, 0),
+    ("heart_health", "max_hr"): (140, 25, 60, 202, 0),
+    ("heart_health", "oldpeak"): (0.9, 1.0, -2, 6, 1)
+}
+# Prevalence of true answers for boolean keys (default 0.2)
+BOOL_RATES = {
+    ("chronic_conditions", "high_blood_pressure"): 0.3,
+    ("chronic_conditions", "diabetes"): 0.15,
+    ("lifestyle_habits", "smoking"): 0.25,
+    ("lifestyle_habits", "tobacco_chewing"): 0.2,
+    ("mental_health", "sleep_quality"): 0.6
+}
+
+
+def _gauss(rnd, mean, std, low, high, decimals):
+    value = min(high, max(low, rnd.gauss(mean, std)))
+    return round(value, decimals) if decimals else int(round(value))
+
+
+def _blood_pressure(rnd):
+    """Mostly well formed 'systolic/diastolic' strings, with the odd malformed entry"""
+    systolic = _gauss(rnd, 128, 18, 85, 210, 0)
+    diastolic = _gauss(rnd, systolic * 0.63, 8, 50, 130, 0)
+    roll = rnd.random()
+    if roll < 0.01:
+        return str(systolic)
+    if roll < 0.015:
+        return f"{systolic} / {diastolic} mmHg"
+    if roll < 0.02:
+        return ""
+    return f"{systolic}/{diastolic}"
+
+
+def _jsonb_value(rnd, column, key, kind):
+    if rnd.random() < KEY_NULL_RATE:
+        return None
+    if kind == "number":
+        return _gauss(rnd, *NUMBER_RANGES.get((column, key), (5, 2, 0, 10, 0)))
+    if kind == "bool":
+        value = rnd.random() < BOOL_RATES.get((column, key), 0.2)
+        # Older clients sent some answers as strings
+        if rnd.random() < 0.02:
+            return "yes" if value else "no"
+        return value
+    return rnd.choice(TEXT_CHOICES.get((column, key), ["none", "other"]))
+
+
+def generate_record(rnd, region_id, created_at):
+    """One patient_health_records row, as returned by Supabase"""
+    gender = rnd.choices(["male", "female", "other"], weights=[0.49, 0.49, 0.02])[0]
+    height = _gauss(rnd, 162, 10, 130, 200, 0)
+    weight = _gauss(rnd, 64, 14, 30, 150, 1)
+    record = {
+        "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+        "region_id": region_id,
+        "created_at": created_at.isoformat(),
+        "updated_at": created_at.isoformat(),
+        "heart_rate": _gauss(rnd, 78, 12, 40, 180, 0),
+        "blood_pressure": _blood_pressure(rnd),
+        "respiratory_rate": _gauss(rnd, 16, 3, 8, 40, 0),
+        "body_temperature": _gauss(rnd, 36.9, 0.6, 35, 41, 1),
+        "bmi": round(weight / (height / 100) ** 2, 1),
+        "blood_glucose": _gauss(rnd, 115, 35, 50, 400, 0),
+        "oxygen_saturation": _gauss(rnd, 97, 2, 80, 100, 0),
+        "gender": gender
+    }
+    for column, rate in SCALAR_MISSING_RATES.items():
+        if rnd.random() < rate:
+            record[column] = None
+
+    for column, keys in JSONB_SCHEMA.items():
+        if column == "womens_health" and gender != "female":
+            record[column] = {}
+            continue
+        roll = rnd.random()
+        if roll < JSONB_MISSING_RATE:
+            record[column] = None
+        elif roll < JSONB_MISSING_RATE + JSONB_EMPTY_RATE:
+            record[column] = {}
+        else:
+            record[column] = {
+                key: _jsonb_value(rnd, column, key, kind)
+                for key, kind in keys.items() if rnd.random() >= KEY_MISSING_RATE
+            }
+    return record
+
+
+def generate_records(count, seed=0, region_ids=("region-1",)):
+    """
+    Generate `count` synthetic patient_health_records rows.
+
+    JSONB columns follow health_records.JSONB_SCHEMA with keys occasionally
+    omitted or null, vitals follow plausible distributions with per-column
+    missing rates, and blood pressure arrives as (sometimes malformed) strings.
+    The same seed always yields the same records.
+    """
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    return [
+        generate_record(rnd, region_ids[i % len(region_ids)], start + timedelta(minutes=i))
+        for i in range(count)
+    ]
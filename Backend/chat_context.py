@@ -0,0 +1,127 @@
+import os
+import hashlib
+import logging
+from analysis_cache import analysis_cache
+from context_encoder import count_tokens
+from llm_gateway import llm_gateway, slot_model
+
+# Most recent messages always sent verbatim
+CHAT_KEEP_MESSAGES = int(os.getenv("CHAT_CONTEXT_KEEP_MESSAGES", "6"))
+# Older messages are folded into the summary this many at a time
+CHAT_FOLD_CHUNK = int(os.getenv("CHAT_CONTEXT_FOLD_CHUNK", "6"))
+# Hard limit for the whole context section (summary + recent messages)
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+CHAT_SUMMARY_MODEL = slot_model("chat_summary", "llama-3.1-8b-instant")
+CHAT_SUMMARY_TTL = float(os.getenv("CHAT_SUMMARY_TTL", str(24 * 3600)))
+# Characters of a single message passed to the summarizer
+MESSAGE_CHAR_LIMIT = 1000
+
+NO_CONTEXT = "No previous context."
+
+
+def _message_line(message):
+    return f"{message.get('sender', 'unknown')}: {str(message.get('text', ''))}"
+
+
+def _prefix_digests(conversation, boundaries, session_id=None):
+    """Digest of conversation[:n] for each n in boundaries, in one pass over the messages"""
+    digest = hashlib.sha256((session_id or "").encode("utf-8"))
+    wanted = set(boundaries)
+    digests = {0: digest.hexdigest()} if 0 in wanted else {}
+    for i, message in enumerate(conversation[:max(boundaries, default=0)], start=1):
+        digest.update(_message_line(message).encode("utf-8"))
+        digest.update(b"\x00")
+        if i in wanted:
+            digests[i] = digest.hexdigest()
+    return digests
+
+
+def _summary_key(digest):
+    return f"chat_summary:{digest}"
+
+
+def summarize_messages(previous_summary, messages):
+    """Fold `messages` into `previous_summary` with a small model; None on failure"""
+    lines = "\n".join(_message_line(message)[:MESSAGE_CHAR_LIMIT] for message in messages)
+    content = f"""Update the running summary of a medical consultation.
+Keep symptoms, durations, medications, allergies, test results, diagnoses discussed
+and open questions. Be concise and factual; do not add advice.
+
+Current summary:
+{previous_summary or "(none)"}
+
+New messages:
+{lines}
+
+Respond only with the updated summary."""
+    try:
+        return llm_gateway.complete(
+            [{"role": "user", "content": content}],
+            model=CHAT_SUMMARY_MODEL, temperature=0.2, max_tokens=CHAT_SUMMARY_TOKENS
+        ).strip()
+    except Exception as e:
+        logging.error(f"Error summarizing conversation: {str(e)}")
+        return None
+
+
+def conversation_summary(conversation, fold_to, session_id=None):
+    """
+    Summary of conversation[:fold_to]. Summaries are cached under a digest of
+    the exact messages they cover, so each turn only folds in the messages
+    since the latest cached boundary; earlier boundaries are found by walking
+    back in CHAT_FOLD_CHUNK steps. Returns (summary, messages_covered).
+    """
+    boundaries = list(range(fold_to, 0, -CHAT_FOLD_CHUNK))
+    digests = _prefix_digests(conversation, boundaries, session_id)
+    previous, covered = None, 0
+    for boundary in boundaries:
+        cached = analysis_cache.get(_summary_key(digests[boundary]))
+        if cached is not None:
+            previous, covered = cached, boundary
+            break
+    if covered == fold_to:
+        return previous, covered
+
+    summary = summarize_messages(previous, conversation[covered:fold_to])
+    if summary is None:
+        return previous, covered
+    analysis_cache.set(_summary_key(digests[fold_to]), summary, ttl=CHAT_SUMMARY_TTL)
+    logging.info(f"Folded messages {covered + 1}-{fold_to} into the conversation summary")
+    return summary, fold_to
+
+
+def _fit_to_budget(summary_line, lines, token_budget):
+    """Drop the oldest verbatim lines, then shorten the oldest remaining one, until within budget"""
+    header = [summary_line] if summary_line else []
+    omitted = 0
+    while lines and count_tokens("\n".join(header + lines)) > token_budget:
+        if len(lines) == 1:
+            line = lines[0]
+            keep = max(0, len(line) * token_budget // max(1, count_tokens("\n".join(header + lines))) - 20)
+            lines = [line[:keep] + " [truncated]"] if keep else []
+            break
+        lines = lines[1:]
+        omitted += 1
+    if omitted:
+        header.append(f"[{omitted} earlier messages omitted]")
+    return "\n".join(header + lines)
+
+
+def build_chat_context(conversation, session_id=None, token_budget=CHAT_CONTEXT_TOKENS):
+    """
+    Context section for the chat prompt: the last CHAT_KEEP_MESSAGES messages
+    verbatim, older ones as a rolling summary, within `token_budget` tokens.
+    Folding happens in whole chunks, so at most one summarizer call (over one
+    chunk plus the previous summary) is made per turn.
+    """
+    if not conversation:
+        return NO_CONTEXT
+    excess = len(conversation) - CHAT_KEEP_MESSAGES
+    fold_to = (excess // CHAT_FOLD_CHUNK) * CHAT_FOLD_CHUNK if excess > 0 else 0
+
+    summary, covered = conversation_summary(conversation, fold_to, session_id) if fold_to else (None, 0)
+    summary_line = f"Summary of earlier conversation: {summary}" if summary else None
+    # Messages the summary does not cover (e.g. the summarizer failed) stay verbatim
+    lines = [_message_line(message) for message in conversation[covered:]]
+    return _fit_to_budget(summary_line, lines, token_budget)
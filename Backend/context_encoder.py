@@ -0,0 +1,164 @@
+import os
+import math
+import logging
+import threading
+import tiktoken
+from rate_limiter import estimate_tokens
+
+# Token budget for the data section of each analysis prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("ANALYSIS_CONTEXT_TOKENS", "3000"))
+# Most significant correlation pairs to include, and the smallest |r| worth sending
+CONTEXT_TOP_CORRELATIONS = int(os.getenv("ANALYSIS_CONTEXT_TOP_CORRELATIONS", "20"))
+CONTEXT_MIN_CORRELATION = float(os.getenv("ANALYSIS_CONTEXT_MIN_CORRELATION", "0.1"))
+# cl100k_base is a close stand-in for the Groq-hosted models' tokenizers
+CONTEXT_ENCODING = os.getenv("ANALYSIS_CONTEXT_ENCODING", "cl100k_base")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.get_encoding(CONTEXT_ENCODING)
+            except Exception as e:
+                logging.warning(f"Could not load tiktoken encoding {CONTEXT_ENCODING}, estimating tokens: {str(e)}")
+                _encoding = False
+        return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return estimate_tokens(text)
+
+
+def _fmt(value):
+    """Short number formatting for tables"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def constant_columns(statistics):
+    """Columns whose summary shows a single value"""
+    return {column for column, stats in statistics.items()
+            if stats.get("min") is not None and stats.get("min") == stats.get("max")}
+
+
+def statistics_lines(statistics, skip=()):
+    keys = ["mean", "median", "std", "min", "max"]
+    lines = ["feature|" + "|".join(keys)]
+    for column, stats in statistics.items():
+        if column not in skip:
+            lines.append(f"{column}|" + "|".join(_fmt(stats.get(key)) for key in keys))
+    return lines
+
+
+def correlation_lines(correlations, skip=(), top_k=CONTEXT_TOP_CORRELATIONS, min_abs=CONTEXT_MIN_CORRELATION):
+    """Strongest distinct correlation pairs, ordered by |r|"""
+    pairs = []
+    for a, row in correlations.items():
+        if a in skip:
+            continue
+        for b, r in row.items():
+            if a < b and b not in skip and r is not None and not math.isnan(r) and abs(r) >= min_abs:
+                pairs.append((abs(r), a, b, r))
+    pairs.sort(reverse=True)
+    return [f"{a}~{b}|{r:+.2f}" for _, a, b, r in pairs[:top_k]]
+
+
+def risk_score_lines(risk_scores):
+    keys = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+    lines = ["score|" + "|".join(keys)]
+    for name, stats in risk_scores.items():
+        lines.append(f"{name}|" + "|".join(_fmt(stats.get(key)) for key in keys))
+    return lines
+
+
+def outlier_lines(data_quality, skip=()):
+    """Columns with outliers only, most affected first"""
+    outliers = [(summary["outlier_percentage"], column, summary)
+                for column, summary in data_quality.get("outliers", {}).items()
+                if column not in skip and summary.get("outlier_count")]
+    outliers.sort(reverse=True)
+    return [f"{column}|{summary['outlier_count']}/{summary['total_count']}|{pct}%"
+            for pct, column, summary in outliers]
+
+
+def _render(sections):
+    parts = []
+    for title, note, lines, omitted in sections:
+        if not lines:
+            if omitted:
+                parts.append(f"{title}: {omitted} omitted")
+            continue
+        # The feature list is a single comma-separated line
+        body = (", " if title == "FEATURES" else "\n").join(lines)
+        if omitted:
+            body += f"\n({omitted} more omitted)"
+        parts.append(f"{title}{note}:\n{body}")
+    return "Region Health Analysis Data Package:\n\n" + "\n\n".join(parts) + "\n"
+
+
+def encode_data_package(data_package, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Compact, token-budgeted text encoding of a data package.
+
+    Statistics and risk scores are pipe-separated tables, constant columns are
+    dropped, only the strongest correlation pairs are listed and only columns
+    with outliers are reported. If the result is still over `token_budget`,
+    rows are dropped from the end of the least important sections first
+    (outliers, correlations, the feature list, then statistics).
+    """
+    statistics = data_package.get("statistics") or {}
+    constant = constant_columns(statistics)
+    features = [column for column in data_package.get("features", []) if column not in constant]
+
+    sections = [
+        # [title, note, lines, omitted]; header rows are kept when trimming
+        ["FEATURES", "", features, 0],
+        ["STATISTICS", "", statistics_lines(statistics, constant) if statistics else [], 0],
+        ["RISK SCORES", "", risk_score_lines(data_package["risk_scores"]) if data_package.get("risk_scores") else [], 0],
+        ["STRONGEST CORRELATIONS", " (pair|r)", correlation_lines(data_package.get("correlations") or {}, constant), 0],
+        ["OUTLIERS", " (column|count/total|share)", outlier_lines(data_package.get("data_quality") or {}, constant), 0],
+    ]
+    if constant:
+        sections.append(["CONSTANT COLUMNS", "", [", ".join(sorted(constant))], 0])
+
+    text = _render(sections)
+    tokens = count_tokens(text)
+    # Trim order: (section index, rows that must stay)
+    trim_order = [(4, 0), (5, 0), (3, 0), (0, 0), (1, 1)]
+    trimmed = True
+    # Per-line counts are estimates of the saving, so repeat until the exact count fits
+    while tokens > token_budget and trimmed:
+        trimmed = False
+        for index, keep in trim_order:
+            if tokens <= token_budget:
+                break
+            if index >= len(sections):
+                continue
+            section = sections[index]
+            lines = section[2]
+            line_tokens = [count_tokens(line) + 1 for line in lines]
+            excess = tokens - token_budget
+            drop = 0
+            while drop < len(lines) - keep and excess > 0:
+                drop += 1
+                excess -= line_tokens[-drop]
+            if drop:
+                section[2] = lines[:len(lines) - drop]
+                section[3] += drop
+                text = _render(sections)
+                tokens = count_tokens(text)
+                trimmed = True
+
+    if tokens > token_budget:
+        logging.warning(f"Analysis context is {tokens} tokens, over the {token_budget} token budget")
+    return text
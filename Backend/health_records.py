@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+
+# Declared keys of each JSONB column (as written by the health report form) and their value kind
+JSONB_SCHEMA = {
+    "general_health": {
+        "main_complaint": "text",
+        "symptom_duration": "text",
+        "previous_symptoms": "bool"
+    },
+    "pain_discomfort": {
+        "pain_location": "text",
+        "pain_level": "number",
+        "pain_triggers": "text"
+    },
+    "digestion_appetite": {
+        "stomach_pain": "bool",
+        "nausea": "bool",
+        "appetite_changes": "bool",
+        "weight_loss": "bool",
+        "diarrhea": "text",
+        "constipation": "text"
+    },
+    "chronic_conditions": {
+        "high_blood_pressure": "bool",
+        "diabetes": "bool",
+        "heart_disease": "bool",
+        "current_medications": "text",
+        "known_allergies": "text"
+    },
+    "lifestyle_habits": {
+        "meal_frequency": "text",
+        "diet": "text",
+        "smoking": "bool",
+        "alcohol_consumption": "bool",
+        "tobacco_chewing": "bool",
+        "physical_activity": "text"
+    },
+    "womens_health": {
+        "last_menstrual_period": "text",
+        "pregnancy_concerns": "bool",
+        "breastfeeding_concerns": "bool"
+    },
+    "family_community_health": {
+        "family_symptoms": "bool",
+        "recent_outbreaks": "bool",
+        "community_illnesses": "bool"
+    },
+    "mental_health": {
+        "emotional_state": "text",
+        "sleep_quality": "bool",
+        "stressful_events": "text",
+        "sleep_duration": "text"
+    },
+    "heart_health": {
+        "lvh": "bool",
+        "ihd": "bool",
+        "cvd": "bool",
+        "retinopathy": "bool",
+        "chest_pain_type": "text",
+        "resting_bp": "number",
+        "cholesterol": "number",
+        "fasting_bs": "bool",
+        "resting_ecg": "text",
+        "max_hr": "number",
+        "exercise_angina": "bool",
+        "oldpeak": "number",
+        "st_slope": "text"
+    }
+}
+
+JSONB_COLUMNS = list(JSONB_SCHEMA)
+
+# Plain (non-JSONB) columns with a known kind
+SCALAR_SCHEMA = {
+    "heart_rate": "number",
+    "respiratory_rate": "number",
+    "body_temperature": "number",
+    "weight": "number",
+    "height": "number",
+    "bmi": "number",
+    "blood_glucose": "number",
+    "oxygen_saturation": "number",
+    "pain_level": "number",
+    "gender": "text"
+}
+
+_NUMBER, _BOOL, _TEXT, _ANY = range(4)
+_KIND_CODES = {"number": _NUMBER, "bool": _BOOL, "text": _TEXT}
+
+
+def _new_slot(kind, size):
+    """Preallocated storage for one output column: [kind, values, seen]"""
+    if kind == _NUMBER:
+        values = np.full(size, np.nan, dtype=np.float64)
+    else:
+        # NaN for rows without the key, as json_normalize leaves them
+        values = np.full(size, np.nan, dtype=object)
+    return [kind, values, False]
+
+
+def _set(slot, row, value):
+    slot[2] = True
+    if slot[0] == _NUMBER:
+        if value is not None:
+            try:
+                slot[1][row] = value
+            except (TypeError, ValueError):
+                pass
+    else:
+        # Stored as given (an explicit None included), so dtypes infer as with json_normalize
+        slot[1][row] = value
+
+
+def _finalise(slot):
+    kind, values, _ = slot
+    if kind == _NUMBER:
+        return values
+    # Same dtype inference as json_normalize: bool, str, float64 or object with None/NaN kept
+    return pd.Series(values.tolist())
+
+
+def _parse_blood_pressure(value):
+    """Split a 'systolic/diastolic' string into two floats (NaN when unparseable)"""
+    if not isinstance(value, str):
+        return np.nan, np.nan
+    parts = value.split("/")
+    values = []
+    for part in parts[:2]:
+        try:
+            values.append(float(part))
+        except ValueError:
+            values.append(np.nan)
+    while len(values) < 2:
+        values.append(np.nan)
+    return values[0], values[1]
+
+
+def flatten_records(records):
+    """
+    Flatten health records into a DataFrame in a single pass.
+
+    JSONB columns become `<column>_<key>` columns (nested dicts use dotted keys,
+    as pd.json_normalize does) and blood_pressure becomes systolic_bp/diastolic_bp.
+    Declared keys are written straight into preallocated NumPy arrays; keys not
+    in the schema are kept as generic columns. Columns no record contains are
+    omitted. Values and dtypes match the json_normalize flattening: missing keys
+    are NaN and explicit nulls and string answers are kept as sent.
+    """
+    if isinstance(records, pd.DataFrame):
+        records = records.to_dict("records")
+    size = len(records)
+
+    columns = {}
+    scalar_slots = {}
+    jsonb_slots = {}
+    for name, kind in SCALAR_SCHEMA.items():
+        scalar_slots[name] = columns[name] = _new_slot(_KIND_CODES[kind], size)
+    for jsonb_column, keys in JSONB_SCHEMA.items():
+        slots = jsonb_slots[jsonb_column] = {}
+        for key, kind in keys.items():
+            slots[key] = columns[f"{jsonb_column}_{key}"] = _new_slot(_KIND_CODES[kind], size)
+    systolic = np.full(size, np.nan, dtype=np.float64)
+    diastolic = np.full(size, np.nan, dtype=np.float64)
+    has_blood_pressure = False
+    extra = {}
+
+    def set_extra(name, row, value):
+        if isinstance(value, dict) and value:
+            for key, item in value.items():
+                set_extra(f"{name}.{key}", row, item)
+            return
+        slot = extra.get(name)
+        if slot is None:
+            slot = extra[name] = _new_slot(_ANY, size)
+        _set(slot, row, value)
+
+    # Hot loop: the common cases are inlined rather than dispatched through _set
+    jsonb_get = jsonb_slots.get
+    scalar_get = scalar_slots.get
+    for row, record in enumerate(records):
+        for name, value in record.items():
+            slots = jsonb_get(name)
+            if slots is not None:
+                if value.__class__ is not dict:
+                    continue
+                slots_get = slots.get
+                for key, item in value.items():
+                    slot = slots_get(key)
+                    if slot is None:
+                        set_extra(f"{name}_{key}", row, item)
+                        continue
+                    slot[2] = True
+                    if slot[0] != _NUMBER:
+                        slot[1][row] = item
+                    elif item is not None:
+                        try:
+                            slot[1][row] = item
+                        except (TypeError, ValueError):
+                            pass
+                continue
+            slot = scalar_get(name)
+            if slot is not None:
+                _set(slot, row, value)
+            elif name == "blood_pressure":
+                has_blood_pressure = True
+                systolic[row], diastolic[row] = _parse_blood_pressure(value)
+            else:
+                set_extra(name, row, value)
+
+    data = {}
+    for name, slot in list(columns.items()) + list(extra.items()):
+        if slot[2]:
+            data[name] = _finalise(slot)
+    if has_blood_pressure:
+        data["systolic_bp"] = systolic
+        data["diastolic_bp"] = diastolic
+    return pd.DataFrame(data, index=pd.RangeIndex(size))
+
+
+def is_unflattened(df):
+    """True if a DataFrame still holds raw JSONB or blood_pressure columns"""
+    return "blood_pressure" in df.columns or any(column in df.columns for column in JSONB_COLUMNS)
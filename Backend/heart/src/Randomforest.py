@@ -1,42 +1,30 @@
-import pandas as pd
-import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 from utils import save_model
+from feature_encoder import HeartFeatureEncoder, load_records, train_test_rows
 
 def load_data(filepath):
-    data = pd.read_csv(filepath)
-    return data
+    return load_records(filepath)
 
-def preprocess_data(data):
-    # Convert categorical variables to numerical
-    data['Sex'] = data['Sex'].map({'M': 1, 'F': 0})
-    data['ChestPainType'] = data['ChestPainType'].map({'ATA': 0, 'NAP': 1, 'ASY': 2, 'TA': 3})
-    data['RestingECG'] = data['RestingECG'].map({'Normal': 0, 'ST': 1, 'LVH': 2})
-    data['ExerciseAngina'] = data['ExerciseAngina'].map({'N': 0, 'Y': 1})
-    data['ST_Slope'] = data['ST_Slope'].map({'Up': 0, 'Flat': 1, 'Down': 2})
-    
-    X = data.drop('HeartDisease', axis=1)
-    y = data['HeartDisease']
-    return X, y
+def preprocess_data(records):
+    # Encoded float32 features and target, from the shared feature encoder
+    return HeartFeatureEncoder.from_schema().transform_target(records)
 
-def train_random_forest(X_train, y_train):
+def train_random_forest(X_train, y_train, n_jobs=None):
     rf_model = RandomForestClassifier(
         n_estimators=100,
         max_depth=10,
-        random_state=42
+        random_state=42,
+        n_jobs=n_jobs
     )
     rf_model.fit(X_train, y_train)
     return rf_model
 
 if __name__ == "__main__":
-    # Load and preprocess data
-    data = load_data('../data/heart.csv')
-    X, y = preprocess_data(data)
-    
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Load, split and encode data
+    train, test = train_test_rows(load_data('../data/heart.csv'))
+    X_train, y_train = preprocess_data(train)
+    X_test, y_test = preprocess_data(test)
     
     # Train model
     rf_model = train_random_forest(X_train, y_train)
@@ -1,10 +1,9 @@
 import numpy as np
-import pandas as pd
 from tensorflow.keras.models import load_model
 from tensorflow.keras.layers import InputLayer as KInputLayer
 from utils import load_model as load_pkl_model
-from utils import preprocess_data
 from model_wrapper import KerasClassifierWrapper
+from feature_encoder import HeartFeatureEncoder, load_records, train_test_rows, ENCODER_FILENAME
 
 def custom_input_layer(*args, **kwargs):
     # Remove the unknown 'batch_shape' argument, if present
@@ -22,11 +21,7 @@ def custom_input_layer(*args, **kwargs):
     return KInputLayer(*args, **kwargs)
 
 def load_data(filepath):
-    data = pd.read_csv(filepath)
-    data = preprocess_data(data) 
-    X = data.drop('HeartDisease', axis=1)
-    y = data['HeartDisease']
-    return X, y
+    return load_records(filepath)
 
 def ensemble_predict_manual(X_test):
     try:
@@ -47,11 +42,11 @@ def ensemble_predict_manual(X_test):
         xgb_model = load_pkl_model('saved_models/xgboost_model.pkl')
         rf_model = load_pkl_model('saved_models/randomforest_model.pkl')
         
-        # Prepare data
-        X_test_np = X_test.to_numpy().astype('float32')
+        # The ANN was trained on standardised features
+        encoder = HeartFeatureEncoder.load(f'saved_models/{ENCODER_FILENAME}')
         
         # Get predictions
-        ann_proba = ann_wrapper.predict_proba(X_test_np)
+        ann_proba = ann_wrapper.predict_proba(encoder.scale(X_test))
         xgb_proba = xgb_model.predict_proba(X_test)
         rf_proba = rf_model.predict_proba(X_test)
         
@@ -67,9 +62,8 @@ def ensemble_predict_manual(X_test):
 
 if __name__ == "__main__":
     # Example usage
-    X, y = load_data('../data/heart.csv')
-    from sklearn.model_selection import train_test_split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    _, test = train_test_rows(load_data('../data/heart.csv'))
+    X_test, y_test = HeartFeatureEncoder.from_schema().transform_target(test)
     
     # When saving the ANN model in model_ann.py
     
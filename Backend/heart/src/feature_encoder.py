@@ -0,0 +1,197 @@
+import csv
+import json
+import math
+import numpy as np
+
+ENCODER_FILENAME = "heart_encoder.json"
+
+# Declared schema of the heart dataset: feature order, categorical codes and
+# the other spellings users type for them ("male", "ata", "yes", "up")
+SCHEMA = {
+    "columns": [
+        "Age", "Sex", "ChestPainType", "RestingBP", "Cholesterol",
+        "FastingBS", "RestingECG", "MaxHR", "ExerciseAngina", "Oldpeak", "ST_Slope"
+    ],
+    "categorical": {
+        "Sex": {"M": 1, "F": 0},
+        "ChestPainType": {"ATA": 0, "NAP": 1, "ASY": 2, "TA": 3},
+        "RestingECG": {"Normal": 0, "ST": 1, "LVH": 2},
+        "ExerciseAngina": {"N": 0, "Y": 1},
+        "ST_Slope": {"Up": 0, "Flat": 1, "Down": 2}
+    },
+    "aliases": {
+        "Sex": {"male": "M", "female": "F"},
+        "RestingECG": {"stt": "ST"},
+        "ExerciseAngina": {"yes": "Y", "no": "N"}
+    },
+    "target": "HeartDisease"
+}
+
+
+class HeartFeatureEncoder:
+    """
+    Turns raw heart records into the float32 matrix the models take, straight
+    from dicts, value lists, comma-separated strings or CSV rows, one lookup
+    table per column. Also holds the standard scaler the ANN is trained with.
+    Saved as JSON next to the models, so training and serving share it.
+    """
+
+    def __init__(self, columns, categorical, aliases=None, target=None, scaler_mean=None, scaler_scale=None):
+        self.columns = list(columns)
+        self.categorical = categorical
+        self.aliases = aliases or {}
+        self.target = target
+        self.scaler_mean = None if scaler_mean is None else np.asarray(scaler_mean, dtype=np.float32)
+        self.scaler_scale = None if scaler_scale is None else np.asarray(scaler_scale, dtype=np.float32)
+        # Case-insensitive value -> code table per categorical column; None for numeric columns
+        self._lookups = []
+        for column in self.columns:
+            if column not in categorical:
+                self._lookups.append(None)
+                continue
+            table = {str(value).lower(): float(code) for value, code in categorical[column].items()}
+            for alias, value in self.aliases.get(column, {}).items():
+                table[alias.lower()] = float(categorical[column][value])
+            self._lookups.append(table)
+
+    @classmethod
+    def from_schema(cls, schema=SCHEMA):
+        return cls(schema["columns"], schema["categorical"], schema.get("aliases"), schema.get("target"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def to_dict(self):
+        return {
+            "columns": self.columns,
+            "categorical": self.categorical,
+            "aliases": self.aliases,
+            "target": self.target,
+            "scaler_mean": None if self.scaler_mean is None else self.scaler_mean.tolist(),
+            "scaler_scale": None if self.scaler_scale is None else self.scaler_scale.tolist()
+        }
+
+    def _encode_values(self, values, out):
+        """Encode one row of raw values (in column order) into `out`; returns an error message or None"""
+        missing, unknown = [], []
+        for i, (value, lookup) in enumerate(zip(values, self._lookups)):
+            text = "" if value is None else str(value).strip()
+            if not text or (isinstance(value, float) and math.isnan(value)):
+                missing.append(self.columns[i])
+                continue
+            if lookup is None:
+                try:
+                    out[i] = float(text)
+                    continue
+                except ValueError:
+                    pass
+            elif text.lower() in lookup:
+                out[i] = lookup[text.lower()]
+                continue
+            unknown.append(self.columns[i])
+        if not missing and not unknown:
+            return None
+        return "; ".join(filter(None, [
+            f"Missing values for: {', '.join(missing)}" if missing else "",
+            f"Unrecognised values for: {', '.join(unknown)}" if unknown else ""
+        ]))
+
+    def _values(self, record):
+        if isinstance(record, str):
+            record = record.split(",")
+        if isinstance(record, dict):
+            return [record.get(column) for column in self.columns]
+        if isinstance(record, (list, tuple)):
+            if len(record) != len(self.columns):
+                raise ValueError(f"Expected {len(self.columns)} values, but got {len(record)}")
+            return record
+        raise ValueError("Record must be an object, a list or a comma-separated string")
+
+    def transform(self, records):
+        """
+        Encode a record or a list of records into a (rows, features) float32
+        matrix. Returns (matrix, {row: error message}); rows with errors are
+        left as NaN, so the caller decides whether to drop or reject them.
+        """
+        if isinstance(records, (dict, str)):
+            records = [records]
+        matrix = np.full((len(records), len(self.columns)), np.nan, dtype=np.float32)
+        errors = {}
+        for row, record in enumerate(records):
+            try:
+                error = self._encode_values(self._values(record), matrix[row])
+            except ValueError as e:
+                error = str(e)
+            if error:
+                matrix[row] = np.nan
+                errors[row] = error
+        return matrix, errors
+
+    def transform_target(self, records):
+        """Encoded features and the target column, for training on rows that encode cleanly"""
+        matrix, errors = self.transform(records)
+        valid = [row for row in range(len(records)) if row not in errors]
+        target = np.array([float(records[row][self.target]) for row in valid], dtype=np.float32)
+        return matrix[valid], target
+
+    def iter_csv(self, lines, chunk_rows=5000):
+        """
+        Encode an open CSV file (with a header row naming the features) in
+        chunks of chunk_rows. Yields (first row number, matrix, {row: error}).
+        """
+        reader = csv.reader(lines, skipinitialspace=True)
+        header = [name.strip() for name in next(reader, [])]
+        positions = [header.index(column) if column in header else None for column in self.columns]
+        chunk, offset = [], 0
+        for values in reader:
+            if not values:
+                continue
+            chunk.append([values[i] if i is not None and i < len(values) else None for i in positions])
+            if len(chunk) == chunk_rows:
+                yield (offset,) + self.transform(chunk)
+                offset += len(chunk)
+                chunk = []
+        if chunk:
+            yield (offset,) + self.transform(chunk)
+
+    def fit_scaler(self, matrix):
+        """Standard scaler parameters (as sklearn's StandardScaler) from training rows"""
+        matrix = matrix.astype(np.float64)
+        self.scaler_mean = matrix.mean(axis=0).astype(np.float32)
+        scale = matrix.std(axis=0)
+        self.scaler_scale = np.where(scale == 0, 1.0, scale).astype(np.float32)
+        return self
+
+    def scale(self, matrix):
+        """Standardised matrix for the ANN; unchanged if no scaler has been fitted"""
+        if self.scaler_mean is None:
+            return matrix
+        return ((matrix - self.scaler_mean) / self.scaler_scale).astype(np.float32)
+
+
+def load_records(filepath):
+    """Rows of a CSV file as dicts"""
+    with open(filepath, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def train_test_rows(records, test_size=0.2, random_state=42):
+    """The train/test split the heart models are trained and evaluated on"""
+    from sklearn.model_selection import train_test_split
+    return train_test_split(records, test_size=test_size, random_state=random_state)
+
+
+if __name__ == "__main__":
+    # Rebuild the encoder, with the scaler fitted on the ANN's training split
+    train, _ = train_test_rows(load_records('../data/heart.csv'))
+    encoder = HeartFeatureEncoder.from_schema()
+    X_train, _ = encoder.transform_target(train)
+    encoder.fit_scaler(X_train)
+    encoder.save(f'saved_models/{ENCODER_FILENAME}')
+    print(f"Feature encoder saved as 'saved_models/{ENCODER_FILENAME}'")
@@ -0,0 +1,246 @@
+"""
+Train the whole heart ensemble in one run:
+
+    python train_all.py [--members ann xgboost random_forest] [--epochs 100]
+
+The dataset is read, split and encoded once and saved as .npy arrays, which
+every trainer memory-maps instead of re-reading the CSV. The random forest,
+XGBoost and the ANN then train concurrently, one process each, with the
+machine's cores divided between them. Each run is staged and published as
+its own directory, saved_models/runs/<timestamp>/, with manifest.json
+(checksums, accuracy, timings), and saved_models/current names the run being
+served. Training a subset of the members carries the other members' artifacts
+and manifest entries over from the current run.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+from feature_encoder import HeartFeatureEncoder, load_records, train_test_rows, ENCODER_FILENAME
+
+DATA_PATH = '../data/heart.csv'
+OUTPUT_DIR = 'saved_models'
+MANIFEST_FILENAME = 'manifest.json'
+RUNS_DIR = 'runs'
+# Holds the name of the run under RUNS_DIR that heart_registry.py serves
+CURRENT_POINTER = 'current'
+# Published runs kept on disk, including the current one
+KEEP_RUNS = 3
+ARTIFACTS = {
+    "ann": "ann_model.h5",
+    "xgboost": "xgboost_model.pkl",
+    "random_forest": "randomforest_model.pkl"
+}
+ARRAYS = ("X_train", "y_train", "X_test", "y_test")
+# Native thread pools read these when they start, so workers inherit them from the environment
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def prepare_arrays(staging_dir, data_path=DATA_PATH):
+    """Encode and split the dataset once; saves the arrays and the fitted encoder into staging_dir"""
+    encoder = HeartFeatureEncoder.from_schema()
+    train, test = train_test_rows(load_records(data_path))
+    X_train, y_train = encoder.transform_target(train)
+    X_test, y_test = encoder.transform_target(test)
+    encoder.fit_scaler(X_train)
+    encoder.save(os.path.join(staging_dir, ENCODER_FILENAME))
+    arrays = {"X_train": X_train, "y_train": y_train, "X_test": X_test, "y_test": y_test}
+    for name, array in arrays.items():
+        np.save(os.path.join(staging_dir, f"{name}.npy"), np.ascontiguousarray(array))
+    return {"rows_train": len(X_train), "rows_test": len(X_test)}
+
+
+def _load_arrays(staging_dir):
+    return [np.load(os.path.join(staging_dir, f"{name}.npy"), mmap_mode="r") for name in ARRAYS]
+
+
+def train_member(name, staging_dir, threads, epochs):
+    """Train one member in a worker process; saves its artifact into staging_dir and returns its metrics"""
+    start = time.perf_counter()
+    X_train, y_train, X_test, y_test = _load_arrays(staging_dir)
+    path = os.path.join(staging_dir, ARTIFACTS[name])
+
+    if name == "ann":
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+        from model_ann import train_ann
+        encoder = HeartFeatureEncoder.load(os.path.join(staging_dir, ENCODER_FILENAME))
+        model, accuracy = train_ann(encoder.scale(X_train), np.asarray(y_train),
+                                    encoder.scale(X_test), np.asarray(y_test), epochs=epochs, verbose=0)
+        model.save(path)
+    else:
+        from sklearn.metrics import accuracy_score
+        from utils import save_model
+        if name == "xgboost":
+            from model_xgboost import train_xgboost
+            model = train_xgboost(X_train, y_train, n_jobs=threads)
+        else:
+            from Randomforest import train_random_forest
+            model = train_random_forest(X_train, y_train, n_jobs=threads)
+        accuracy = accuracy_score(y_test, model.predict(X_test))
+        save_model(model, path)
+
+    return {"accuracy": round(float(accuracy), 4), "train_seconds": round(time.perf_counter() - start, 2),
+            "threads": threads}
+
+
+def current_run_dir(output_dir):
+    """The run directory `current` points to, or output_dir itself for models saved before runs existed"""
+    try:
+        with open(os.path.join(output_dir, CURRENT_POINTER)) as f:
+            run_name = f.read().strip()
+    except OSError:
+        return output_dir
+    return os.path.join(output_dir, RUNS_DIR, run_name) if run_name else output_dir
+
+
+def _carry_over(previous_dir, staging_dir, filename):
+    """Hard-link (or copy, across filesystems) a file of the previous run into the new one"""
+    source, target = os.path.join(previous_dir, filename), os.path.join(staging_dir, filename)
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _merge_manifest(previous_dir, manifest):
+    """Add the entries of members not trained in this run from the previous run's manifest, if their files remain"""
+    try:
+        with open(os.path.join(previous_dir, MANIFEST_FILENAME)) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return manifest
+    kept = {name: entry for name, entry in previous.get("artifacts", {}).items()
+            if name not in manifest["artifacts"] and os.path.exists(os.path.join(previous_dir, entry["file"]))}
+    return {**manifest, "artifacts": {**kept, **manifest["artifacts"]}}
+
+
+def _publish(staging_dir, output_dir, run_name, manifest):
+    """
+    Turn the staging directory into runs/<run_name> and point `current` at
+    it. The pointer is replaced with a single atomic rename, so readers see
+    either the previous run or this one in full; a crash before that leaves
+    the previous run current and an unreferenced run directory behind.
+    """
+    for name in ARRAYS:
+        os.remove(os.path.join(staging_dir, f"{name}.npy"))
+    with open(os.path.join(staging_dir, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.chmod(staging_dir, 0o755)  # mkdtemp creates it readable by its owner only
+    os.rename(staging_dir, os.path.join(output_dir, RUNS_DIR, run_name))
+    pointer_tmp = os.path.join(output_dir, f".{CURRENT_POINTER}.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(run_name)
+    os.replace(pointer_tmp, os.path.join(output_dir, CURRENT_POINTER))
+    _prune_runs(output_dir)
+
+
+def _prune_runs(output_dir, keep=KEEP_RUNS):
+    """Delete all but the newest `keep` runs; staging directories of runs in progress start with a dot"""
+    runs_dir = os.path.join(output_dir, RUNS_DIR)
+    runs = sorted(name for name in os.listdir(runs_dir) if not name.startswith("."))
+    for name in runs[:-keep]:
+        shutil.rmtree(os.path.join(runs_dir, name), ignore_errors=True)
+
+
+def train_all(members=tuple(ARTIFACTS), output_dir=OUTPUT_DIR, data_path=DATA_PATH, epochs=100, workers=None):
+    """
+    Train `members` concurrently and publish their artifacts, the encoder and
+    the manifest as a new run in output_dir. Nothing is published unless every
+    member trains; see _publish for how the run is switched in.
+    """
+    start = time.perf_counter()
+    workers = workers or len(members)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    previous_dir = current_run_dir(output_dir)
+    os.makedirs(os.path.join(output_dir, RUNS_DIR), exist_ok=True)
+    # Staged next to the published runs, so publishing is a rename
+    staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=os.path.join(output_dir, RUNS_DIR))
+    try:
+        dataset = prepare_arrays(staging_dir, data_path)
+        print(f"Encoded {dataset['rows_train']} training and {dataset['rows_test']} test rows "
+              f"in {time.perf_counter() - start:.2f}s; training {', '.join(members)} "
+              f"with {threads} threads each")
+
+        # spawn: each worker starts a fresh interpreter with the thread limits already in its
+        # environment, before numpy or TensorFlow load
+        saved_env = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+        os.environ.update({name: str(threads) for name in THREAD_ENV_VARS})
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {name: pool.submit(train_member, name, staging_dir, threads, epochs) for name in members}
+                results = {name: future.result() for name, future in futures.items()}
+        finally:
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+        if "ann" not in members and os.path.exists(os.path.join(previous_dir, ENCODER_FILENAME)):
+            # The kept ANN needs the scaler it was trained with; the tree models only use the schema
+            _carry_over(previous_dir, staging_dir, ENCODER_FILENAME)
+        now = datetime.now(timezone.utc)
+        run_name = now.strftime("%Y%m%dT%H%M%S%fZ")
+        trained_at = now.isoformat()
+        data_sha256 = sha256(data_path)
+        manifest = {
+            "run": run_name,
+            "trained_at": trained_at,
+            "data": {"path": os.path.abspath(data_path), "sha256": data_sha256, **dataset},
+            "artifacts": {
+                name: {"file": ARTIFACTS[name], "sha256": sha256(os.path.join(staging_dir, ARTIFACTS[name])),
+                       "trained_at": trained_at, "data_sha256": data_sha256, **results[name]}
+                for name in members
+            },
+            "encoder": {"file": ENCODER_FILENAME, "sha256": sha256(os.path.join(staging_dir, ENCODER_FILENAME))},
+            "total_seconds": round(time.perf_counter() - start, 2)
+        }
+        manifest = _merge_manifest(previous_dir, manifest)
+        for name, entry in manifest["artifacts"].items():
+            if name not in members:
+                _carry_over(previous_dir, staging_dir, entry["file"])
+        _publish(staging_dir, output_dir, run_name, manifest)
+        return manifest
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the heart ensemble members in parallel")
+    parser.add_argument("--members", nargs="+", default=list(ARTIFACTS), choices=list(ARTIFACTS))
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        manifest = train_all(args.members, args.output, args.data, args.epochs, args.workers)
+    except Exception as e:
+        print(f"Training failed, nothing was published: {e}")
+        sys.exit(1)
+    for name in args.members:
+        result = manifest["artifacts"][name]
+        print(f"{name}: accuracy {result['accuracy']:.4f} in {result['train_seconds']}s")
+    print(f"Artifacts and {MANIFEST_FILENAME} saved to '{os.path.join(args.output, RUNS_DIR, manifest['run'])}' "
+          f"in {manifest['total_seconds']}s")
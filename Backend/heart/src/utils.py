@@ -1,17 +1,19 @@
+if __package__:  # Imported as src.utils or heart.src.utils
+    from .feature_encoder import SCHEMA
+else:
+    from feature_encoder import SCHEMA
+
 def load_data(filepath):
     import pandas as pd
     return pd.read_csv(filepath)
 
 def preprocess_data(df):
     # Handle missing values, if any
-    df = df.dropna()
+    df = df.dropna().copy()
     
-    # Convert categorical variables to numerical
-    df['Sex'] = df['Sex'].map({'M': 1, 'F': 0})
-    df['ChestPainType'] = df['ChestPainType'].map({'ATA': 0, 'NAP': 1, 'ASY': 2, 'TA': 3})
-    df['RestingECG'] = df['RestingECG'].map({'Normal': 0, 'ST': 1, 'LVH': 2})
-    df['ExerciseAngina'] = df['ExerciseAngina'].map({'N': 0, 'Y': 1})
-    df['ST_Slope'] = df['ST_Slope'].map({'Up': 0, 'Flat': 1, 'Down': 2})
+    # Convert categorical variables to numerical, with the shared encoder's lookup tables
+    for column, codes in SCHEMA["categorical"].items():
+        df[column] = df[column].map(codes)
     
     return df
 
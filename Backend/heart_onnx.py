@@ -0,0 +1,198 @@
+"""
+Export the heart-disease ensemble to ONNX, so it can be served by onnxruntime
+without TensorFlow, XGBoost or scikit-learn in the serving process:
+
+    python heart_onnx.py export     # writes <member>.onnx next to each artifact of the current run and checks parity
+    python heart_onnx.py compare    # startup time and peak RSS, native vs ONNX
+
+The registry picks the ONNX files up automatically (HEART_MODEL_RUNTIME=auto).
+Export needs onnx, skl2onnx and onnxmltools, plus TensorFlow for the ANN.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+from heart.src.utils import load_model as load_pkl_model
+from heart.src.feature_encoder import HeartFeatureEncoder, load_records
+from heart_registry import (
+    ARTIFACTS, ONNX_ARTIFACTS, FEATURE_COLUMNS, HEART_MODEL_DIR, HEART_ENSEMBLE_MEMBERS,
+    OnnxHeartModel, _load_ann, current_model_dir
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARITY_DATA_PATH = os.path.join(BASE_DIR, "heart", "data", "heart.csv")
+# Largest probability difference accepted between a member and its export (float32 arithmetic)
+PARITY_TOLERANCE = 1e-4
+OPSET = 15
+
+# Keras activations with a single-node ONNX equivalent
+ACTIVATIONS = {"relu": "Relu", "sigmoid": "Sigmoid", "tanh": "Tanh"}
+
+
+def export_ann(wrapper, path):
+    """
+    Write the Keras dense network as an ONNX graph of Gemm + activation nodes
+    (dropout is a no-op at inference). The output is [1 - p, p] per row, like
+    KerasClassifierWrapper.predict_proba.
+    """
+    import onnx
+    from onnx import helper, numpy_helper, TensorProto
+
+    nodes, initializers = [], []
+    current = "input"
+    for i, layer in enumerate(wrapper.model.layers):
+        kind = type(layer).__name__
+        if kind in ("Dropout", "InputLayer"):
+            continue
+        if kind != "Dense":
+            raise ValueError(f"Unsupported layer for ONNX export: {kind}")
+        weights, bias = layer.get_weights()
+        initializers += [numpy_helper.from_array(weights.astype(np.float32), f"dense{i}_weights"),
+                         numpy_helper.from_array(bias.astype(np.float32), f"dense{i}_bias")]
+        nodes.append(helper.make_node("Gemm", [current, f"dense{i}_weights", f"dense{i}_bias"], [f"dense{i}"]))
+        current = f"dense{i}"
+        activation = layer.get_config()["activation"]
+        if activation in ACTIVATIONS:
+            nodes.append(helper.make_node(ACTIVATIONS[activation], [current], [f"{current}_{activation}"]))
+            current = f"{current}_{activation}"
+        elif activation != "linear":
+            raise ValueError(f"Unsupported activation for ONNX export: {activation}")
+
+    initializers.append(numpy_helper.from_array(np.array([1.0], dtype=np.float32), "one"))
+    nodes += [helper.make_node("Sub", ["one", current], ["negative"]),
+              helper.make_node("Concat", ["negative", current], ["probabilities"], axis=1)]
+    graph = helper.make_graph(
+        nodes, "heart_ann",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [None, len(FEATURE_COLUMNS)])],
+        [helper.make_tensor_value_info("probabilities", TensorProto.FLOAT, [None, 2])],
+        initializers
+    )
+    # IR version 8 matches opset 15 and loads on older onnxruntime releases
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", OPSET)], ir_version=8)
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+
+
+def export_xgboost(model, path):
+    from onnxmltools import convert_xgboost
+    from onnxmltools.convert.common.data_types import FloatTensorType
+
+    # The converter only understands f0, f1, ... feature names
+    booster = model.get_booster().copy()
+    booster.feature_names = None
+    clone = model.__class__(**model.get_params())
+    clone._Booster = booster
+    clone.n_classes_ = 2
+    onnx_model = convert_xgboost(clone, initial_types=[("input", FloatTensorType([None, len(FEATURE_COLUMNS)]))],
+                                 target_opset=OPSET)
+    _rename_probabilities(onnx_model)
+    with open(path, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+
+
+def export_random_forest(model, path):
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+
+    onnx_model = convert_sklearn(model, initial_types=[("input", FloatTensorType([None, len(FEATURE_COLUMNS)]))],
+                                 options={id(model): {"zipmap": False}}, target_opset=OPSET)
+    _rename_probabilities(onnx_model)
+    with open(path, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+
+
+def _rename_probabilities(onnx_model):
+    """Name the class-probability output "probabilities", as OnnxHeartModel expects"""
+    output = onnx_model.graph.output[-1]
+    if output.name == "probabilities":
+        return
+    for node in onnx_model.graph.node:
+        node.output[:] = ["probabilities" if name == output.name else name for name in node.output]
+    output.name = "probabilities"
+
+
+EXPORTERS = {"ann": export_ann, "xgboost": export_xgboost, "random_forest": export_random_forest}
+
+
+def load_native(name, model_dir=HEART_MODEL_DIR):
+    path = os.path.join(current_model_dir(model_dir), ARTIFACTS[name])
+    return _load_ann(path) if name == "ann" else load_pkl_model(path)
+
+
+def parity_features(path=PARITY_DATA_PATH):
+    return HeartFeatureEncoder.from_schema().transform_target(load_records(path))[0]
+
+
+def check_parity(native, exported, features):
+    """Largest absolute difference in heart disease probability over `features`"""
+    expected = np.asarray(native.predict_proba(features))[:, 1]
+    actual = exported.predict_proba(features)[:, 1]
+    return float(np.max(np.abs(expected - actual)))
+
+
+def export(members=HEART_ENSEMBLE_MEMBERS, model_dir=HEART_MODEL_DIR, tolerance=PARITY_TOLERANCE):
+    """
+    Export each member and check it against the original on the training
+    data. An export outside the tolerance is deleted, so the registry keeps
+    serving the native models. Returns {member: max probability difference}.
+    """
+    features = parity_features()
+    report = {}
+    for name in members:
+        path = os.path.join(current_model_dir(model_dir), ONNX_ARTIFACTS[name])
+        native = load_native(name, model_dir)
+        EXPORTERS[name](native, path)
+        report[name] = check_parity(native, OnnxHeartModel(path), features)
+        if report[name] > tolerance:
+            os.remove(path)
+            raise ValueError(f"{name} export differs from the original by {report[name]:.2e}; removed {path}")
+        print(f"{name}: exported to {path} (max probability difference {report[name]:.2e})")
+    return report
+
+
+# Run in a fresh interpreter, so each measurement starts from an empty process
+_STARTUP_SCRIPT = """
+import json, resource, time
+start = time.perf_counter()
+from heart_registry import HeartModelRegistry, HEART_MODEL_DIR, HEART_ENSEMBLE_MEMBERS, parse_heart_record
+registry = HeartModelRegistry(HEART_MODEL_DIR, HEART_ENSEMBLE_MEMBERS, runtime={runtime!r})
+ensemble = registry.load()
+loaded = time.perf_counter() - start
+ensemble.predict_proba(parse_heart_record("40, male, ata, 140, 289, 0, normal, 172, no, 0, up"))
+print(json.dumps({{
+    "startup_seconds": round(loaded, 3),
+    "first_prediction_seconds": round(time.perf_counter() - start, 3),
+    "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+}}))
+"""
+
+
+def measure_startup(runtime):
+    output = subprocess.check_output([sys.executable, "-c", _STARTUP_SCRIPT.format(runtime=runtime)],
+                                     cwd=BASE_DIR, env={**os.environ, "PYTHONPATH": BASE_DIR})
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def compare():
+    """Startup time and peak RSS of a process serving the native vs the exported ensemble"""
+    native, exported = measure_startup("native"), measure_startup("onnx")
+    report = {"native": native, "onnx": exported, "savings": {
+        key: round(native[key] - exported[key], 3) for key in native
+    }}
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the heart ensemble to ONNX")
+    parser.add_argument("command", choices=["export", "compare"])
+    parser.add_argument("--members", nargs="+", default=HEART_ENSEMBLE_MEMBERS, choices=list(ARTIFACTS))
+    parser.add_argument("--tolerance", type=float, default=PARITY_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.members, tolerance=args.tolerance)
+    else:
+        compare()
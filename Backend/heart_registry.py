@@ -0,0 +1,353 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import numpy as np
+from heart.src.utils import load_model as load_pkl_model
+from heart.src.feature_encoder import HeartFeatureEncoder, SCHEMA, ENCODER_FILENAME
+from metrics import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HEART_MODEL_DIR = os.getenv("HEART_MODEL_DIR", os.path.join(BASE_DIR, "heart", "src", "saved_models"))
+# Ensemble members to serve; drop "ann" on hosts without TensorFlow
+HEART_ENSEMBLE_MEMBERS = [name.strip() for name in
+                          os.getenv("HEART_ENSEMBLE_MEMBERS", "ann,xgboost,random_forest").split(",")
+                          if name.strip()]
+# How often artifacts are checked for changes on disk
+HEART_RELOAD_CHECK_SECONDS = float(os.getenv("HEART_RELOAD_CHECK_SECONDS", "30"))
+# "native" (Keras/XGBoost/scikit-learn), "onnx" (onnxruntime, see heart_onnx.py) or "auto":
+# ONNX when every member has been exported
+HEART_MODEL_RUNTIME = os.getenv("HEART_MODEL_RUNTIME", "auto").lower()
+HEART_THRESHOLD = 0.5
+# Rows encoded and scored together in batch requests; bounds memory for large uploads
+HEART_BATCH_CHUNK_ROWS = int(os.getenv("HEART_BATCH_CHUNK_ROWS", "5000"))
+
+ARTIFACTS = {
+    "ann": "ann_model.h5",
+    "xgboost": "xgboost_model.pkl",
+    "random_forest": "randomforest_model.pkl"
+}
+ONNX_ARTIFACTS = {name: os.path.splitext(filename)[0] + ".onnx" for name, filename in ARTIFACTS.items()}
+# Written by heart/src/train_all.py: `current` names the published run under runs/
+RUNS_DIR = "runs"
+CURRENT_POINTER = "current"
+FEATURE_COLUMNS = SCHEMA["columns"]
+
+# Encoder for parsing records before an ensemble (and its saved encoder) is loaded
+_schema_encoder = HeartFeatureEncoder.from_schema()
+
+
+def parse_heart_record(record, encoder=None):
+    """
+    1-row float32 feature matrix from a dict keyed by FEATURE_COLUMNS, a list
+    of 11 values or a comma-separated string in that order, accepting the
+    same spellings as the interactive predictor ("male", "ata", "yes", "up").
+    Raises ValueError for missing or unrecognised values.
+    """
+    matrix, errors = (encoder or _schema_encoder).transform([record])
+    if errors:
+        raise ValueError(errors[0])
+    return matrix
+
+
+def current_model_dir(model_dir):
+    """The run directory `current` in model_dir points to, or model_dir itself if there is none"""
+    try:
+        with open(os.path.join(model_dir, CURRENT_POINTER)) as f:
+            run_name = f.read().strip()
+    except OSError:
+        return model_dir
+    return os.path.join(model_dir, RUNS_DIR, run_name) if run_name else model_dir
+
+
+def _artifact_info(path):
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"path": path, "sha256": digest.hexdigest(), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _load_ann(path):
+    import heart.src.tensorflow_config  # noqa: F401 - quiets TensorFlow before it is imported
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.layers import InputLayer
+    from heart.src.model_wrapper import KerasClassifierWrapper
+
+    def input_layer(*args, **kwargs):
+        # Artifacts saved by newer Keras carry batch_shape, which older versions reject
+        batch_shape = kwargs.pop("batch_shape", None)
+        if not args and "shape" not in kwargs:
+            kwargs["shape"] = kwargs.get("input_shape") or (batch_shape[1:] if batch_shape
+                                                            else (len(FEATURE_COLUMNS),))
+        return InputLayer(*args, **kwargs)
+
+    model = load_model(path, custom_objects={"InputLayer": input_layer})
+    model.build((None, len(FEATURE_COLUMNS)))
+    return KerasClassifierWrapper(model)
+
+
+class OnnxHeartModel:
+    """An exported ensemble member run by onnxruntime, with the predict_proba of the original"""
+
+    def __init__(self, path):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1  # Small models; threads cost more than they save
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        return self.session.run(["probabilities"], {self.input_name: X})[0]
+
+
+class HeartEnsemble:
+    """One loaded set of ensemble members and their encoder; never modified after loading"""
+
+    def __init__(self, models, artifacts, load_seconds, runtime="native", encoder=None):
+        self.models = models
+        self.runtime = runtime
+        self.encoder = encoder or _schema_encoder
+        self.artifacts = artifacts
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        combined = hashlib.sha256()
+        for name in sorted(artifacts):
+            combined.update(f"{name}:{artifacts[name]['sha256']}".encode("utf-8"))
+        self.version = combined.hexdigest()[:12]
+
+    def predict_proba(self, features):
+        """
+        (heart disease probability per row, {member: (probabilities, seconds)})
+        for an encoded float32 matrix; the ANN gets it standardised, as in training.
+        """
+        members = {}
+        for name, model in self.models.items():
+            start = time.perf_counter()
+            data = self.encoder.scale(features) if name == "ann" else features
+            probabilities = np.asarray(model.predict_proba(data))[:, 1]
+            seconds = time.perf_counter() - start
+            metrics.observe("heart_model_seconds", seconds,
+                            help_text="Heart ensemble member inference latency in seconds", model=name)
+            members[name] = (probabilities, seconds)
+        # Soft voting, as in heart/predictor.py
+        average = np.mean([probabilities for probabilities, _ in members.values()], axis=0)
+        return average, members
+
+
+class HeartModelRegistry:
+    """
+    Keeps the heart-disease ensemble loaded for the life of the process.
+
+    Artifacts are loaded once from the run `current` points to (TensorFlow is
+    only imported for the native ANN; the ONNX runtime needs none of
+    TensorFlow, XGBoost or scikit-learn) and checked for changes at most every
+    `check_interval` seconds; a new run or a changed size, mtime or checksum
+    loads a fresh ensemble and swaps it in, while requests already running
+    finish on the previous one.
+    """
+
+    def __init__(self, model_dir, members, check_interval=30, runtime="auto"):
+        self.model_dir = model_dir
+        self.members = members
+        self.runtime = runtime
+        self.check_interval = check_interval
+        self._ensemble = None
+        self._last_check = 0.0
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    def _runtime(self):
+        if self.runtime != "auto":
+            return self.runtime
+        model_dir = current_model_dir(self.model_dir)
+        exported = all(os.path.exists(os.path.join(model_dir, ONNX_ARTIFACTS[name])) for name in self.members)
+        return "onnx" if exported else "native"
+
+    def _paths(self, runtime):
+        model_dir = current_model_dir(self.model_dir)
+        filenames = ONNX_ARTIFACTS if runtime == "onnx" else ARTIFACTS
+        paths = {name: os.path.join(model_dir, filenames[name]) for name in self.members}
+        # The ANN needs the scaler it was trained with; the tree models can use the plain schema
+        encoder_path = os.path.join(model_dir, ENCODER_FILENAME)
+        if "ann" in self.members or os.path.exists(encoder_path):
+            paths["encoder"] = encoder_path
+        return paths
+
+    def load(self):
+        """Load every member from disk and swap the new ensemble in; returns it"""
+        with self._lock:
+            start = time.perf_counter()
+            runtime = self._runtime()
+            try:
+                models, artifacts, encoder = {}, {}, None
+                for name, path in self._paths(runtime).items():
+                    member_start = time.perf_counter()
+                    artifacts[name] = _artifact_info(path)
+                    if name == "encoder":
+                        encoder = HeartFeatureEncoder.load(path)
+                    elif runtime == "onnx":
+                        models[name] = OnnxHeartModel(path)
+                    else:
+                        models[name] = _load_ann(path) if name == "ann" else load_pkl_model(path)
+                    artifacts[name]["load_seconds"] = round(time.perf_counter() - member_start, 4)
+            except Exception as e:
+                self._last_error = str(e)
+                self._last_check = time.monotonic()
+                logging.error(f"Error loading heart models: {str(e)}")
+                raise
+            ensemble = HeartEnsemble(models, artifacts, time.perf_counter() - start, runtime, encoder)
+            self._ensemble = ensemble
+            self._last_check = time.monotonic()
+            self._last_error = None
+            metrics.observe("heart_model_load_seconds", ensemble.load_seconds,
+                            help_text="Heart ensemble load time in seconds")
+            logging.info(f"Loaded heart ensemble {ensemble.version} ({', '.join(models)}, {runtime}) "
+                         f"in {ensemble.load_seconds:.2f}s")
+            return ensemble
+
+    def _changed(self, ensemble):
+        runtime = self._runtime()
+        if runtime != ensemble.runtime:
+            return True
+        for name, path in self._paths(runtime).items():
+            known = ensemble.artifacts.get(name)
+            if known is not None and known["path"] != path:
+                return True  # A new run was published
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # Keep serving the loaded model while an artifact is being replaced
+            if known is None or (stat.st_size, stat.st_mtime) != (known["size"], known["mtime"]):
+                if known is None or _artifact_info(path)["sha256"] != known["sha256"]:
+                    return True
+        return False
+
+    def get(self):
+        """Current ensemble, reloading it first if artifacts changed; None if none could be loaded"""
+        ensemble = self._ensemble
+        if time.monotonic() - self._last_check < self.check_interval:
+            return ensemble
+        self._last_check = time.monotonic()
+        try:
+            if ensemble is None or self._changed(ensemble):
+                ensemble = self.load()
+        except Exception:
+            pass  # Logged by load(); the previous ensemble (if any) keeps serving
+        return self._ensemble
+
+    def preload(self):
+        """Load in a background thread so the server starts accepting requests immediately"""
+        def run():
+            try:
+                self.load()
+            except Exception:
+                pass
+        threading.Thread(target=run, name="heart-model-preload", daemon=True).start()
+
+    def predict(self, record):
+        """Ensemble prediction for one record (see parse_heart_record)"""
+        ensemble = self.get()
+        if ensemble is None:
+            return None
+        features = parse_heart_record(record, ensemble.encoder)
+        probability, members = ensemble.predict_proba(features)
+        probability = float(probability[0])
+        return {
+            "prediction": int(probability > HEART_THRESHOLD),
+            "label": "Heart Disease" if probability > HEART_THRESHOLD else "No Heart Disease",
+            "probability": round(probability, 4),
+            "models": {
+                name: {"probability": round(float(probabilities[0]), 4), "seconds": round(seconds, 5)}
+                for name, (probabilities, seconds) in members.items()
+            },
+            "version": ensemble.version
+        }
+
+    def score_matrix(self, ensemble, matrix, errors):
+        """
+        Run each member once over the rows of an encoded matrix that have no
+        error. Returns (probability per row, {member: probability per row}),
+        NaN for the rows with errors.
+        """
+        valid = np.ones(len(matrix), dtype=bool)
+        valid[list(errors)] = False
+        probability = np.full(len(matrix), np.nan)
+        members = {name: np.full(len(matrix), np.nan) for name in ensemble.models}
+        if valid.any():
+            probability[valid], scored = ensemble.predict_proba(matrix[valid])
+            for name, (probabilities, _) in scored.items():
+                members[name][valid] = probabilities
+        return probability, members
+
+    def iter_csv_scores(self, lines, chunk_rows=HEART_BATCH_CHUNK_ROWS):
+        """
+        Score an open CSV file chunk_rows at a time on one ensemble version.
+        Returns (version, header, generator of row lists per chunk): row,
+        probability, prediction, each member's probability and the error.
+        """
+        ensemble = self.get()
+        if ensemble is None:
+            return None
+        header = ["row", "probability", "prediction"] + [f"{name}_probability" for name in ensemble.models] + ["error"]
+
+        def chunks():
+            for offset, matrix, errors in ensemble.encoder.iter_csv(lines, chunk_rows):
+                probability, members = self.score_matrix(ensemble, matrix, errors)
+                rows = []
+                for i in range(len(matrix)):
+                    if i in errors:
+                        rows.append([offset + i, "", ""] + [""] * len(members) + [errors[i]])
+                        continue
+                    rows.append([offset + i, float(probability[i]), int(probability[i] > HEART_THRESHOLD)]
+                                + [float(values[i]) for values in members.values()] + [""])
+                yield rows
+
+        return ensemble.version, header, chunks()
+
+    def predict_batch(self, records, chunk_size=HEART_BATCH_CHUNK_ROWS):
+        """
+        Ensemble predictions for a list of records (any form parse_heart_record
+        takes), encoded and scored chunk_size rows at a time. Rows that cannot
+        be encoded get an error instead of a probability; the rest are still scored.
+        """
+        ensemble = self.get()
+        if ensemble is None:
+            return None
+        results, errors = [], []
+        for offset in range(0, len(records), chunk_size):
+            matrix, chunk_errors = ensemble.encoder.transform(records[offset:offset + chunk_size])
+            probability, members = self.score_matrix(ensemble, matrix, chunk_errors)
+            for i in range(len(matrix)):
+                if i in chunk_errors:
+                    errors.append({"row": offset + i, "error": chunk_errors[i]})
+                    continue
+                results.append({
+                    "row": offset + i,
+                    "probability": round(float(probability[i]), 4),
+                    "prediction": int(probability[i] > HEART_THRESHOLD),
+                    "models": {name: round(float(values[i]), 4) for name, values in members.items()}
+                })
+        return {"version": ensemble.version, "rows": len(records), "scored": len(results),
+                "results": results, "errors": errors}
+
+    def info(self):
+        ensemble = self._ensemble
+        if ensemble is None:
+            return {"loaded": False, "members": self.members, "error": self._last_error}
+        return {
+            "loaded": True,
+            "version": ensemble.version,
+            "runtime": ensemble.runtime,
+            "loaded_at": ensemble.loaded_at,
+            "load_seconds": round(ensemble.load_seconds, 4),
+            "artifacts": ensemble.artifacts,
+            "error": self._last_error
+        }
+
+
+heart_registry = HeartModelRegistry(HEART_MODEL_DIR, HEART_ENSEMBLE_MEMBERS,
+                                    check_interval=HEART_RELOAD_CHECK_SECONDS, runtime=HEART_MODEL_RUNTIME)
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 import json
 import os
+import argparse
 import pandas as pd
 import numpy as np
 
-from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder, OneHotEncoder
 from sklearn.preprocessing import StandardScaler
 from sklearn.compose import ColumnTransformer
@@ -29,9 +30,24 @@ import joblib
 from imblearn.over_sampling import SMOTE
 from sklearn.utils.class_weight import compute_class_weight
 
+from xgb_search import successive_halving
+
 # 1. LOAD DATA
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_PATH = os.path.join(BASE_DIR, 'data', 'hypertension_data.csv')
+TRIALS_PATH = os.path.join(BASE_DIR, 'models', 'search_trials.jsonl')
+
+# XGBoost search space; boosting rounds are set by the search rungs and early stopping
+PARAM_SPACE = {
+    'max_depth': [3, 4, 5, 6, 8],
+    'learning_rate': [0.01, 0.05, 0.1],
+    'subsample': [0.8, 0.9, 1.0],
+    'colsample_bytree': [0.8, 0.9, 1.0],
+    'gamma': [0, 0.1, 0.2],
+    'min_child_weight': [1, 3, 5],
+    'reg_alpha': [0, 0.1, 0.5],
+    'reg_lambda': [0.1, 1.0, 5.0]
+}
 
 def load_data(filepath):
     """
@@ -177,7 +193,7 @@ def perform_cross_validation(model, X, y, cv=5):
     print(f"Mean CV Score: {cv_scores.mean():.4f} (+/- {cv_scores.std() * 2:.4f})")
 
 # 3. MAIN FUNCTION
-def main():
+def main(search_options=None):
     # Load data
     df = load_data(DATA_PATH)
     print(f"Data shape: {df.shape}")
@@ -205,56 +221,50 @@ def main():
     class_weight_dict = dict(zip(np.unique(y), class_weights))
 
     # 4. Modify XGBoost parameters for probability calibration
-    xgb_clf = xgb.XGBClassifier(
-        objective='binary:logistic',
-        eval_metric=['auc', 'logloss'],
-        random_state=42,
-        scale_pos_weight=class_weights[1]/class_weights[0],
-        max_delta_step=1,
-        enable_categorical=True,
-        tree_method='hist',  # Faster training
-        early_stopping_rounds=10  # Prevent overfitting
-    )
-
-    # Updated parameter grid with proper prefixes
-    param_grid = {
-        'classifier__n_estimators': [100, 200, 300, 500],
-        'classifier__max_depth': [3, 4, 5, 6, 8],
-        'classifier__learning_rate': [0.01, 0.05, 0.1],
-        'classifier__subsample': [0.8, 0.9, 1.0],
-        'classifier__colsample_bytree': [0.8, 0.9, 1.0],
-        'classifier__gamma': [0, 0.1, 0.2],
-        'classifier__min_child_weight': [1, 3, 5],
-        'classifier__reg_alpha': [0, 0.1, 0.5],
-        'classifier__reg_lambda': [0.1, 1.0, 5.0]
+    xgb_params = {
+        'objective': 'binary:logistic',
+        'eval_metric': ['auc', 'logloss'],
+        'random_state': 42,
+        'scale_pos_weight': float(class_weights[1] / class_weights[0]),
+        'max_delta_step': 1,
+        'tree_method': 'hist'  # Faster training
     }
 
-    # Create pipeline with XGBoost
-    xgb_pipeline = Pipeline(steps=[
-        ('classifier', xgb_clf)
-    ])
-
-    # Updated GridSearchCV
-    grid_search = GridSearchCV(
-        estimator=xgb_pipeline,
-        param_grid=param_grid,
-        scoring=['f1', 'precision', 'recall', 'roc_auc'],
-        refit='f1',  # Choose primary metric
+    # Budgeted successive halving instead of the exhaustive grid: each fit stops early
+    # on its validation fold, and finished trials are journalled so a rerun resumes
+    options = search_options or {}
+    cpu_count = os.cpu_count() or 1
+    xgb_threads = options.get('xgb_threads') or 1
+    cv_workers = options.get('cv_workers') or max(1, cpu_count // xgb_threads)
+    print(f"Starting XGBoost search: {cv_workers} CV workers x {xgb_threads} XGBoost threads "
+          f"on {cpu_count} cores")
+    search = successive_halving(
+        X_train_balanced, np.asarray(y_train_balanced), PARAM_SPACE, xgb_params,
+        n_candidates=options.get('candidates', 81),
+        max_rounds=options.get('max_rounds', 500),
         cv=5,
-        n_jobs=-1,
-        verbose=2,
-        return_train_score=True
+        refit_metric='f1',
+        max_fits=options.get('max_fits'),
+        max_seconds=options.get('max_seconds'),
+        cv_workers=cv_workers,
+        xgb_threads=xgb_threads,
+        journal_path=options.get('trials_path', TRIALS_PATH),
+        early_stopping_rounds=10  # Prevent overfitting
     )
-
-    print("Starting Grid Search for XGBoost...")
-    # Suppress warnings during fit
-    import warnings
-    with warnings.catch_warnings():
-        warnings.filterwarnings('ignore', category=UserWarning)
-        grid_search.fit(X_train_balanced, y_train_balanced)
-    print("Best params:", grid_search.best_params_)
-
-    best_xgb_model = grid_search.best_estimator_
+    print(f"Search finished: {len(search['trials'])} trials, {search['fits']} fits in {search['seconds']}s")
+    if search['partial']:
+        print(f"Budget ran out part way through the {search['rounds']}-round rung; "
+              f"the best configuration is the best of the configurations that rung finished")
+    print("Best params:", {**search['params'], 'n_estimators': search['n_estimators']})
+    print("Best CV scores:", {name: round(score, 4) for name, score in search['scores'].items()})
+
+    # Refit on all the balanced training data with the rounds early stopping settled on
+    xgb_clf = xgb.XGBClassifier(**xgb_params, **search['params'], n_estimators=search['n_estimators'],
+                                n_jobs=cpu_count)
+    best_xgb_model = Pipeline(steps=[
+        ('classifier', xgb_clf)
+    ])
+    best_xgb_model.fit(X_train_balanced, y_train_balanced)
 
     # Evaluate XGBoost with probabilities
     y_pred = best_xgb_model.predict(X_test_preprocessed)
@@ -301,7 +311,7 @@ def main():
     # Use weights for ensemble members
     ensemble_clf = VotingClassifier(
         estimators=[
-            ('xgb', grid_search.best_estimator_),
+            ('xgb', best_xgb_model),
             ('rf', rf_clf),
             ('lr', lr_clf)
         ],
@@ -391,4 +401,21 @@ def main():
     print(f"Saved model metadata to: {METADATA_PATH}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train the hypertension model")
+    parser.add_argument("--max-fits", type=int, default=None, help="Budget of XGBoost fits for the search")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Wall-clock budget for the search")
+    parser.add_argument("--candidates", type=int, default=81, help="Configurations sampled for the first rung")
+    parser.add_argument("--max-rounds", type=int, default=500, help="Boosting rounds in the last rung")
+    parser.add_argument("--cv-workers", type=int, default=None, help="Configurations cross-validated at once")
+    parser.add_argument("--xgb-threads", type=int, default=None, help="Threads per XGBoost fit")
+    parser.add_argument("--trials-path", default=TRIALS_PATH, help="Journal of finished trials, for resuming")
+    args = parser.parse_args()
+    main({
+        'max_fits': args.max_fits,
+        'max_seconds': args.max_seconds,
+        'candidates': args.candidates,
+        'max_rounds': args.max_rounds,
+        'cv_workers': args.cv_workers,
+        'xgb_threads': args.xgb_threads,
+        'trials_path': args.trials_path
+    })
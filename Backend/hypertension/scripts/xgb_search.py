@@ -0,0 +1,215 @@
+"""
+Budgeted successive-halving search over XGBoost hyperparameters.
+
+Random configurations from a parameter space are cross-validated with a small
+number of boosting rounds; the best 1/eta of them move on to eta times more
+rounds, until the survivors train with the full number. Every fit uses XGBoost
+early stopping on its validation fold, so a poor configuration also stops
+early within a rung. The search ends when the rungs are done or the fit-count
+or wall-clock budget runs out.
+
+Each finished trial (one configuration at one rung, all folds) is appended to
+a JSON lines journal; a rerun with the same data and space reuses journalled
+trials instead of refitting them.
+"""
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import numpy as np
+import xgboost as xgb
+from joblib import Parallel, delayed, parallel_config
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import f1_score, precision_score, recall_score, roc_auc_score
+
+SCORERS = {
+    "f1": lambda y, pred, proba: f1_score(y, pred, zero_division=0),
+    "precision": lambda y, pred, proba: precision_score(y, pred, zero_division=0),
+    "recall": lambda y, pred, proba: recall_score(y, pred, zero_division=0),
+    "roc_auc": lambda y, pred, proba: roc_auc_score(y, proba)
+}
+
+
+def data_fingerprint(X, y):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X).tobytes())
+    digest.update(np.ascontiguousarray(y).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def sample_configs(space, n, seed=42):
+    """Up to n distinct random configurations from {param: [values]}"""
+    rng = random.Random(seed)
+    total = math.prod(len(values) for values in space.values())
+    configs, seen = [], set()
+    while len(configs) < min(n, total):
+        config = {name: rng.choice(values) for name, values in space.items()}
+        key = tuple(sorted(config.items()))
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+def rung_rounds(min_rounds, max_rounds, eta):
+    """Boosting rounds per rung, ending at max_rounds: 500/9, 500/3, 500 for 50..500 with eta=3"""
+    rungs = int(math.floor(math.log(max_rounds / min_rounds, eta) + 1e-9))
+    return [int(round(max_rounds * eta ** (i - rungs))) for i in range(rungs + 1)]
+
+
+def evaluate_config(params, rounds, X, y, folds, base_params, threads, early_stopping_rounds):
+    """Cross-validate one configuration with at most `rounds` boosting rounds per fold"""
+    start = time.perf_counter()
+    fold_scores = {name: [] for name in SCORERS}
+    best_iterations = []
+    for train_index, valid_index in folds:
+        model = xgb.XGBClassifier(**base_params, **params, n_estimators=rounds, n_jobs=threads,
+                                  early_stopping_rounds=early_stopping_rounds)
+        model.fit(X[train_index], y[train_index], eval_set=[(X[valid_index], y[valid_index])], verbose=False)
+        # predict_proba uses the best iteration found by early stopping
+        proba = model.predict_proba(X[valid_index])[:, 1]
+        pred = (proba > 0.5).astype(int)
+        for name, scorer in SCORERS.items():
+            fold_scores[name].append(float(scorer(y[valid_index], pred, proba)))
+        best_iterations.append(int(model.best_iteration))
+    return {
+        "params": params,
+        "rounds": rounds,
+        "scores": {name: float(np.mean(values)) for name, values in fold_scores.items()},
+        "best_iterations": best_iterations,
+        "fits": len(folds),
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+
+
+def _rank_key(record, refit_metric):
+    """Best first; ties go to the better ROC AUC, then to the parameters' JSON, so ranking is reproducible"""
+    return (-record["scores"][refit_metric], -record["scores"]["roc_auc"],
+            json.dumps(record["params"], sort_keys=True))
+
+
+def _keyed_trial(key, params, *args):
+    return key, evaluate_config(params, *args)
+
+
+class TrialJournal:
+    """Finished trials, one JSON object per line, keyed by configuration, rung and data"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.trials = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.trials[record["key"]] = record
+
+    @staticmethod
+    def key(params, rounds, context):
+        payload = json.dumps({"params": params, "rounds": rounds, **context}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        return self.trials.get(key)
+
+    def add(self, key, record):
+        record = {"key": key, **record}
+        self.trials[key] = record
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+
+def successive_halving(X, y, space, base_params, n_candidates=81, min_rounds=50, max_rounds=500, eta=3,
+                       cv=3, refit_metric="f1", max_fits=None, max_seconds=None, cv_workers=1,
+                       xgb_threads=1, journal_path=None, early_stopping_rounds=10, seed=42):
+    """
+    Search `space` ({param: [values]}, n_estimators excluded) and return the
+    best configuration: {"params", "n_estimators", "scores", "rounds"}, plus
+    "trials" (every evaluated trial), "fits" (fits run in this call) and
+    "partial" (True if the best comes from a rung the budget cut short).
+
+    cv_workers configurations are cross-validated at once, each XGBoost fit
+    using xgb_threads threads, so cv_workers * xgb_threads should not exceed
+    the cores available.
+    """
+    start = time.perf_counter()
+    X = X.toarray() if hasattr(X, "toarray") else np.asarray(X)
+    y = np.asarray(y)
+    folds = list(StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed).split(X, y))
+    journal = TrialJournal(journal_path)
+    context = {"data": data_fingerprint(X, y), "cv": cv, "seed": seed, "base_params": base_params,
+               "early_stopping_rounds": early_stopping_rounds}
+    survivors = sample_configs(space, n_candidates, seed)
+    rungs = rung_rounds(min_rounds, max_rounds, eta)
+    fits, trials, completed = 0, [], []
+
+    def budget_left():
+        if max_fits is not None and fits + cv > max_fits:
+            return False
+        return max_seconds is None or time.perf_counter() - start < max_seconds
+
+    with parallel_config(backend="loky", inner_max_num_threads=xgb_threads):
+        for rung, rounds in enumerate(rungs):
+            results = []
+            pending = []
+            for params in survivors:
+                key = TrialJournal.key(params, rounds, context)
+                cached = journal.get(key)
+                if cached:
+                    results.append(cached)
+                else:
+                    pending.append((key, params))
+
+            # Only submit what the fit budget allows; the time budget is checked as trials finish
+            if max_fits is not None:
+                pending = pending[:max(0, (max_fits - fits) // cv)]
+            if pending and budget_left():
+                # X and y go in as arguments, so joblib memory-maps them for the workers
+                jobs = Parallel(n_jobs=cv_workers, return_as="generator_unordered")(
+                    delayed(_keyed_trial)(key, params, rounds, X, y, folds, base_params, xgb_threads,
+                                          early_stopping_rounds)
+                    for key, params in pending
+                )
+                for key, record in jobs:
+                    results.append(journal.add(key, {"rung": rung, **record}))
+                    fits += record["fits"]
+                    if not budget_left():
+                        break
+
+            trials += results
+            if not results:
+                break
+            # Results arrive in completion order; rank them independently of it
+            results.sort(key=lambda record: _rank_key(record, refit_metric))
+            completed = results
+            partial = len(results) < len(survivors)
+            print(f"Rung {rung}: {len(results)} configurations at {rounds} rounds, "
+                  f"best {refit_metric} {results[0]['scores'][refit_metric]:.4f} "
+                  f"({fits} fits, {time.perf_counter() - start:.1f}s)"
+                  + (f"; partial rung, the budget ran out after {len(results)} of {len(survivors)} "
+                     f"configurations" if partial else ""))
+            if partial or not budget_left():
+                break
+            survivors = [record["params"] for record in results[:max(1, len(results) // eta)]]
+
+    if not completed:
+        raise ValueError("Search budget too small to evaluate any configuration")
+    best = completed[0]
+    partial = len(completed) < len(survivors)
+    return {
+        "params": best["params"],
+        # Rounds early stopping settled on, averaged over the folds
+        "n_estimators": int(np.mean(best["best_iterations"])) + 1,
+        "scores": best["scores"],
+        "rounds": best["rounds"],
+        "trials": trials,
+        "fits": fits,
+        "partial": partial,
+        "seconds": round(time.perf_counter() - start, 1)
+    }
@@ -4,21 +4,20 @@ import logging
 
 # Load environment variables from .env if available
 load_dotenv()
-os.environ["GROQ_API_KEY"] = <GROQ_API_KEY>
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Load Groq API key from environment
-groq_api_key = os.getenv("GROQ_API_KEY")
-if not groq_api_key:
+if os.getenv("LLM_BACKEND", "groq") == "groq" and not os.getenv("GROQ_API_KEY"):
     raise ValueError("GROQ_API_KEY not set in environment.")
 
-# Initialize Groq client
-from groq import Groq
-client = Groq(api_key=groq_api_key)
-
-# Import supabase client
+# Shared LLM gateway and supabase client
+from llm_gateway import llm_gateway, slot_model
 from supabase_client import supabase
+from health_records import flatten_records
+from metrics import timed, log_payload, payload_size
+
+INDIVIDUAL_MODEL = slot_model("individual", "mixtral-8x7b-32768")
 
 def get_analysis_and_recommendations(record):
     """Get temporal analysis and recommendations in a single API call"""
@@ -64,16 +63,17 @@ SECTION 2 - RECOMMENDATIONS:
 Please provide your response in two clearly separated sections marked as 'ANALYSIS:' and 'RECOMMENDATIONS:'"""
 
         messages = [{"role": "user", "content": combined_prompt}]
+        log_payload("llm_request", model=INDIVIDUAL_MODEL, chars=payload_size(messages))
 
         # Single API call for both analysis and recommendations
-        completion = client.chat.completions.create(
-            messages=messages,
-            model="mixtral-8x7b-32768",
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        response_text = completion.choices[0].message.content
+        with timed("llm_completion", model=INDIVIDUAL_MODEL):
+            response_text = llm_gateway.complete(
+                messages,
+                model=INDIVIDUAL_MODEL,
+                temperature=0.7,
+                max_tokens=2000
+            )
+        log_payload("llm_response", model=INDIVIDUAL_MODEL, chars=payload_size(response_text))
         
         # Split response into analysis and recommendations
         try:
@@ -93,10 +93,11 @@ def main(visit_patient_id):
     """Get analysis for a specific visit_patient_id"""
     try:
         # Fetch data from patient_health_records for the given visit_patient_id
-        response = supabase.table("patient_health_records")\
-            .select("*")\
-            .eq("visit_patient_id", visit_patient_id)\
-            .execute()
+        with timed("supabase_query", table="patient_health_records"):
+            response = supabase.table("patient_health_records")\
+                .select("*")\
+                .eq("visit_patient_id", visit_patient_id)\
+                .execute()
         
         records = response.data
         if not records:
@@ -105,14 +106,17 @@ def main(visit_patient_id):
 
         logging.info(f"Fetched {len(records)} records for visit_patient_id: {visit_patient_id}")
         
-        # Get combined analysis for all records
-        combined_record = {
-            "visit_patient_id": visit_patient_id,
-            "records": records
-        }
+        # Flatten each visit into one row with the same flattener as region analysis,
+        # ordered by visit date, and send the visits as a compact table
+        visits = flatten_records(records)
+        if "created_at" in visits.columns:
+            visits = visits.sort_values("created_at")
+        visits = visits.dropna(axis=1, how="all")
+        combined_record = f"visit_patient_id: {visit_patient_id}\n{visits.to_csv(index=False)}"
         
         # Get both analysis and recommendations
-        analysis, recommendations = get_analysis_and_recommendations(combined_record)
+        with timed("individual_analysis"):
+            analysis, recommendations = get_analysis_and_recommendations(combined_record)
 
         if not analysis or not recommendations:
             logging.error("Failed to generate analysis or recommendations")
@@ -0,0 +1,611 @@
+import os
+import time
+import re
+import json
+import queue
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+import httpx
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+from groq import Groq, AsyncGroq, RateLimitError, InternalServerError, APIConnectionError, APITimeoutError
+from rate_limiter import RateLimiter, estimate_tokens
+
+load_dotenv()
+
+
+class LLMError(Exception):
+    pass
+
+
+class RetryableLLMError(LLMError):
+    """A failure worth retrying (429, 5xx, connection reset, timeout)"""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class LLMDeadlineExceeded(LLMError):
+    pass
+
+
+def _retry_after_header(error):
+    """Retry-After seconds from an API error or an httpx response"""
+    try:
+        response = getattr(error, "response", error)
+        header = response.headers.get("retry-after")
+        return float(header) if header else None
+    except (AttributeError, ValueError):
+        return None
+
+
+class GroqBackend:
+    """
+    Groq chat completions over one pooled keep-alive HTTP client.
+    The SDK's own retries are disabled; the gateway retries instead.
+    """
+    name = "groq"
+
+    def __init__(self, api_key=None, max_connections=20, max_keepalive=10, keepalive_expiry=30.0):
+        self.api_key = api_key
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created on first use so importing modules does not require an API key
+        with self._lock:
+            if self._client is None:
+                self._client = Groq(api_key=self.api_key or os.getenv("GROQ_API_KEY"),
+                                    http_client=httpx.Client(limits=self.limits), max_retries=0)
+            return self._client
+
+    @property
+    def async_client(self):
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = AsyncGroq(api_key=self.api_key or os.getenv("GROQ_API_KEY"),
+                                               http_client=httpx.AsyncClient(limits=self.limits), max_retries=0)
+            return self._async_client
+
+    @staticmethod
+    def _retryable(error):
+        """The gateway's error for a Groq SDK exception, or None if it should not be retried"""
+        if isinstance(error, RateLimitError):
+            return RetryableLLMError(str(error), status=429, retry_after=_retry_after_header(error))
+        if isinstance(error, InternalServerError):
+            return RetryableLLMError(str(error), status=getattr(error, "status_code", 500))
+        if isinstance(error, (APIConnectionError, APITimeoutError)):
+            return RetryableLLMError(str(error))
+        return None
+
+    def complete(self, model, messages, timeout, **params):
+        try:
+            completion = self.client.chat.completions.create(
+                messages=messages, model=model, timeout=timeout, **params
+            )
+        except (RateLimitError, InternalServerError, APIConnectionError, APITimeoutError) as e:
+            raise self._retryable(e) from e
+        return completion.choices[0].message.content
+
+    async def acomplete(self, model, messages, timeout, **params):
+        try:
+            completion = await self.async_client.chat.completions.create(
+                messages=messages, model=model, timeout=timeout, **params
+            )
+        except (RateLimitError, InternalServerError, APIConnectionError, APITimeoutError) as e:
+            raise self._retryable(e) from e
+        return completion.choices[0].message.content
+
+    def stream(self, model, messages, timeout, **params):
+        """Yield content deltas as Groq produces them"""
+        try:
+            chunks = self.client.chat.completions.create(
+                messages=messages, model=model, timeout=timeout, stream=True, **params
+            )
+            for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except (RateLimitError, InternalServerError, APIConnectionError, APITimeoutError) as e:
+            raise self._retryable(e) from e
+
+    async def astream(self, model, messages, timeout, **params):
+        try:
+            chunks = await self.async_client.chat.completions.create(
+                messages=messages, model=model, timeout=timeout, stream=True, **params
+            )
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except (RateLimitError, InternalServerError, APIConnectionError, APITimeoutError) as e:
+            raise self._retryable(e) from e
+
+
+class FakeBackend:
+    """
+    Local stand-in for tests and benchmarks: returns a canned (or echoed)
+    reply after `latency` seconds and fails a `failure_rate` share of calls
+    with a retryable error.
+    """
+    name = "fake"
+
+    def __init__(self, response=None, latency=0.0, failure_rate=0.0, seed=None):
+        self.response = response
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _start(self):
+        """Count the call and decide whether it fails"""
+        with self._lock:
+            self.calls += 1
+            return self._random.random() < self.failure_rate
+
+    def _reply(self, model, messages):
+        if self.response is not None:
+            return self.response
+        return f"[{model}] {messages[-1]['content'][:200]}"
+
+    def complete(self, model, messages, timeout, **params):
+        fail = self._start()
+        time.sleep(min(self.latency, timeout) if timeout else self.latency)
+        if fail:
+            raise RetryableLLMError("Fake backend failure", status=503)
+        return self._reply(model, messages)
+
+    def stream(self, model, messages, timeout, **params):
+        """The same reply word by word; `latency` passes before the first word"""
+        fail = self._start()
+        time.sleep(min(self.latency, timeout) if timeout else self.latency)
+        if fail:
+            raise RetryableLLMError("Fake backend failure", status=503)
+        for word in re.findall(r"\S+\s*", self._reply(model, messages)):
+            yield word
+
+    async def acomplete(self, model, messages, timeout, **params):
+        fail = self._start()
+        await asyncio.sleep(min(self.latency, timeout) if timeout else self.latency)
+        if fail:
+            raise RetryableLLMError("Fake backend failure", status=503)
+        return self._reply(model, messages)
+
+    async def astream(self, model, messages, timeout, **params):
+        fail = self._start()
+        await asyncio.sleep(min(self.latency, timeout) if timeout else self.latency)
+        if fail:
+            raise RetryableLLMError("Fake backend failure", status=503)
+        for word in re.findall(r"\S+\s*", self._reply(model, messages)):
+            yield word
+
+
+class MicroBatcher:
+    """
+    Collects requests for up to `window` seconds (or until `max_batch` are
+    waiting) and groups them by model and prompt prefix. Each group sends one
+    leader request first; the rest follow once the leader has answered or
+    `leader_wait` seconds have passed, by which time the server has computed
+    the shared prefix (the static specialist prompts) and its prefix cache
+    (vLLM, llama.cpp, Ollama) serves it to the followers. Groups do not wait
+    for each other.
+    """
+
+    def __init__(self, send, window=0.01, max_batch=8, prefix_chars=512, leader_wait=0.5):
+        self.send = send
+        self.window = window
+        self.max_batch = max_batch
+        self.prefix_chars = prefix_chars
+        self.leader_wait = leader_wait
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max_batch, thread_name_prefix="llm-batch")
+        threading.Thread(target=self._dispatch, name="llm-batcher", daemon=True).start()
+
+    def prefix_key(self, model, messages):
+        prompt = json.dumps(messages)[:self.prefix_chars]
+        return model, hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def submit(self, model, messages, timeout, **params):
+        future = Future()
+        self._queue.put((self.prefix_key(model, messages), future, (model, messages, timeout), params))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise RetryableLLMError(f"{model} batched request timed out")
+
+    def _run(self, future, args, params):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self.send(*args, **params))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            closes = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = closes - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            groups = defaultdict(list)
+            for key, future, args, params in batch:
+                groups[key].append((future, args, params))
+            self.batches += 1
+            self.requests += len(batch)
+            if len(batch) > 1:
+                logging.info(f"Dispatching {len(batch)} LLM requests in {len(groups)} prefix groups")
+            for group in groups.values():
+                self._send_group(group)
+
+    def _send_group(self, group):
+        leader, followers = group[0], group[1:]
+        leader_future = self._pool.submit(self._run, *leader)
+        if not followers:
+            return
+        released = threading.Event()
+
+        def release(*_):
+            if released.is_set():
+                return
+            released.set()
+            for future, args, params in followers:
+                self._pool.submit(self._run, future, args, params)
+
+        # Whichever comes first: the leader finishing (prefix now cached) or the wait running out
+        timer = threading.Timer(self.leader_wait, release)
+        timer.daemon = True
+        timer.start()
+        leader_future.add_done_callback(lambda _: (timer.cancel(), release()))
+
+
+class OpenAICompatibleBackend:
+    """
+    Any server speaking the OpenAI chat completions API: Ollama
+    (http://localhost:11434/v1), vLLM, llama.cpp server, LM Studio. With
+    `batch_window` set, non-streaming requests go through a MicroBatcher.
+    """
+    name = "local"
+
+    def __init__(self, base_url, api_key=None, max_connections=20, max_keepalive=10,
+                 batch_window=0.0, max_batch=8, prefix_chars=512, leader_wait=0.5):
+        self.client_options = {
+            "base_url": base_url.rstrip("/"),
+            "headers": {"Authorization": f"Bearer {api_key}"} if api_key else {},
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        }
+        self.client = httpx.Client(**self.client_options)
+        self._async_client = None
+        self.batcher = MicroBatcher(self._complete, batch_window, max_batch, prefix_chars, leader_wait)\
+            if batch_window > 0 else None
+
+    @property
+    def async_client(self):
+        # Created on first use, inside the serving event loop
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self.client_options)
+        return self._async_client
+
+    @staticmethod
+    def _check(response, model, text):
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableLLMError(f"{model} request failed: {response.status_code} {text[:200]}",
+                                    status=response.status_code, retry_after=_retry_after_header(response))
+        if response.status_code >= 400:
+            raise LLMError(f"{model} request failed: {response.status_code} {text[:200]}")
+
+    @staticmethod
+    def _stream_pieces(line):
+        """Content of one SSE line, or None; raises StopIteration at [DONE]"""
+        if not line.startswith("data:"):
+            return None
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            raise StopIteration
+        choices = json.loads(data).get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+    def _complete(self, model, messages, timeout, **params):
+        try:
+            response = self.client.post("/chat/completions", timeout=timeout,
+                                        json={"model": model, "messages": messages, **params})
+        except httpx.TransportError as e:
+            raise RetryableLLMError(str(e)) from e
+        self._check(response, model, response.text)
+        return response.json()["choices"][0]["message"]["content"]
+
+    def complete(self, model, messages, timeout, **params):
+        if self.batcher:
+            return self.batcher.submit(model, messages, timeout, **params)
+        return self._complete(model, messages, timeout, **params)
+
+    def stream(self, model, messages, timeout, **params):
+        """Yield content deltas from the server's SSE stream (not batched)"""
+        try:
+            with self.client.stream("POST", "/chat/completions", timeout=timeout,
+                                    json={"model": model, "messages": messages, "stream": True, **params}) as response:
+                if response.status_code >= 400:
+                    self._check(response, model, response.read().decode("utf-8", "replace"))
+                for line in response.iter_lines():
+                    try:
+                        content = self._stream_pieces(line)
+                    except StopIteration:
+                        break
+                    if content:
+                        yield content
+        except httpx.TransportError as e:
+            raise RetryableLLMError(str(e)) from e
+
+    async def acomplete(self, model, messages, timeout, **params):
+        """Async request; concurrent coroutines already reach the server as a burst, so not batched"""
+        try:
+            response = await self.async_client.post("/chat/completions", timeout=timeout,
+                                                    json={"model": model, "messages": messages, **params})
+        except httpx.TransportError as e:
+            raise RetryableLLMError(str(e)) from e
+        self._check(response, model, response.text)
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def astream(self, model, messages, timeout, **params):
+        try:
+            async with self.async_client.stream("POST", "/chat/completions", timeout=timeout,
+                                                json={"model": model, "messages": messages, "stream": True,
+                                                      **params}) as response:
+                if response.status_code >= 400:
+                    self._check(response, model, (await response.aread()).decode("utf-8", "replace"))
+                async for line in response.aiter_lines():
+                    try:
+                        content = self._stream_pieces(line)
+                    except StopIteration:
+                        break
+                    if content:
+                        yield content
+        except httpx.TransportError as e:
+            raise RetryableLLMError(str(e)) from e
+
+
+BACKENDS = {
+    "groq": GroqBackend,
+    "local": OpenAICompatibleBackend,
+    "fake": FakeBackend
+}
+
+
+def slot_model(slot, default):
+    """
+    Model for a named slot (chat_a, vision, analysis, ...), overridable with
+    LLM_MODEL_<SLOT>. A "<backend>:" prefix, e.g. "local:llama3", sends the
+    slot to another backend than LLM_BACKEND.
+    """
+    return os.getenv(f"LLM_MODEL_{slot.upper()}", default)
+
+
+class LLMGateway:
+    """
+    Shared entry point for chat completions.
+
+    Every call runs under the provider rate limiter and an overall deadline.
+    Retryable failures back off exponentially with full jitter (or for the
+    provider's Retry-After), and if `hedge_after` is set a second identical
+    request is sent when the first has not answered within that many seconds;
+    whichever finishes first wins.
+
+    Models are sent to `backend` unless prefixed with the name of one of
+    `routes` ({name: (backend, limiter)}), e.g. "local:llama3".
+    """
+
+    def __init__(self, backend, limiter=None, timeout=60.0, max_retries=4,
+                 base_delay=1.0, max_delay=30.0, hedge_after=None, hedge_workers=8, routes=None):
+        self.backend = backend
+        self.limiter = limiter
+        self.routes = routes or {}
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self._hedge_pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="llm-hedge")
+
+    @classmethod
+    def from_env(cls):
+        max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+        max_keepalive = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+        default_backend = os.getenv("LLM_BACKEND", "groq")
+        # Groq clients do not connect until used, so that route is always registered
+        routes = {
+            "groq": (GroqBackend(max_connections=max_connections, max_keepalive=max_keepalive),
+                     RateLimiter.from_env("GROQ")),
+            "fake": (FakeBackend(latency=float(os.getenv("LLM_FAKE_LATENCY", "0"))), None)
+        }
+        # The local backend starts a batcher thread, so it is only built when something uses it
+        uses_local = default_backend == "local" or os.getenv("LOCAL_LLM_BASE_URL") or any(
+            value.startswith("local:") for name, value in os.environ.items() if name.startswith("LLM_MODEL_")
+        )
+        if uses_local:
+            routes["local"] = (OpenAICompatibleBackend(
+                os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:11434/v1"),
+                api_key=os.getenv("LOCAL_LLM_API_KEY"),
+                max_connections=max_connections,
+                max_keepalive=max_keepalive,
+                batch_window=float(os.getenv("LOCAL_LLM_BATCH_WINDOW", "0.01")),
+                max_batch=int(os.getenv("LOCAL_LLM_MAX_BATCH", "8")),
+                prefix_chars=int(os.getenv("LOCAL_LLM_PREFIX_CHARS", "512")),
+                leader_wait=float(os.getenv("LOCAL_LLM_LEADER_WAIT", "0.5"))
+            ), None)
+        backend, limiter = routes[default_backend]
+        hedge_after = os.getenv("LLM_HEDGE_AFTER")
+        return cls(
+            backend,
+            limiter=limiter,
+            timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+            hedge_after=float(hedge_after) if hedge_after else None,
+            routes=routes
+        )
+
+    def _resolve(self, model):
+        """(backend, limiter, model name) for a possibly "<backend>:"-prefixed model"""
+        prefix, _, name = model.partition(":")
+        if name and prefix in self.routes:
+            backend, limiter = self.routes[prefix]
+            return backend, limiter, name
+        return self.backend, self.limiter, model
+
+    def _backoff(self, attempt, error):
+        if error.retry_after:
+            return error.retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _hedged(self, backend, limiter, model, messages, timeout, cost, hedge_after, params):
+        first = self._hedge_pool.submit(backend.complete, model, messages, timeout, **params)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        # Only hedge if the quota allows it right now
+        if limiter and not limiter.acquire(cost, timeout=0):
+            return first.result()
+        logging.info(f"Hedging {model} request after {hedge_after:.1f}s")
+        second = self._hedge_pool.submit(backend.complete, model, messages,
+                                         max(0.1, timeout - hedge_after), **params)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @staticmethod
+    def _cost(messages, params):
+        return sum(estimate_tokens(str(message.get("content", ""))) for message in messages)\
+            + (params.get("max_tokens") or 0)
+
+    def _retry_delay(self, model, attempt, max_retries, deadline, error, limiter, started=False):
+        """
+        Seconds to wait before retrying after `error`, or re-raise it when out
+        of attempts or time (or once a stream has started). After a 429 the
+        shared limiter is penalized instead, and the next acquire waits it out.
+        """
+        delay = self._backoff(attempt, error)
+        if started or attempt == max_retries or time.monotonic() + delay >= deadline:
+            raise error
+        logging.warning(f"{model} request failed ({error.status or 'connection'}), "
+                        f"retrying in {delay:.1f}s (attempt {attempt + 1})")
+        if error.status == 429 and limiter:
+            # Holds back every caller; the next acquire() waits it out
+            limiter.penalize(delay)
+            return 0
+        return delay
+
+    def complete(self, messages, model, timeout=None, max_retries=None, hedge_after=None, **params):
+        """
+        Return the completion text for `messages`. `timeout` is the deadline
+        for the whole call, retries included. Extra params (temperature,
+        max_tokens, ...) are passed to the backend.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        hedge_after = self.hedge_after if hedge_after is None else hedge_after
+        backend, limiter, model = self._resolve(model)
+        cost = self._cost(messages, params)
+
+        for attempt in range(max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (limiter and not limiter.acquire(cost, timeout=remaining)):
+                raise LLMDeadlineExceeded(f"{model} request did not finish within its deadline")
+            remaining = deadline - time.monotonic()
+            try:
+                if hedge_after and hedge_after < remaining:
+                    return self._hedged(backend, limiter, model, messages, remaining, cost, hedge_after, params)
+                return backend.complete(model, messages, remaining, **params)
+            except RetryableLLMError as e:
+                time.sleep(self._retry_delay(model, attempt, max_retries, deadline, e, limiter))
+
+    def stream(self, messages, model, timeout=None, max_retries=None, **params):
+        """
+        Yield the completion for `messages` in pieces as the model produces
+        them. Failures before the first piece are retried like complete();
+        once text has been yielded an error is raised to the caller, since a
+        retry would repeat what was already sent. Not hedged.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        backend, limiter, model = self._resolve(model)
+        cost = self._cost(messages, params)
+
+        for attempt in range(max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (limiter and not limiter.acquire(cost, timeout=remaining)):
+                raise LLMDeadlineExceeded(f"{model} request did not finish within its deadline")
+            started = False
+            try:
+                for piece in backend.stream(model, messages, deadline - time.monotonic(), **params):
+                    started = True
+                    yield piece
+                return
+            except RetryableLLMError as e:
+                time.sleep(self._retry_delay(model, attempt, max_retries, deadline, e, limiter, started))
+
+    async def acomplete(self, messages, model, timeout=None, max_retries=None, **params):
+        """
+        complete() for asyncio callers: waiting on the limiter, the backend
+        and backoff does not hold a thread. Not hedged.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        backend, limiter, model = self._resolve(model)
+        cost = self._cost(messages, params)
+
+        for attempt in range(max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (limiter and not await limiter.acquire_async(cost, timeout=remaining)):
+                raise LLMDeadlineExceeded(f"{model} request did not finish within its deadline")
+            try:
+                return await backend.acomplete(model, messages, deadline - time.monotonic(), **params)
+            except RetryableLLMError as e:
+                await asyncio.sleep(self._retry_delay(model, attempt, max_retries, deadline, e, limiter))
+
+    async def astream(self, messages, model, timeout=None, max_retries=None, **params):
+        """stream() for asyncio callers, with the same retry rules"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        backend, limiter, model = self._resolve(model)
+        cost = self._cost(messages, params)
+
+        for attempt in range(max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (limiter and not await limiter.acquire_async(cost, timeout=remaining)):
+                raise LLMDeadlineExceeded(f"{model} request did not finish within its deadline")
+            started = False
+            try:
+                async for piece in backend.astream(model, messages, deadline - time.monotonic(), **params):
+                    started = True
+                    yield piece
+                return
+            except RetryableLLMError as e:
+                await asyncio.sleep(self._retry_delay(model, attempt, max_retries, deadline, e, limiter, started))
+
+
+llm_gateway = LLMGateway.from_env()
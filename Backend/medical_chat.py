@@ -1,20 +1,44 @@
 import os
+import time
+import hashlib
 import logging
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from io import BytesIO
 from supabase_client import supabase
-from groq import Groq
+from llm_gateway import llm_gateway, slot_model
+from analysis_cache import image_cache
+from stage_graph import StageGraph
+from chat_context import build_chat_context
+from semantic_cache import semantic_cache
+from metrics import metrics, timed, log_payload, payload_size
+from specialist_classifier import classify_specialist, routing_metrics
 
-os.environ["GROQ_API_KEY"] = <GROQ_API_KEY>
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-print(os.getenv("GROQ_API_KEY"))
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-model_a=model_b=model_c=model_d=model_e="llama-3.3-70b-versatile"
-img_model = "llama-3.2-90b-vision-preview"
-default_model = "mixtral-8x7b-32678"
+# Each slot can be pointed at another model or backend with LLM_MODEL_<SLOT>, e.g. "local:llama3"
+model_a = slot_model("chat_a", "llama-3.3-70b-versatile")
+model_b = slot_model("chat_b", "llama-3.3-70b-versatile")
+model_c = slot_model("chat_c", "llama-3.3-70b-versatile")
+model_d = slot_model("chat_d", "llama-3.3-70b-versatile")
+model_e = slot_model("chat_e", "llama-3.3-70b-versatile")
+img_model = slot_model("vision", "llama-3.2-90b-vision-preview")
+default_model = slot_model("chat_default", "mixtral-8x7b-32678")
+routing_model = slot_model("routing", default_model)
+
+# How long a cached URL -> image mapping is trusted before its ETag is rechecked
+IMAGE_URL_FRESH_SECONDS = float(os.getenv("IMAGE_URL_FRESH_SECONDS", "300"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "30"))
+# Largest image downloaded directly; bigger ones are abandoned part way
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+# Only public objects of our own Supabase storage are fetched over plain HTTP
+SUPABASE_STORAGE_PREFIX = f"{(os.getenv('SUPABASE_URL') or '').rstrip('/')}/storage/v1/object/public/"
+
+# Runs the independent preparation stages (image analysis, routing) of chat requests
+stage_pool = ThreadPoolExecutor(max_workers=int(os.getenv("CHAT_STAGE_WORKERS", "8")),
+                                thread_name_prefix="chat-stage")
 
 
 # client = Groq(
@@ -37,32 +61,22 @@ def groq_chat_completion(model, messages):
     Send a request to Groq API for chat completion
     """
     try:
-        # Log the request for debugging
-        logging.info("\n" + "="*50)
-        logging.info("GROQ API REQUEST:")
-        logging.info(f"Model: {model}")
-        logging.info("Messages:")
-        for msg in messages:
-            logging.info(f"Role: {msg['role']}")
-            logging.info(f"Content: {msg['content'][:200]}...")  # Truncate long content
-        
+        log_payload("llm_request", model=model, messages=len(messages), chars=payload_size(messages))
+
         # Create the completion with exact format
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": msg["role"],
-                    "content": msg["content"],
-                } for msg in messages
-            ],
-            model=model
-        )
-        
-        # Log the response
-        logging.info("\nGROQ API RESPONSE:")
-        logging.info(chat_completion.choices[0].message.content[:200] + "...")
-        logging.info("="*50)
-        
-        return chat_completion.choices[0].message.content
+        with timed("llm_completion", model=model):
+            content = llm_gateway.complete(
+                [
+                    {
+                        "role": msg["role"],
+                        "content": msg["content"],
+                    } for msg in messages
+                ],
+                model=model
+            )
+
+        log_payload("llm_response", model=model, chars=payload_size(content))
+        return content
         
     except Exception as e:
         logging.error(f"Error calling Groq API: {str(e)}")
@@ -94,14 +108,44 @@ def analyze_medical_image(image, image_url):
         logging.error(f"Error analyzing image: {str(e)}")
         return None
 
-def get_image_from_supabase(img_url):
+class LazyImage:
+    """Downloaded image bytes; decoded with PIL only when `.image` is first used"""
+
+    def __init__(self, data):
+        self.data = data
+        self._image = None
+
+    @property
+    def content_hash(self):
+        return hashlib.sha256(self.data).hexdigest()
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = Image.open(BytesIO(self.data))
+        return self._image
+
+
+def get_image_from_supabase(img_url, etag=None):
     """
-    Fetch image from Supabase storage if URL is valid
+    Fetch an image from Supabase storage if URL is valid.
+    Returns (LazyImage or None, etag, not_modified); with `etag` the request is
+    conditional and an unchanged object is not downloaded again.
     """
+    if img_url == "NA" or not img_url:
+        return None, None, False
+    with timed("image_fetch"):
+        return _fetch_image(img_url, etag)
+
+
+def _fetch_image(img_url, etag):
+    if os.getenv("SUPABASE_URL") and img_url.startswith(SUPABASE_STORAGE_PREFIX):
+        try:
+            return _fetch_storage_url(img_url, etag)
+        except Exception as e:
+            logging.warning(f"Direct image fetch failed, using the storage API: {str(e)}")
+
     try:
-        if img_url == "NA" or not img_url:
-            return None
-            
         # Extract path from Supabase URL
         path = img_url.split('/public/')[1]
         bucket = path.split('/')[0]
@@ -110,12 +154,78 @@ def get_image_from_supabase(img_url):
         # Get image from Supabase storage
         response = supabase.storage.from_(bucket).download(file_path)
         if response:
-            return Image.open(BytesIO(response))
-        return None
+            return LazyImage(response), None, False
+        return None, None, False
     except Exception as e:
         logging.error(f"Error fetching image from Supabase: {str(e)}")
+        return None, None, False
+
+
+def _fetch_storage_url(img_url, etag):
+    """Conditional, size-capped download of a public storage object; no redirects are followed"""
+    headers = {"If-None-Match": etag} if etag else {}
+    with requests.get(img_url, headers=headers, timeout=IMAGE_FETCH_TIMEOUT,
+                      stream=True, allow_redirects=False) as response:
+        if response.status_code == 304:
+            return None, etag, True
+        if response.status_code != 200:
+            raise ValueError(f"Storage returned {response.status_code}")
+        if int(response.headers.get("Content-Length") or 0) > IMAGE_MAX_BYTES:
+            raise ValueError(f"Image larger than {IMAGE_MAX_BYTES} bytes")
+        data = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            data.extend(chunk)
+            if len(data) > IMAGE_MAX_BYTES:
+                raise ValueError(f"Image larger than {IMAGE_MAX_BYTES} bytes")
+        return LazyImage(bytes(data)), response.headers.get("ETag"), False
+
+
+def fetch_chat_image(img_url):
+    """
+    Fetch stage of image analysis. Returns (cached analysis, image, etag):
+    a URL seen in the last IMAGE_URL_FRESH_SECONDS is not fetched at all, and
+    after that it is revalidated by ETag; only new content is downloaded.
+    """
+    url_key = f"image_url:{img_url}"
+    entry = image_cache.get(url_key)
+    if entry:
+        analysis = image_cache.get(f"image_analysis:{entry['content_hash']}")
+        if analysis and time.time() - entry["checked_at"] < IMAGE_URL_FRESH_SECONDS:
+            logging.info("Image analysis served from cache")
+            return analysis, None, None
+        image, etag, not_modified = get_image_from_supabase(img_url, entry["etag"] if analysis else None)
+        if not_modified:
+            image_cache.set(url_key, {**entry, "checked_at": time.time()})
+            logging.info("Image unchanged, analysis served from cache")
+            return analysis, None, None
+    else:
+        image, etag, _ = get_image_from_supabase(img_url)
+    return None, image, etag
+
+
+def analyze_chat_image(img_url, fetched):
+    """Vision stage: analysis of a fetched image, looked up by content hash before the model is asked"""
+    analysis, image, etag = fetched
+    if analysis is not None:
+        return analysis
+    if image is None:
         return None
 
+    content_hash = image.content_hash
+    analysis = image_cache.get(f"image_analysis:{content_hash}")
+    if analysis is None:
+        analysis = analyze_medical_image(image, img_url)
+        if not analysis:
+            return None
+        image_cache.set(f"image_analysis:{content_hash}", analysis)
+    image_cache.set(f"image_url:{img_url}", {"etag": etag, "content_hash": content_hash, "checked_at": time.time()})
+    return analysis
+
+
+def get_image_analysis(img_url):
+    """Analysis of the image at img_url, reusing earlier results"""
+    return analyze_chat_image(img_url, fetch_chat_image(img_url))
+
 def get_image_from_url(img_url):
     """Fetch and process image from URL"""
     try:
@@ -131,8 +241,18 @@ def get_image_from_url(img_url):
 
 def determine_specialist_and_prompt(user_input, conversation, image_analysis=None):
     """
-    Determine specialist and generate appropriate prompt based on the query
+    Determine specialist and generate appropriate prompt based on the query.
+    The local classifier answers confident queries; the LLM is asked otherwise.
+    Only the query text is used, so this can run before the image analysis is ready.
     """
+    with timed("specialist_classifier"):
+        category, confidence = classify_specialist(user_input)
+    if category:
+        routing_metrics.record("classifier")
+        logging.info(f"➤ Classifier routed to {category} (confidence {confidence:.2f})")
+        return category, None
+
+    routing_metrics.record("llm_fallback")
     try:
         content = """You are a medical query classifier.
         Analyze this medical query, conversation history, and any image analysis.
@@ -158,42 +278,64 @@ def determine_specialist_and_prompt(user_input, conversation, image_analysis=Non
             }
         ]
         
-        classification = groq_chat_completion(default_model, messages)
+        classification = groq_chat_completion(routing_model, messages)
         
         # Parse response
         category = classification.split('\n')[0].split(': ')[1].strip() if classification else "DEFAULT"
+        if not classification:
+            routing_metrics.record("llm_failed")
         
         return category, None
 
     except Exception as e:
         logging.error(f"Error in specialist determination: {str(e)}")
+        routing_metrics.record("llm_failed")
         return "DEFAULT", None
 
-def medical_assistant(user_input, conversation, option="", img_url=None):
-    """Process user input with dynamic routing and prompt generation"""
+def prepare_chat_stages(user_input, conversation, option="", img_url=None, session_id=None):
+    """
+    Run image analysis (fetch, then vision), specialist routing and
+    conversation context building concurrently.
+    Returns (image_analysis, option, custom_prompt, context, timings).
+    """
+    graph = StageGraph()
+    graph.add("context", lambda: build_chat_context(conversation, session_id))
+    if img_url and img_url != "NA":
+        graph.add("image_fetch", lambda: fetch_chat_image(img_url))
+        graph.add("image_analysis", lambda image_fetch: analyze_chat_image(img_url, image_fetch),
+                  depends_on=("image_fetch",))
+    if not option:
+        graph.add("routing", lambda: determine_specialist_and_prompt(user_input, conversation))
+    results, timings = graph.run(stage_pool)
+    for stage, timing in timings.items():
+        if stage != "total":
+            metrics.observe("stage_seconds", timing["seconds"], stage=f"chat_{stage}")
+
+    image_analysis = results.get("image_analysis")
+    if image_analysis:
+        logging.info("Image analysis completed")
+    custom_prompt = None
+    if "routing" in results:
+        option, custom_prompt = results["routing"]
+        logging.info(f"➤ Auto-determined Category: {option}")
+    return image_analysis, option, custom_prompt, results["context"], timings
+
+def build_chat_request(user_input, conversation, option="", img_url=None, session_id=None):
+    """
+    Route the query and build the prompt for it.
+    Returns (model, messages, category, stage_timings) for the answer call.
+    """
     
-    logging.info("\nMedical Assistant Processing:")
-    logging.info(f"➤ User Input: {user_input}")
+    log_payload("chat_request", chars=payload_size(user_input), history=len(conversation or []),
+                image=bool(img_url and img_url != "NA"), option=option or None)
     
     # Initialize variables
     current_model = default_model
-    image_analysis = None
-
-    # Process image if provided
-    if img_url and img_url != "NA":
-        image = get_image_from_supabase(img_url)
-        if image:
-            image_analysis = analyze_medical_image(image,img_url)
-            logging.info("Image analysis completed")
 
-    # Determine specialist and prompt if no option specified
-    if not option:
-        option, custom_prompt = determine_specialist_and_prompt(
-            user_input, 
-            conversation, 
-            image_analysis
-        )
-        logging.info(f"➤ Auto-determined Category: {option}")
+    # Image analysis and specialist routing (if no option specified) run in parallel
+    image_analysis, option, custom_prompt, context, timings = prepare_chat_stages(
+        user_input, conversation, option, img_url, session_id
+    )
     
     # Select model based on option
     if option == 'A':
@@ -358,15 +500,8 @@ Limitations:
     Assistant: Let me help you while remembering this is not a substitute for professional medical advice.
     """
 
-    try:
-        # Process conversation history
-        context = "No previous context." if not conversation else "\n".join(
-            f"{msg.get('sender', 'unknown')}: {str(msg.get('text', ''))}" 
-            for msg in conversation
-        )
-
-        # Format the content to include both system and user information
-        combined_content = f"""System: {BOT_PROMPT}
+    # Format the content to include both system and user information
+    combined_content = f"""System: {BOT_PROMPT}
 
 Previous conversation context:
 {context}
@@ -375,20 +510,62 @@ User Query: {user_input}
 
 Please provide a response following the above guidelines while remembering this is not a substitute for professional medical advice."""
 
-        # Create single message with combined content
-        messages = [
-            {
-                "role": "user",
-                "content": combined_content
-            }
-        ]
+    # Create single message with combined content
+    messages = [
+        {
+            "role": "user",
+            "content": combined_content
+        }
+    ]
+    return current_model, messages, option, timings
+
+def is_standalone_query(conversation, img_url):
+    """Questions without history or image, whose answers can be shared through the semantic cache"""
+    return not conversation and not (img_url and img_url != "NA")
+
+def medical_assistant(user_input, conversation, option="", img_url=None, session_id=None):
+    """Process user input with dynamic routing and prompt generation"""
+    try:
+        current_model, messages, category, _ = build_chat_request(user_input, conversation, option, img_url, session_id)
+
+        cacheable = is_standalone_query(conversation, img_url)
+        if cacheable:
+            cached = semantic_cache.lookup(user_input, category)
+            if cached:
+                return cached
 
         # Make API call to Groq
         response = groq_chat_completion(current_model, messages)
+        if cacheable:
+            semantic_cache.store(user_input, category, response)
         return response
 
     except Exception as e:
         logging.error(f"Error in medical_assistant: {str(e)}")
         return "I apologize, but I'm having trouble processing your request. Please try again."
-    
 
+def medical_assistant_stream(user_input, conversation, option="", img_url=None, session_id=None,
+                             stage_timings=None):
+    """
+    Like medical_assistant, but yields the answer in pieces as the model
+    produces them. Routing and image analysis still finish before the first
+    piece; their timings are copied into `stage_timings` if a dict is given.
+    """
+    current_model, messages, category, timings = build_chat_request(user_input, conversation, option, img_url, session_id)
+    if stage_timings is not None:
+        stage_timings.update(timings)
+
+    cacheable = is_standalone_query(conversation, img_url)
+    if cacheable:
+        cached = semantic_cache.lookup(user_input, category)
+        if cached:
+            yield cached
+            return
+
+    logging.info(f"Streaming {current_model} response")
+    pieces = []
+    for piece in llm_gateway.stream(messages, model=current_model):
+        pieces.append(piece)
+        yield piece
+    if cacheable:
+        semantic_cache.store(user_input, category, "".join(pieces))
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+# Share of payload events written to the log
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+# Histogram bucket bounds in seconds, from sub-millisecond classification to minute-long completions
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+METRIC_PREFIX = "healix_"
+
+payload_logger = logging.getLogger("healix.payload")
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    """
+    In-process counters and latency histograms, rendered in the Prometheus
+    text exposition format. Each metric is identified by name and labels.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1, help_text=None, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def observe(self, name, value, help_text=None, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def render(self):
+        """All metrics in Prometheus text format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = METRIC_PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} counter")
+                for key, value in series.items():
+                    lines.append(f"{full}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                full = METRIC_PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, histogram in series.items():
+                    for bound, count in zip(self.buckets, histogram["buckets"]):
+                        lines.append(f"{full}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{full}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {histogram['sum']:.6f}")
+                    lines.append(f"{full}_count{_format_labels(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def timed(stage, **labels):
+    """
+    Record how long the block takes in the stage_seconds histogram, and count
+    it in stage_errors_total if it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.increment("stage_errors_total", help_text="Pipeline stages that raised", stage=stage, **labels)
+        raise
+    finally:
+        metrics.observe("stage_seconds", time.perf_counter() - start,
+                        help_text="Pipeline stage latency in seconds", stage=stage, **labels)
+
+
+def timed_stage(stage):
+    """Decorator form of timed()"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def payload_size(value):
+    """Characters in a string, message list or JSON-serialisable value"""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, list) and all(isinstance(item, dict) and "content" in item for item in value):
+        return sum(len(str(item["content"])) for item in value)
+    return len(json.dumps(value, default=str))
+
+
+def log_payload(event, sample_rate=None, **fields):
+    """
+    Write a sampled one-line JSON record about a payload (sizes, counts,
+    model names), never its contents. Every call is counted in payloads_total.
+    """
+    metrics.increment("payloads_total", help_text="Payload events seen", event=event)
+    if random.random() >= (LOG_SAMPLE_RATE if sample_rate is None else sample_rate):
+        return
+    payload_logger.info(json.dumps({"event": event, **fields}, default=str))
@@ -0,0 +1,164 @@
+import math
+import random
+import numpy as np
+
+
+class KLLSketch:
+    """
+    KLL streaming quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Values are buffered in a hierarchy of compactors; an item at level h stands
+    for 2**h input values. When a level fills up it is sorted and every other
+    item (random offset) is promoted to the next level. Memory stays at
+    O(k log(n/k)) floats regardless of stream length, and sketches built on
+    separate batches can be merged.
+
+    Error bound: the normalized rank error of a quantile query is about
+    2.3 / k**0.97 with high probability (about 1.3% of n for the default
+    k=200), so a reported median lies between the true 48.7th and 51.3rd
+    percentiles. `rank_error()` returns this bound for the sketch's k.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self._random = random.Random(seed)
+
+    def rank_error(self):
+        return 2.296 / self.k ** 0.9723
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        """Add a value or an array of values; NaNs are ignored"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.count += int(values.size)
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if items.size >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind at this level
+                keep = items[-1:] if items.size % 2 else items[:0]
+                paired = items[:items.size - keep.size]
+                promoted = paired[self._random.randint(0, 1)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._compress()
+        return self
+
+    def _weighted(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(items.size, 2 ** level, dtype=np.float64)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def quantiles(self, fractions):
+        """Approximate values at the given fractions in [0, 1]"""
+        if self.count == 0:
+            return [math.nan for _ in fractions]
+        values, cumulative = self._weighted()
+        total = cumulative[-1]
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.minimum)
+            elif fraction >= 1:
+                results.append(self.maximum)
+            else:
+                position = min(np.searchsorted(cumulative, fraction * total), values.size - 1)
+                results.append(float(values[position]))
+        return results
+
+    def quantile(self, fraction):
+        return self.quantiles([fraction])[0]
+
+    def rank(self, value, inclusive=True):
+        """Approximate fraction of values <= `value` (< when inclusive=False)"""
+        if self.count == 0:
+            return math.nan
+        values, cumulative = self._weighted()
+        side = "right" if inclusive else "left"
+        position = np.searchsorted(values, value, side=side)
+        return float(cumulative[position - 1] / cumulative[-1]) if position else 0.0
+
+    def to_dict(self):
+        return {
+            "k": self.k,
+            "count": self.count,
+            "min": self.minimum if self.count else None,
+            "max": self.maximum if self.count else None,
+            "levels": [items.tolist() for items in self.levels]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(k=data["k"])
+        sketch.count = data["count"]
+        sketch.minimum = data["min"] if data["min"] is not None else math.inf
+        sketch.maximum = data["max"] if data["max"] is not None else -math.inf
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in data["levels"]] or [np.empty(0)]
+        return sketch
+
+
+def sketch_outliers(sketch, multiplier=1.5):
+    """
+    IQR outlier summary from a sketch, in the same shape as detect_outliers.
+    Counts are estimated from the ranks of the fences, so they carry the same
+    rank error (about rank_error() * total_count values).
+    """
+    q1, q3 = sketch.quantiles([0.25, 0.75])
+    iqr = q3 - q1
+    lower_bound = q1 - multiplier * iqr
+    upper_bound = q3 + multiplier * iqr
+    below = sketch.rank(lower_bound, inclusive=False)
+    above = 1 - sketch.rank(upper_bound, inclusive=True)
+    outlier_count = int(round((below + above) * sketch.count))
+    return {
+        "outlier_count": outlier_count,
+        "total_count": int(sketch.count),
+        "outlier_percentage": round(outlier_count / sketch.count * 100, 2) if sketch.count else 0.0,
+        "approximate": True
+    }
+
+
+def sketch_summary(sketch, multiplier=1.5):
+    """Median, quartiles and IQR outlier counts from a sketch"""
+    median, q1, q3 = sketch.quantiles([0.5, 0.25, 0.75])
+    return {
+        "median": round(median, 2),
+        "q1": round(q1, 2),
+        "q3": round(q3, 2),
+        "iqr": round(q3 - q1, 2),
+        "rank_error": round(sketch.rank_error(), 4),
+        "outliers": sketch_outliers(sketch, multiplier)
+    }
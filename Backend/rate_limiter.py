@@ -0,0 +1,110 @@
+import os
+import asyncio
+import threading
+import time
+import logging
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for an LLM provider quota.
+
+    Two buckets are kept: one for requests per minute and (optionally) one for
+    tokens per minute. Both refill continuously, so callers are admitted as soon
+    as the quota allows instead of waiting out a fixed sleep.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=0):
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute or 0)
+        self._request_allowance = self.requests_per_minute
+        self._token_allowance = self.tokens_per_minute
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix, default_rpm=30, default_tpm=0):
+        """Build a limiter from <PREFIX>_REQUESTS_PER_MINUTE / <PREFIX>_TOKENS_PER_MINUTE"""
+        rpm = float(os.getenv(f"{prefix}_REQUESTS_PER_MINUTE", default_rpm))
+        tpm = float(os.getenv(f"{prefix}_TOKENS_PER_MINUTE", default_tpm))
+        return cls(rpm, tpm)
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_allowance = min(
+            self.requests_per_minute,
+            self._request_allowance + elapsed * self.requests_per_minute / 60.0
+        )
+        if self.tokens_per_minute:
+            self._token_allowance = min(
+                self.tokens_per_minute,
+                self._token_allowance + elapsed * self.tokens_per_minute / 60.0
+            )
+
+    def _wait_time(self, now, tokens):
+        """Seconds until one request costing `tokens` fits in both buckets"""
+        wait = max(0.0, self._blocked_until - now)
+        if self._request_allowance < 1:
+            wait = max(wait, (1 - self._request_allowance) * 60.0 / self.requests_per_minute)
+        if self.tokens_per_minute and self._token_allowance < tokens:
+            wait = max(wait, (tokens - self._token_allowance) * 60.0 / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, tokens=0, timeout=None):
+        """
+        Block until a request costing `tokens` is within quota.
+        Returns False if `timeout` seconds pass first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=0, timeout=None):
+        """acquire() for asyncio callers: waits without blocking the event loop"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+
+    def _try_acquire(self, tokens):
+        """Take one request costing `tokens` if it fits; otherwise return the seconds to wait"""
+        if self.tokens_per_minute:
+            # A single request larger than the whole bucket is admitted when the bucket is full
+            tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._wait_time(now, tokens)
+            if wait <= 0:
+                self._request_allowance -= 1
+                if self.tokens_per_minute:
+                    self._token_allowance -= tokens
+            return wait
+
+    def penalize(self, retry_after):
+        """Hold back every caller for `retry_after` seconds after the provider returned 429"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        logging.warning(f"Rate limit hit, pausing requests for {retry_after:.1f}s")
+
+
+def estimate_tokens(text):
+    """Rough token count for quota accounting (about 4 characters per token)"""
+    return len(text) // 4 + 1
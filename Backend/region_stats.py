@@ -0,0 +1,310 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from health_records import flatten_records
+from quantile_sketch import KLLSketch, sketch_summary
+from table_analysis import iter_health_record_pages, fetch_region_row_count
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGION_STATS_DIR = os.getenv("REGION_STATS_DIR", os.path.join(BASE_DIR, "cache", "region_stats"))
+
+
+class MomentAccumulator:
+    """
+    Mergeable running moments over a growing set of numeric features.
+
+    Keeps, for every pair of features (i, j), the number of rows where both are
+    present, the mean and squared deviations of i over those rows, and the
+    co-moment of i and j. This is enough to reproduce pandas' pairwise-complete
+    mean/std/corr. Batches and other accumulators are combined with Chan's
+    parallel update of Welford's moments, so stats never need the raw rows again.
+    A KLL sketch per feature is kept alongside for medians, quartiles and
+    IQR outlier counts.
+    """
+
+    def __init__(self, features=()):
+        self.features = []
+        self._index = {}
+        size = 0
+        self.count = np.zeros((size, size))
+        self.mean = np.zeros((size, size))
+        self.m2 = np.zeros((size, size))
+        self.comoment = np.zeros((size, size))
+        self.minimum = np.zeros(size)
+        self.maximum = np.zeros(size)
+        self.sketches = {}
+        self._add_features(features)
+
+    def _add_features(self, features):
+        new = [feature for feature in features if feature not in self._index]
+        if not new:
+            return
+        old_size = len(self.features)
+        size = old_size + len(new)
+
+        def grow(matrix):
+            grown = np.zeros((size, size))
+            grown[:old_size, :old_size] = matrix
+            return grown
+
+        self.count, self.mean, self.m2, self.comoment = (
+            grow(self.count), grow(self.mean), grow(self.m2), grow(self.comoment)
+        )
+        self.minimum = np.concatenate([self.minimum, np.full(len(new), np.inf)])
+        self.maximum = np.concatenate([self.maximum, np.full(len(new), -np.inf)])
+        for feature in new:
+            self._index[feature] = len(self.features)
+            self.features.append(feature)
+
+    def update(self, df):
+        """Fold a DataFrame of numeric feature columns (NaN = missing) into the moments"""
+        if df.empty:
+            return self
+        batch = MomentAccumulator()
+        batch._add_features(df.columns)
+        values = df.to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        # Shift by the batch mean before forming sums to limit cancellation
+        filled = np.where(present, values, 0.0)
+        present_count = present.sum(axis=0)
+        shift = filled.sum(axis=0) / np.maximum(present_count, 1)
+        centered = np.where(present, values - shift, 0.0)
+        mask = present.astype(np.float64)
+
+        count = mask.T @ mask
+        sums = centered.T @ mask
+        squares = (centered ** 2).T @ mask
+        cross = centered.T @ centered
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, sums / count, 0.0)
+            batch.m2 = np.where(count > 0, squares - sums * mean, 0.0)
+            batch.comoment = np.where(count > 0, cross - sums * mean.T, 0.0)
+        batch.count = count
+        batch.mean = np.where(count > 0, mean + shift[:, None], 0.0)
+        batch.minimum = np.where(present, values, np.inf).min(axis=0)
+        batch.maximum = np.where(present, values, -np.inf).max(axis=0)
+        batch.sketches = {feature: KLLSketch().update(values[:, i]) for i, feature in enumerate(batch.features)}
+        return self.merge(batch)
+
+    def merge(self, other):
+        """Combine another accumulator (another batch, time window or region) into this one"""
+        self._add_features(other.features)
+        idx = np.array([self._index[feature] for feature in other.features], dtype=int)
+        if idx.size == 0:
+            return self
+        grid = np.ix_(idx, idx)
+
+        n_a = self.count[grid]
+        n_b = other.count
+        total = n_a + n_b
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.where(total > 0, n_a * n_b / total, 0.0)
+            delta = other.mean - self.mean[grid]
+            self.mean[grid] = np.where(total > 0, self.mean[grid] + delta * np.where(total > 0, n_b / total, 0.0), 0.0)
+        self.m2[grid] = self.m2[grid] + other.m2 + delta ** 2 * weight
+        self.comoment[grid] = self.comoment[grid] + other.comoment + delta * delta.T * weight
+        self.count[grid] = total
+        self.minimum[idx] = np.minimum(self.minimum[idx], other.minimum)
+        self.maximum[idx] = np.maximum(self.maximum[idx], other.maximum)
+        for feature, sketch in other.sketches.items():
+            if feature in self.sketches:
+                self.sketches[feature].merge(sketch)
+            else:
+                self.sketches[feature] = KLLSketch.from_dict(sketch.to_dict())
+        return self
+
+    @property
+    def total_rows(self):
+        return int(self.count.diagonal().max()) if self.features else 0
+
+    def statistics(self):
+        """Per-feature count/mean/std/min/max, shaped like DataFrame.agg(...).to_dict()"""
+        stats = {}
+        for i, feature in enumerate(self.features):
+            n = self.count[i, i]
+            if n == 0:
+                continue
+            sketch = self.sketches.get(feature)
+            stats[feature] = {
+                "count": int(n),
+                "mean": round(float(self.mean[i, i]), 2),
+                "median": round(sketch.quantile(0.5), 2) if sketch and sketch.count else None,
+                "std": round(float(np.sqrt(self.m2[i, i] / (n - 1))), 2) if n > 1 else None,
+                "min": round(float(self.minimum[i]), 2),
+                "max": round(float(self.maximum[i]), 2)
+            }
+        return stats
+
+    def quantiles(self, multiplier=1.5):
+        """Approximate median, quartiles and IQR outlier counts per feature"""
+        return {feature: sketch_summary(sketch, multiplier)
+                for feature, sketch in self.sketches.items() if sketch.count}
+
+    def correlations(self, min_periods=2):
+        """
+        Pairwise-complete Pearson correlations, shaped like DataFrame.corr().to_dict().
+        Undefined ones (a constant feature, fewer than min_periods rows) are None,
+        since NaN is not valid JSON.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = self.comoment / np.sqrt(self.m2 * self.m2.T)
+        corr[self.count < min_periods] = np.nan
+        corr = np.round(corr, 2)
+        return {
+            column: {row: float(corr[i, j]) if np.isfinite(corr[i, j]) else None
+                     for i, row in enumerate(self.features)}
+            for j, column in enumerate(self.features)
+        }
+
+    def to_arrays(self):
+        return {
+            "features": np.array(self.features, dtype=str),
+            "count": self.count, "mean": self.mean, "m2": self.m2,
+            "comoment": self.comoment, "minimum": self.minimum, "maximum": self.maximum,
+            "sketches": np.array(json.dumps({feature: sketch.to_dict() for feature, sketch in self.sketches.items()}))
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        acc = cls()
+        acc.features = [str(feature) for feature in arrays["features"]]
+        acc._index = {feature: i for i, feature in enumerate(acc.features)}
+        for name in ("count", "mean", "m2", "comoment", "minimum", "maximum"):
+            setattr(acc, name, np.array(arrays[name], dtype=np.float64))
+        if "sketches" in arrays:
+            acc.sketches = {feature: KLLSketch.from_dict(data)
+                            for feature, data in json.loads(str(arrays["sketches"])).items()}
+        return acc
+
+
+def numeric_features(df):
+    """Numeric columns of a flattened records frame, with boolean columns as 0/1"""
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            columns[column] = series.astype(np.float64)
+        elif series.dtype == object:
+            non_null = series.dropna()
+            if len(non_null) and non_null.map(lambda value: isinstance(value, (bool, np.bool_))).all():
+                columns[column] = series.map(lambda value: np.nan if value is None else float(value))
+    return pd.DataFrame(columns, index=df.index)
+
+
+class RegionStatsStore:
+    """Persists one accumulator per region (plus its updated_at watermark) as .npz files"""
+
+    def __init__(self, directory=REGION_STATS_DIR):
+        self.directory = directory
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def lock(self, region_id):
+        with self._locks_guard:
+            return self._locks.setdefault(region_id, threading.Lock())
+
+    def _path(self, region_id):
+        safe = re.sub(r"[^A-Za-z0-9_-]", "_", str(region_id))[:40]
+        digest = hashlib.sha1(str(region_id).encode("utf-8")).hexdigest()[:10]
+        return os.path.join(self.directory, f"{safe}-{digest}.npz")
+
+    def load(self, region_id):
+        """Return (accumulator, metadata) for a region, or (None, None) if nothing is stored"""
+        path = self._path(region_id)
+        if not os.path.exists(path):
+            return None, None
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        metadata = json.loads(str(arrays.pop("metadata")))
+        return MomentAccumulator.from_arrays(arrays), metadata
+
+    def save(self, region_id, accumulator, metadata):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(region_id)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, metadata=np.array(json.dumps(metadata)), **accumulator.to_arrays())
+        os.replace(tmp_path, path)
+
+
+region_stats_store = RegionStatsStore()
+
+
+def refresh_region_stats(region_id):
+    """
+    Bring a region's stored accumulator up to date and return it.
+
+    Only records updated since the stored watermark are fetched. New records are
+    folded in; if an already counted record was edited, its old contribution
+    cannot be subtracted, so the region is rebuilt from scratch. Deletions do
+    not show up in that fetch, so the number of rows counted is checked against
+    the region's current row count, and the region is rebuilt when they differ
+    either way (fewer rows counted means an insert was missed by the fetch).
+    """
+    with region_stats_store.lock(region_id):
+        accumulator, metadata = region_stats_store.load(region_id)
+        watermark = metadata.get("updated_at") if metadata else None
+        if accumulator is not None and accumulator.total_rows and not accumulator.sketches:
+            # Stored before quantile sketches were kept; they need every row again
+            return _rebuild_region_stats(region_id)
+        if accumulator is not None and "rows" not in metadata:
+            # Stored before row counts were kept, so deletions cannot be detected
+            return _rebuild_region_stats(region_id)
+        current_rows = fetch_region_row_count(region_id)
+        batch = MomentAccumulator()
+        latest = watermark
+        rows = metadata["rows"] if metadata else 0
+        rebuild = False
+
+        for page in iter_health_record_pages(region_id, extra_columns=("created_at", "updated_at"),
+                                             updated_since=watermark):
+            for record in page:
+                if watermark and record.get("created_at") and record["created_at"] <= watermark:
+                    rebuild = True
+                if record.get("updated_at") and (latest is None or record["updated_at"] > latest):
+                    latest = record["updated_at"]
+            if rebuild:
+                break
+            rows += len(page)
+            frame = flatten_page(page)
+            batch.update(numeric_features(frame))
+
+        if rebuild:
+            logging.info(f"Records edited in region {region_id}, rebuilding statistics")
+            return _rebuild_region_stats(region_id)
+        if current_rows is not None and rows != current_rows:
+            logging.info(f"Region {region_id} has {current_rows} records but {rows} were counted "
+                         f"(deleted or missed records), rebuilding statistics")
+            return _rebuild_region_stats(region_id)
+
+        if accumulator is None:
+            accumulator = batch
+        else:
+            accumulator.merge(batch)
+        region_stats_store.save(region_id, accumulator, {"updated_at": latest, "rows": rows})
+        return accumulator
+
+
+def _rebuild_region_stats(region_id):
+    accumulator = MomentAccumulator()
+    latest = None
+    rows = 0
+    for page in iter_health_record_pages(region_id, extra_columns=("updated_at",)):
+        for record in page:
+            if record.get("updated_at") and (latest is None or record["updated_at"] > latest):
+                latest = record["updated_at"]
+        rows += len(page)
+        accumulator.update(numeric_features(flatten_page(page)))
+    region_stats_store.save(region_id, accumulator, {"updated_at": latest, "rows": rows})
+    return accumulator
+
+
+def flatten_page(page):
+    """Flatten one fetched page, dropping the bookkeeping columns"""
+    records = [{key: value for key, value in record.items()
+                if key not in ("id", "created_at", "updated_at")} for record in page]
+    return flatten_records(records)
@@ -0,0 +1,171 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", os.path.join(BASE_DIR, "cache", "semantic_cache"))
+# Cosine similarity a cached question must reach to be reused
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+COLLECTION_NAME = "chat_answers"
+
+
+def _parse_thresholds(value):
+    """'D=0.96,E=0.95' -> {'D': 0.96, 'E': 0.95}"""
+    thresholds = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        category, threshold = item.split("=")
+        thresholds[category.strip()] = float(threshold)
+    return thresholds
+
+
+# Stricter matching for drug safety answers, where a near miss ("in CKD" vs "in
+# pregnancy") changes the answer
+CATEGORY_THRESHOLDS = _parse_thresholds(os.getenv("SEMANTIC_CACHE_THRESHOLDS", "D=0.96"))
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+class SemanticCache:
+    """
+    Answers to standalone chat questions, looked up by embedding similarity.
+
+    Questions are embedded on the CPU with chromadb's default ONNX MiniLM
+    model and stored in a persistent chromadb collection with the answer and
+    category as metadata. A lookup only matches entries of the same specialist
+    category at or above that category's threshold. Entries expire after `ttl`
+    and the least recently used ones are evicted beyond `max_entries`.
+    chromadb is imported on first use; if it is missing the cache stays off.
+    """
+
+    def __init__(self, path, enabled=True, threshold=0.92, category_thresholds=None,
+                 ttl=7 * 24 * 3600, max_entries=5000):
+        self.path = path
+        self.enabled = enabled
+        self.threshold = threshold
+        self.category_thresholds = category_thresholds or {}
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._collection = None
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    @property
+    def collection(self):
+        with self._lock:
+            if self._collection is None and self.enabled:
+                try:
+                    import chromadb
+                    from chromadb.utils import embedding_functions
+                    client = chromadb.PersistentClient(path=self.path)
+                    self._collection = client.get_or_create_collection(
+                        COLLECTION_NAME,
+                        metadata={"hnsw:space": "cosine"},
+                        embedding_function=embedding_functions.DefaultEmbeddingFunction()
+                    )
+                except Exception as e:
+                    logging.warning(f"Semantic cache disabled: {str(e)}")
+                    self.enabled = False
+            return self._collection
+
+    def _count(self, event, n=1):
+        with self._lock:
+            self._counts[event] += n
+
+    def threshold_for(self, category):
+        return self.category_thresholds.get(category, self.threshold)
+
+    def lookup(self, query, category):
+        """Cached answer for a question similar to `query` in `category`, or None"""
+        if not self.enabled or self.collection is None:
+            return None
+        try:
+            result = self.collection.query(
+                query_texts=[normalize_query(query)], n_results=1,
+                where={"category": category}, include=["metadatas", "distances"]
+            )
+        except Exception as e:
+            logging.error(f"Semantic cache lookup failed: {str(e)}")
+            self._count("errors")
+            return None
+
+        if not result["ids"][0]:
+            self._count("misses")
+            return None
+        entry_id = result["ids"][0][0]
+        metadata = result["metadatas"][0][0]
+        similarity = 1 - result["distances"][0][0]
+        now = time.time()
+        if metadata["created_at"] + self.ttl < now:
+            self.collection.delete(ids=[entry_id])
+            self._count("expired")
+            self._count("misses")
+            return None
+        if similarity < self.threshold_for(category):
+            self._count("misses")
+            return None
+
+        self.collection.update(ids=[entry_id], metadatas=[{**metadata, "accessed_at": now}])
+        self._count("hits")
+        logging.info(f"Semantic cache hit for category {category} (similarity {similarity:.3f})")
+        return metadata["answer"]
+
+    def store(self, query, category, answer):
+        if not self.enabled or not answer or self.collection is None:
+            return
+        query = normalize_query(query)
+        now = time.time()
+        try:
+            self.collection.upsert(
+                ids=[hashlib.sha256(f"{category}:{query}".encode("utf-8")).hexdigest()],
+                documents=[query],
+                metadatas=[{"category": category, "answer": answer, "created_at": now, "accessed_at": now}]
+            )
+            self._count("stores")
+            if self.collection.count() > self.max_entries:
+                self._evict()
+        except Exception as e:
+            logging.error(f"Semantic cache store failed: {str(e)}")
+            self._count("errors")
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones down to 90% of max_entries"""
+        entries = self.collection.get(include=["metadatas"])
+        now = time.time()
+        expired = [entry_id for entry_id, metadata in zip(entries["ids"], entries["metadatas"])
+                   if metadata["created_at"] + self.ttl < now]
+        live = sorted((metadata["accessed_at"], entry_id)
+                      for entry_id, metadata in zip(entries["ids"], entries["metadatas"])
+                      if metadata["created_at"] + self.ttl >= now)
+        excess = max(0, len(live) - int(self.max_entries * 0.9))
+        stale = expired + [entry_id for _, entry_id in live[:excess]]
+        if stale:
+            self.collection.delete(ids=stale)
+            self._count("evictions", len(stale))
+            logging.info(f"Semantic cache evicted {len(stale)} entries")
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts.get("hits", 0) + counts.get("misses", 0)
+        counts["hit_rate"] = round(counts.get("hits", 0) / lookups, 4) if lookups else None
+        counts["enabled"] = self.enabled
+        return counts
+
+
+semantic_cache = SemanticCache(
+    SEMANTIC_CACHE_PATH,
+    enabled=SEMANTIC_CACHE_ENABLED,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    category_thresholds=CATEGORY_THRESHOLDS,
+    ttl=SEMANTIC_CACHE_TTL,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,209 @@
+import os
+import re
+import csv
+import json
+import math
+import logging
+import argparse
+import threading
+from collections import Counter, defaultdict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES_PATH = os.path.join(BASE_DIR, "specialist", "data", "examples.csv")
+MODEL_PATH = os.getenv("SPECIALIST_MODEL_PATH",
+                       os.path.join(BASE_DIR, "specialist", "saved_models", "specialist_nb.json"))
+# Below this posterior the routing LLM is asked instead
+CONFIDENCE_THRESHOLD = float(os.getenv("SPECIALIST_CONFIDENCE_THRESHOLD", "0.6"))
+
+_STOPWORDS = {
+    "a", "an", "the", "i", "my", "me", "is", "are", "am", "was", "and", "or", "of", "to",
+    "in", "on", "for", "with", "it", "this", "that", "be", "have", "has", "had", "do",
+    "does", "what", "how", "can", "should", "there", "at", "as", "by", "from", "since"
+}
+
+
+# Cue words for each category, added to training as extra documents so the
+# model generalises beyond the handful of seed examples
+CUE_WORDS = {
+    "A": "symptom symptoms pain ache aching fever cough feel feeling swollen swelling rash itching "
+         "nausea vomiting dizzy dizziness tired fatigue bleeding since days weeks sore burning "
+         "numbness shortness breath palpitations",
+    "B": "test tests testing diagnose diagnosed diagnosis scan x-ray xray mri ct ultrasound ecg "
+         "report result results level levels count interpret indicate mean positive negative "
+         "blood test biopsy screening confirm investigation",
+    "C": "treat treatment treated therapy cure manage management recover recovery rehabilitation "
+         "physiotherapy surgery plan options exercises diet remedy heal healing care",
+    "D": "safe safety side effects interaction interactions interact together combine dose dosage "
+         "overdose pregnancy breastfeeding allergic allergy contraindication tablets pills "
+         "taking while avoid missed expired alcohol",
+    "E": "rare genetic syndrome disorder complex multiple chronic trial trials gene prognosis "
+         "specialist centre center autoimmune refractory resistant undiagnosed precision "
+         "immunotherapy outlook lifelong"
+}
+CUE_WEIGHT = 3
+
+
+def _stem(word):
+    """Crude prefix stemmer: treat, treated and treatment share a token"""
+    return word[:6]
+
+
+def tokenize(text):
+    """Lower-cased, stemmed word unigrams and bigrams, without stopwords"""
+    words = [_stem(word) for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in _STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class SpecialistClassifier:
+    """
+    Multinomial naive Bayes over word unigrams/bigrams for A-E specialist
+    routing. Trained offline from labelled queries and stored as JSON; a
+    prediction is a dictionary lookup per token, well under a millisecond.
+    """
+
+    def __init__(self, labels, log_prior, log_likelihood, log_unknown):
+        self.labels = labels
+        self.log_prior = log_prior
+        self.log_likelihood = log_likelihood
+        self.log_unknown = log_unknown
+
+    @classmethod
+    def train(cls, examples, alpha=1.0):
+        """Fit on (text, label) pairs plus the cue words, with Laplace smoothing"""
+        token_counts = defaultdict(Counter)
+        label_counts = Counter()
+        for text, label in examples:
+            label_counts[label] += 1
+            token_counts[label].update(tokenize(text))
+        for label, words in CUE_WORDS.items():
+            for word in words.split():
+                token_counts[label][_stem(word)] += CUE_WEIGHT
+        vocabulary = set().union(*token_counts.values())
+        labels = sorted(label_counts)
+        total = sum(label_counts.values())
+        log_prior, log_likelihood, log_unknown = {}, {}, {}
+        for label in labels:
+            denominator = sum(token_counts[label].values()) + alpha * (len(vocabulary) + 1)
+            log_prior[label] = math.log(label_counts[label] / total)
+            log_likelihood[label] = {token: math.log((count + alpha) / denominator)
+                                     for token, count in token_counts[label].items()}
+            log_unknown[label] = math.log(alpha / denominator)
+        return cls(labels, log_prior, log_likelihood, log_unknown)
+
+    def predict_proba(self, text):
+        tokens = [token for token in tokenize(text)
+                  if any(token in self.log_likelihood[label] for label in self.labels)]
+        scores = {}
+        for label in self.labels:
+            likelihood = self.log_likelihood[label]
+            unknown = self.log_unknown[label]
+            scores[label] = self.log_prior[label] + sum(likelihood.get(token, unknown) for token in tokens)
+        top = max(scores.values())
+        weights = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(weights.values())
+        return {label: weight / total for label, weight in weights.items()}
+
+    def predict(self, text):
+        """Return (label, confidence)"""
+        probabilities = self.predict_proba(text)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+    def to_dict(self):
+        return {
+            "labels": self.labels,
+            "log_prior": self.log_prior,
+            "log_likelihood": self.log_likelihood,
+            "log_unknown": self.log_unknown
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["labels"], data["log_prior"], data["log_likelihood"], data["log_unknown"])
+
+
+class RoutingMetrics:
+    """Counts of how specialist routing was decided"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        routed = counts.get("classifier", 0) + counts.get("llm_fallback", 0)
+        counts["fallback_rate"] = round(counts.get("llm_fallback", 0) / routed, 4) if routed else None
+        return counts
+
+
+routing_metrics = RoutingMetrics()
+
+
+def _load_default_classifier():
+    try:
+        return SpecialistClassifier.load(MODEL_PATH)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Specialist classifier not available, routing with the LLM only: {str(e)}")
+        return None
+
+
+specialist_classifier = _load_default_classifier()
+
+
+def classify_specialist(text, threshold=None):
+    """
+    Return (category, confidence) from the local classifier, or (None, confidence)
+    when it is unavailable or not confident enough and the LLM should decide.
+    """
+    if specialist_classifier is None or not text:
+        return None, 0.0
+    label, confidence = specialist_classifier.predict(text)
+    if confidence >= (CONFIDENCE_THRESHOLD if threshold is None else threshold):
+        return label, confidence
+    return None, confidence
+
+
+def load_examples(path=EXAMPLES_PATH):
+    with open(path, newline="") as f:
+        return [(row["text"], row["label"]) for row in csv.DictReader(f)]
+
+
+def evaluate(examples, threshold=CONFIDENCE_THRESHOLD):
+    """Leave-one-out accuracy and coverage (share answered without the LLM) at `threshold`"""
+    answered = correct = 0
+    for i, (text, label) in enumerate(examples):
+        model = SpecialistClassifier.train(examples[:i] + examples[i + 1:])
+        predicted, confidence = model.predict(text)
+        if confidence >= threshold:
+            answered += 1
+            correct += predicted == label
+    return {
+        "examples": len(examples),
+        "coverage": round(answered / len(examples), 3),
+        "accuracy_when_answered": round(correct / answered, 3) if answered else None
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the specialist routing classifier")
+    parser.add_argument("--examples", default=EXAMPLES_PATH)
+    parser.add_argument("--output", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    examples = load_examples(args.examples)
+    for threshold in (0.5, CONFIDENCE_THRESHOLD, 0.8, 0.9):
+        print(f"threshold {threshold}: {evaluate(examples, threshold)}")
+    SpecialistClassifier.train(examples).save(args.output)
+    print(f"Model saved to {args.output}")
@@ -0,0 +1,53 @@
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class StageGraph:
+    """
+    A small dependency graph of named stages. Each stage starts on the
+    executor as soon as the stages it depends on have finished, and receives
+    their results as keyword arguments. Independent stages run in parallel.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, func, depends_on=()):
+        self.stages[name] = (func, tuple(depends_on))
+        return self
+
+    @staticmethod
+    def _timed(func, inputs, origin):
+        start = time.perf_counter()
+        result = func(**inputs)
+        end = time.perf_counter()
+        return result, {"start": round(start - origin, 4), "seconds": round(end - start, 4)}
+
+    def run(self, executor):
+        """
+        Run every stage and return (results, timings), both keyed by stage
+        name. Timings give each stage's start offset and duration in seconds.
+        The first stage error is re-raised once running stages have finished.
+        """
+        origin = time.perf_counter()
+        pending = dict(self.stages)
+        running = {}
+        results, timings = {}, {}
+        while pending or running:
+            for name in [name for name, (_, deps) in pending.items() if all(dep in results for dep in deps)]:
+                func, deps = pending.pop(name)
+                inputs = {dep: results[dep] for dep in deps}
+                running[executor.submit(self._timed, func, inputs, origin)] = name
+            if not running:
+                raise ValueError(f"Stages with unmet dependencies: {', '.join(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    wait(running)
+                    raise future.exception()
+                results[name], timings[name] = future.result()
+        timings["total"] = round(time.perf_counter() - origin, 4)
+        logging.info(f"Stage timings: {timings}")
+        return results, timings
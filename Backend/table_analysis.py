@@ -5,87 +5,251 @@ import numpy as np
 from PIL import Image
 from io import BytesIO
 from supabase_client import supabase
-from groq import Groq
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
 from sklearn.preprocessing import StandardScaler
 from sklearn.impute import SimpleImputer
 import json
 import time
+from llm_gateway import llm_gateway, slot_model
+from health_records import flatten_records, is_unflattened
+from analysis_cache import analysis_cache, frame_fingerprint, text_digest, LLM_SECTION_TTL
+from context_encoder import encode_data_package
+from metrics import timed, timed_stage, log_payload, payload_size
 
-os.environ["GROQ_API_KEY"] = <GROQ API KEY>
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+load_dotenv()
+
+ANALYSIS_MODEL = slot_model("analysis", "mixtral-8x7b-32768")
+ANALYSIS_MAX_TOKENS = 4000
+PROMPT_TIMEOUT = float(os.getenv("ANALYSIS_PROMPT_TIMEOUT", "120"))
+PROMPT_MAX_RETRIES = int(os.getenv("ANALYSIS_PROMPT_MAX_RETRIES", "4"))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-def fetch_health_records(region_id):
+HEALTH_RECORD_COLUMNS = [
+    "general_health",
+    "pain_discomfort",
+    "digestion_appetite",
+    "chronic_conditions",
+    "lifestyle_habits",
+    "womens_health",
+    "family_community_health",
+    "mental_health",
+    "heart_rate",
+    "blood_pressure",
+    "respiratory_rate",
+    "body_temperature",
+    "bmi",
+    "blood_glucose",
+    "oxygen_saturation",
+    "heart_health",
+    "gender"
+]
+
+FETCH_PAGE_SIZE = int(os.getenv("HEALTH_RECORDS_PAGE_SIZE", "1000"))
+FETCH_PARALLELISM = int(os.getenv("HEALTH_RECORDS_FETCH_PARALLELISM", "4"))
+
+_PARTITION_DONE = object()
+
+def _id_partitions(count):
+    """Split the uuid keyspace into `count` contiguous (lower, upper) ranges"""
+    bounds = [f"{i * 16 ** 8 // count:08x}-0000-0000-0000-000000000000" for i in range(1, count)]
+    return list(zip([None] + bounds, bounds + [None]))
+
+def _fetch_page(region_id, lower, upper, after_id, page_size, extra_columns=(), updated_since=None):
+    """Fetch one keyset page of a region's (or list of regions') records, ordered by id within [lower, upper)"""
+    query = supabase.table('patient_health_records')\
+        .select(",".join(["id", *extra_columns] + HEALTH_RECORD_COLUMNS))
+    if isinstance(region_id, (list, tuple)):
+        query = query.in_('region_id', list(region_id))
+    else:
+        query = query.eq('region_id', region_id)
+    if updated_since:
+        query = query.gt('updated_at', updated_since)
+    if after_id:
+        query = query.gt('id', after_id)
+    elif lower:
+        query = query.gte('id', lower)
+    if upper:
+        query = query.lt('id', upper)
+    with timed("supabase_query", table="patient_health_records"):
+        return query.order('id').limit(page_size).execute().data
+
+def iter_health_record_pages(region_id, page_size=None, parallelism=None, extra_columns=(), updated_since=None):
+    """
+    Yield a region's records page by page, optionally only those updated after
+    `updated_since` and with `extra_columns` selected alongside the health columns.
+    `region_id` may also be a list, fetched with a single `in` filter.
+
+    The id keyspace is split into `parallelism` ranges that are paged
+    concurrently with keyset pagination, so later pages are prefetched while
+    earlier ones are processed. A bounded queue keeps at most a few pages in
+    memory. Pages arrive in no particular order across ranges.
+    """
+    page_size = page_size or FETCH_PAGE_SIZE
+    partitions = _id_partitions(max(1, parallelism or FETCH_PARALLELISM))
+    pages = queue.Queue(maxsize=len(partitions) * 2)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def fetch_partition(lower, upper):
+        after_id = None
+        try:
+            while not stop.is_set():
+                page = _fetch_page(region_id, lower, upper, after_id, page_size,
+                                   extra_columns, updated_since)
+                if page:
+                    put(page)
+                if len(page) < page_size:
+                    break
+                after_id = page[-1]["id"]
+        except Exception as e:
+            put(e)
+        finally:
+            put(_PARTITION_DONE)
+
+    workers = [
+        threading.Thread(target=fetch_partition, args=bounds, daemon=True)
+        for bounds in partitions
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        remaining = len(workers)
+        while remaining:
+            item = pages.get()
+            if item is _PARTITION_DONE:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+
+def fetch_health_records(region_id, page_size=None, parallelism=None):
     """Fetch specific health record columns for a region"""
     try:
-        columns = [
-            "general_health",
-            "pain_discomfort",
-            "digestion_appetite",
-            "chronic_conditions",
-            "lifestyle_habits",
-            "womens_health",
-            "family_community_health",
-            "mental_health",
-            "heart_rate",
-            "blood_pressure",
-            "respiratory_rate",
-            "body_temperature",
-            "bmi",
-            "blood_glucose",
-            "oxygen_saturation",
-            "heart_health",
-            "gender"
-        ]
-        columns_str = ",".join(columns)
-        response = supabase.table('patient_health_records')\
-            .select(columns_str)\
-            .eq('region_id', region_id)\
-            .execute()
-            
-        if response.data:
-            logging.info(f"Fetched {len(response.data)} records with {len(columns)} health indicators")
+        records = []
+        for page in iter_health_record_pages(region_id, page_size, parallelism):
+            for record in page:
+                record.pop("id", None)
+            records.extend(page)
+
+        if records:
+            logging.info(f"Fetched {len(records)} records with {len(HEALTH_RECORD_COLUMNS)} health indicators")
         else:
             logging.warning(f"No records found for region {region_id}")
-            
-        return response.data
-        
+
+        return records
+
+    except Exception as e:
+        logging.error(f"Error fetching health records: {str(e)}")
+        return None
+
+def iter_health_record_frames(region_id, page_size=None, parallelism=None):
+    """Yield flattened DataFrame chunks, one per fetched page"""
+    for page in iter_health_record_pages(region_id, page_size, parallelism):
+        for record in page:
+            record.pop("id", None)
+        yield flatten_records(page)
+
+def fetch_health_records_frame(region_id, page_size=None, parallelism=None):
+    """
+    Build a region's flattened DataFrame incrementally from paginated chunks.
+    Each page is flattened as soon as it arrives, so the raw JSON dicts of at
+    most a few pages are held at once. Returns None if there are no records.
+    """
+    try:
+        frames = list(iter_health_record_frames(region_id, page_size, parallelism))
+        if not frames:
+            logging.warning(f"No records found for region {region_id}")
+            return None
+        df = pd.concat(frames, ignore_index=True, sort=False)
+        logging.info(f"Fetched {len(df)} records in {len(frames)} pages")
+        return df
     except Exception as e:
         logging.error(f"Error fetching health records: {str(e)}")
         return None
 
+def fetch_regions_frame(region_ids, page_size=None, parallelism=None):
+    """
+    Fetch several regions with one paginated `in` query into a single flattened
+    DataFrame with a leading region_id column. Returns None if there are no records.
+    """
+    try:
+        frames = []
+        for page in iter_health_record_pages(list(region_ids), page_size, parallelism,
+                                             extra_columns=("region_id",)):
+            regions = [record.pop("region_id", None) for record in page]
+            for record in page:
+                record.pop("id", None)
+            frame = flatten_records(page)
+            frame.insert(0, "region_id", regions)
+            frames.append(frame)
+        if not frames:
+            logging.warning(f"No records found for regions {region_ids}")
+            return None
+        df = pd.concat(frames, ignore_index=True, sort=False)
+        logging.info(f"Fetched {len(df)} records for {df['region_id'].nunique()} regions in {len(frames)} pages")
+        return df
+    except Exception as e:
+        logging.error(f"Error fetching health records: {str(e)}")
+        return None
+
+def fetch_region_fingerprint(region_id):
+    """Cheap change marker for a region: row count plus the latest updated_at"""
+    try:
+        response = supabase.table('patient_health_records')\
+            .select('updated_at', count='exact')\
+            .eq('region_id', region_id)\
+            .order('updated_at', desc=True)\
+            .limit(1)\
+            .execute()
+        latest = response.data[0]['updated_at'] if response.data else None
+        return f"rows:{response.count}:updated:{latest}"
+    except Exception as e:
+        logging.error(f"Error fetching region fingerprint: {str(e)}")
+        return None
+
+def fetch_region_row_count(region_id):
+    """Number of records in a region, or None if the count query fails"""
+    try:
+        response = supabase.table('patient_health_records')\
+            .select('id', count='exact')\
+            .eq('region_id', region_id)\
+            .limit(1)\
+            .execute()
+        return response.count
+    except Exception as e:
+        logging.error(f"Error fetching region row count: {str(e)}")
+        return None
+
+@timed_stage("table_preprocess")
 def preprocess_data(records):
     """
     Preprocess data by flattening JSONB columns, handling missing values, encoding,
     and then producing two versions:
       - raw_df: data after imputation and encoding (clinically interpretable values)
       - scaled_df: data after applying StandardScaler (for risk score calculations)
+    Accepts a list of records or a DataFrame already produced by flatten_records.
     """
-    df = pd.DataFrame(records)
-    
-    # Flatten JSONB columns
-    def flatten_jsonb_column(df, column_name):
-        if df[column_name].notna().any():
-            expanded = pd.json_normalize(df[column_name])
-            expanded.columns = [f"{column_name}_{k}" for k in expanded.columns]
-            return pd.concat([df.drop(column_name, axis=1), expanded], axis=1)
-        return df
-    
-    jsonb_columns = [
-        'general_health', 'pain_discomfort', 'digestion_appetite',
-        'chronic_conditions', 'lifestyle_habits', 'womens_health',
-        'family_community_health', 'mental_health', 'heart_health'
-    ]
-    
-    for col in jsonb_columns:
-        df = flatten_jsonb_column(df, col)
-    
-    # Process blood pressure into systolic and diastolic columns
-    df[['systolic_bp', 'diastolic_bp']] = df['blood_pressure'].str.split('/', expand=True).apply(pd.to_numeric, errors='coerce')
-    df = df.drop('blood_pressure', axis=1)
+    if isinstance(records, pd.DataFrame) and not is_unflattened(records):
+        df = records.copy()
+    else:
+        df = flatten_records(records)
     
     # Handle missing values
     numerical_cols = df.select_dtypes(include=np.number).columns
@@ -111,6 +275,7 @@ def preprocess_data(records):
     
     return scaled_df, raw_df
 
+@timed_stage("table_create_features")
 def create_features(df):
     """Create composite health indicators on scaled data"""
     # Cardiovascular risk score
@@ -141,12 +306,16 @@ def detect_outliers(series, multiplier=1.5):
         "outlier_percentage": round(len(outliers) / len(series) * 100, 2)
     }
 
+@timed_stage("table_validate")
 def validate_and_format_data(scaled_df, raw_df):
     """
     Build a data package using:
       - Raw data for summary statistics and correlation matrix (clinically interpretable)
       - Scaled data for risk score statistics.
       - Also include outlier detection for data quality.
+    Medians and quartiles are exact: raw_df is already in memory, so a quantile
+    sketch would read every value anyway. Streamed per-region statistics keep
+    sketches instead (see region_stats.py).
     """
     try:
         available_columns = raw_df.columns[raw_df.notna().any()].tolist()
@@ -192,94 +361,146 @@ def validate_and_format_data(scaled_df, raw_df):
         logging.error(f"Error in data validation: {str(e)}")
         return None
 
-def analyze_health_records(records):
-    """Enhanced analysis with sequential Groq API calls"""
-    if not records:
-        return {"analysis": "No health records found for this region"}
-    
-    try:
-        # Preprocess and get both versions of the data
-        scaled_df, raw_df = preprocess_data(records)
-        scaled_df = create_features(scaled_df)
-        data_package = validate_and_format_data(scaled_df, raw_df)
-        
-        if not data_package:
-            return {"analysis": "Error: Data validation failed"}
-        
-        # Base data context for all prompts
-        base_context = "Region Health Analysis Data Package:\n\n"
-        for key, value in data_package.items():
-            if value:
-                base_context += f"{key.upper()}:\n{json.dumps(value, indent=2)}\n\n"
-
-        # Define the four specialized prompts
-        prompts = {
-            "metrics_interpretation": {
-                "instruction": """Based on the provided health data, provide a detailed interpretation of the available metrics in clinical context:
+def run_analysis_prompt(analysis_type, content):
+    """Run one analysis prompt through the shared LLM gateway (rate limited, with retries)"""
+    logging.info(f"Starting {analysis_type} analysis...")
+    log_payload("llm_request", model=ANALYSIS_MODEL, analysis=analysis_type, chars=payload_size(content))
+    start = time.monotonic()
+    with timed("llm_completion", model=ANALYSIS_MODEL):
+        result = llm_gateway.complete(
+            [{"role": "user", "content": content}],
+            model=ANALYSIS_MODEL,
+            timeout=PROMPT_TIMEOUT,
+            max_retries=PROMPT_MAX_RETRIES,
+            temperature=0.7,
+            max_tokens=ANALYSIS_MAX_TOKENS
+        )
+    logging.info(f"Completed {analysis_type} analysis in {time.monotonic() - start:.1f}s")
+    log_payload("llm_response", model=ANALYSIS_MODEL, analysis=analysis_type, chars=payload_size(result))
+    return result
+
+# The four specialized prompts, keyed by analysis type
+ANALYSIS_PROMPTS = {
+    "metrics_interpretation": {
+        "instruction": """Based on the provided health data, provide a detailed interpretation of the available metrics in clinical context:
 1. Analyze the statistical distributions
 2. Identify any concerning values or trends
 3. Evaluate the data quality and reliability
 4. Interpret the risk scores in a clinical setting""",
-                "result_key": "metrics_analysis"
-            },
-            "relationships_analysis": {
-                "instruction": """Analyze the relationships between health indicators in the provided data:
+        "result_key": "metrics_analysis"
+    },
+    "relationships_analysis": {
+        "instruction": """Analyze the relationships between health indicators in the provided data:
 1. Examine the correlation matrix
 2. Identify strong positive and negative correlations
 3. Explain the clinical significance of key relationships
 4. Highlight any unexpected or concerning associations""",
-                "result_key": "relationships_analysis"
-            },
-            "pattern_identification": {
-                "instruction": """Identify and analyze significant patterns in the health data:
+        "result_key": "relationships_analysis"
+    },
+    "pattern_identification": {
+        "instruction": """Identify and analyze significant patterns in the health data:
 1. Detect any clustering or grouping of health indicators
 2. Identify common health profiles or risk patterns
 3. Analyze temporal or demographic patterns if available
 4. Highlight any unusual or concerning patterns""",
-                "result_key": "patterns_analysis"
-            },
-            "recommendations": {
-                "instruction": """Provide specific recommendations based on the analyzed health data:
+        "result_key": "patterns_analysis"
+    },
+    "recommendations": {
+        "instruction": """Provide specific recommendations based on the analyzed health data:
 1. Suggest targeted interventions
 2. Recommend preventive measures
 3. Identify areas requiring immediate attention
 4. Propose long-term health monitoring strategies""",
-                "result_key": "recommendations"
-            }
-        }
+        "result_key": "recommendations"
+    }
+}
 
-        # Make separate API calls for each analysis aspect
-        analysis_results = {}
+def build_data_package(records):
+    """Run the deterministic part of the pipeline and return the data package"""
+    scaled_df, raw_df = preprocess_data(records)
+    scaled_df = create_features(scaled_df)
+    return validate_and_format_data(scaled_df, raw_df)
+
+def get_region_data_package(region_id):
+    """
+    Return (data_package, total_records) for a region, reusing the cached package
+    while the region's fingerprint is unchanged. Records are only fetched on a miss.
+    """
+    fingerprint = fetch_region_fingerprint(region_id)
+    if fingerprint:
+        cached = analysis_cache.get(f"data_package:{region_id}:{fingerprint}")
+        if cached is not None:
+            logging.info(f"Using cached data package for region {region_id}")
+            return cached["data_package"], cached["total_records"]
+
+    df = fetch_health_records_frame(region_id)
+    if df is None:
+        return None, 0
+
+    # Fall back to hashing the content if the cheap fingerprint was unavailable
+    fingerprint = fingerprint or frame_fingerprint(df)
+    data_package = build_data_package(df)
+    if data_package:
+        analysis_cache.set(f"data_package:{region_id}:{fingerprint}", {
+            "data_package": data_package,
+            "total_records": len(df)
+        })
+    return data_package, len(df)
+
+def build_analysis_context(data_package):
+    """Base data context shared by all prompts, compacted to the context token budget"""
+    return encode_data_package(data_package)
+
+def analyze_health_records(records, data_package=None, on_section=None):
+    """
+    Enhanced analysis with concurrent, rate-limited Groq API calls.
+    A precomputed data_package may be passed to skip preprocessing; LLM sections
+    are cached by the content of the prompt they were generated from.
+    If given, on_section(result_key, content) is called as each section finishes.
+    """
+    if not records and data_package is None:
+        return {"analysis": "No health records found for this region"}
+    
+    try:
+        if data_package is None:
+            data_package = build_data_package(records)
         
-        # Process prompts sequentially with delay between calls
-        for analysis_type, prompt_info in prompts.items():
-            try:
-                logging.info(f"Starting {analysis_type} analysis...")
-                
-                messages = [{
-                    "role": "user",
-                    "content": f"{base_context}\nANALYSIS TASK:\n{prompt_info['instruction']}"
-                }]
-                
-                # Make API call and wait for completion
-                chat_completion = client.chat.completions.create(
-                    messages=messages,
-                    model="mixtral-8x7b-32768",
-                    temperature=0.7,
-                    max_tokens=4000
-                )
-                
-                analysis_results[prompt_info['result_key']] = chat_completion.choices[0].message.content
-                logging.info(f"Completed {analysis_type} analysis")
-                
-                # Wait for 5 seconds before next call to avoid rate limits
-                time.sleep(60)
-                
-            except Exception as e:
-                logging.error(f"Error in {analysis_type} analysis: {e}")
-                analysis_results[prompt_info['result_key']] = f"Analysis failed: {str(e)}"
-                # Wait longer if we hit an error (likely rate limit)
-                time.sleep(10)
+        if not data_package:
+            return {"analysis": "Error: Data validation failed"}
+        
+        base_context = build_analysis_context(data_package)
+
+        analysis_results = {}
+        pending = {}
+        for analysis_type, prompt_info in ANALYSIS_PROMPTS.items():
+            content = f"{base_context}\nANALYSIS TASK:\n{prompt_info['instruction']}"
+            cache_key = f"llm:{prompt_info['result_key']}:{ANALYSIS_MODEL}:{text_digest(content)}"
+            cached = analysis_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"Using cached {analysis_type} analysis")
+                analysis_results[prompt_info['result_key']] = cached
+                if on_section:
+                    on_section(prompt_info['result_key'], cached)
+            else:
+                pending[analysis_type] = (prompt_info['result_key'], content, cache_key)
+
+        # Send the remaining prompts at once; the shared limiter paces them against the quota
+        if pending:
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = {
+                    executor.submit(run_analysis_prompt, analysis_type, content): (result_key, cache_key)
+                    for analysis_type, (result_key, content, cache_key) in pending.items()
+                }
+                for future in as_completed(futures):
+                    result_key, cache_key = futures[future]
+                    try:
+                        analysis_results[result_key] = future.result()
+                        analysis_cache.set(cache_key, analysis_results[result_key], ttl=LLM_SECTION_TTL)
+                    except Exception as e:
+                        logging.error(f"Error in {result_key}: {e}")
+                        analysis_results[result_key] = f"Analysis failed: {str(e)}"
+                    if on_section:
+                        on_section(result_key, analysis_results[result_key])
 
         return {
             "metrics_analysis": analysis_results.get("metrics_analysis", "Analysis failed"),
@@ -0,0 +1,15 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# The heart and hypertension training scripts import each other as top-level modules
+sys.path.append(os.path.join(BACKEND_DIR, "heart", "src"))
+sys.path.append(os.path.join(BACKEND_DIR, "hypertension", "scripts"))
+
+# Modules create their Supabase client and LLM backends at import; nothing here calls out
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test.key.value")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("HEART_MODELS_PRELOAD", "false")
+os.environ.setdefault("ANALYSIS_CACHE_PATH", os.path.join(BACKEND_DIR, "cache", "test_analysis_cache.db"))
@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+import httpx
+
+import app as flask_module
+import asgi
+
+DELAY = 0.5
+
+
+def test_mounted_flask_requests_run_concurrently(monkeypatch):
+    def slow_get(job_id):
+        time.sleep(DELAY)
+        return None
+
+    monkeypatch.setattr(flask_module.job_manager, "get", slow_get)
+
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[client.get(f"/chronic-disease/jobs/job-{i}") for i in range(4)])
+            return responses, time.perf_counter() - start
+
+    responses, elapsed = asyncio.run(run())
+    assert [response.status_code for response in responses] == [404] * 4
+    # One at a time would take 4 * DELAY
+    assert elapsed < 2 * DELAY
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from batch_analysis import build_region_data_packages
+from benchmarks.synthetic_records import generate_records
+from health_records import flatten_records
+from table_analysis import build_data_package
+
+REGIONS = ("region-a", "region-b", "region-c")
+
+
+def region_records(count=900, seed=3):
+    rows = generate_records(count, seed=seed, region_ids=REGIONS)
+    for row in rows:
+        for column in ("id", "created_at", "updated_at"):
+            row.pop(column, None)
+    return rows
+
+
+def combined_frame(rows):
+    """As fetch_regions_frame builds it: flattened records with a leading region_id column"""
+    regions = [row["region_id"] for row in rows]
+    frame = flatten_records([{k: v for k, v in row.items() if k != "region_id"} for row in rows])
+    frame.insert(0, "region_id", regions)
+    return frame
+
+
+def assert_close(actual, expected, path="package"):
+    if isinstance(expected, dict):
+        assert set(actual) == set(expected), path
+        for key in expected:
+            assert_close(actual[key], expected[key], f"{path}.{key}")
+    elif isinstance(expected, list):
+        assert actual == expected, path
+    elif expected is None or pd.isna(expected):
+        assert actual is None or pd.isna(actual), path
+    else:
+        assert actual == pytest.approx(expected, abs=0.011), path
+
+
+def test_string_booleans_are_present():
+    rows = region_records()
+    answers = {row["lifestyle_habits"].get("smoking") for row in rows if row.get("lifestyle_habits")}
+    assert {"yes", "no"} & answers and {True, False} & answers
+
+
+def test_batch_packages_match_per_region_packages():
+    rows = region_records()
+    packages = build_region_data_packages(combined_frame(rows))
+    assert set(packages) == set(REGIONS)
+    for region_id in REGIONS:
+        records = [{k: v for k, v in row.items() if k != "region_id"} for row in rows if row["region_id"] == region_id]
+        package, total = packages[region_id]
+        expected = build_data_package(records)
+        assert total == len(records)
+        assert sorted(package["features"]) == sorted(expected["features"])
+        for section in ("statistics", "correlations", "data_quality"):
+            assert_close(package[section], expected[section], f"{region_id}.{section}")
+        assert_close(package["risk_scores"], expected["risk_scores"], f"{region_id}.risk_scores")
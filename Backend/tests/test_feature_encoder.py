@@ -0,0 +1,59 @@
+import io
+import os
+import numpy as np
+import pytest
+from heart.src.feature_encoder import HeartFeatureEncoder, load_records, train_test_rows, ENCODER_FILENAME
+from heart.src.utils import load_data, preprocess_data, split_data
+
+HEART_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "heart")
+HEART_CSV = os.path.join(HEART_DIR, "data", "heart.csv")
+
+
+def test_encoder_matches_preprocess_data():
+    encoder = HeartFeatureEncoder.from_schema()
+    X, y = encoder.transform_target(load_records(HEART_CSV))
+    expected = preprocess_data(load_data(HEART_CSV))
+    np.testing.assert_array_equal(X, expected[encoder.columns].to_numpy(dtype=np.float32))
+    np.testing.assert_array_equal(y, expected[encoder.target].to_numpy(dtype=np.float32))
+
+
+def test_scaler_matches_standard_scaler_on_the_training_split():
+    from sklearn.preprocessing import StandardScaler
+    encoder = HeartFeatureEncoder.from_schema()
+    train, _ = train_test_rows(load_records(HEART_CSV))
+    X_train, _ = encoder.transform_target(train)
+    encoder.fit_scaler(X_train)
+
+    X_expected = split_data(preprocess_data(load_data(HEART_CSV)))[0]
+    scaler = StandardScaler().fit(X_expected)
+    np.testing.assert_allclose(encoder.scale(X_train), scaler.transform(X_expected), atol=1e-5)
+    # The encoder shipped with the models was fitted the same way
+    saved = HeartFeatureEncoder.load(os.path.join(HEART_DIR, "src", "saved_models", ENCODER_FILENAME))
+    np.testing.assert_allclose(saved.scaler_mean, scaler.mean_, rtol=1e-5)
+    np.testing.assert_allclose(saved.scaler_scale, scaler.scale_, rtol=1e-5)
+
+
+def test_aliases_and_errors():
+    encoder = HeartFeatureEncoder.from_schema()
+    matrix, errors = encoder.transform([
+        "40, male, ata, 140, 289, 0, normal, 172, no, 0, up",
+        {"Age": 40, "Sex": "M"},
+        "40, X, ATA, 140, 289, 0, Normal, 172, N, 0, Up",
+        "40, M"
+    ])
+    np.testing.assert_array_equal(matrix[0], [40, 1, 0, 140, 289, 0, 0, 172, 0, 0, 0])
+    assert errors[1].startswith("Missing values for: ChestPainType")
+    assert errors[2] == "Unrecognised values for: Sex"
+    assert errors[3] == "Expected 11 values, but got 2"
+    assert np.isnan(matrix[1:]).all()
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 5000])
+def test_iter_csv_matches_transform(chunk_rows):
+    with open(HEART_CSV) as f:
+        text = f.read()
+    encoder = HeartFeatureEncoder.from_schema()
+    chunks = list(encoder.iter_csv(io.StringIO(text), chunk_rows))
+    assert [offset for offset, _, _ in chunks] == list(range(0, len(chunks) * chunk_rows, chunk_rows))
+    expected, _ = encoder.transform(load_records(HEART_CSV))
+    np.testing.assert_array_equal(np.vstack([matrix for _, matrix, _ in chunks]), expected)
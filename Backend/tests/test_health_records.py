@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+
+from benchmarks.synthetic_records import generate_records
+from health_records import JSONB_COLUMNS, flatten_records
+from table_analysis import preprocess_data
+
+
+def json_normalize_preprocess(records):
+    """The original preprocess_data: per-column json_normalize, then imputation and encoding"""
+    df = pd.DataFrame(records)
+    for column in JSONB_COLUMNS:
+        if df[column].notna().any():
+            expanded = pd.json_normalize(df[column])
+            expanded.columns = [f"{column}_{key}" for key in expanded.columns]
+            df = pd.concat([df.drop(column, axis=1), expanded], axis=1)
+    df[['systolic_bp', 'diastolic_bp']] = df['blood_pressure'].str.split('/', expand=True).apply(pd.to_numeric, errors='coerce')
+    df = df.drop('blood_pressure', axis=1)
+
+    numerical_cols = df.select_dtypes(include=np.number).columns
+    categorical_cols = df.select_dtypes(include='object').columns
+    if not numerical_cols.empty:
+        df[numerical_cols] = SimpleImputer(strategy='median').fit_transform(df[numerical_cols])
+    if not categorical_cols.empty:
+        df[categorical_cols] = SimpleImputer(strategy='most_frequent').fit_transform(df[categorical_cols])
+        df = pd.get_dummies(df, columns=categorical_cols.tolist(), drop_first=True)
+    raw_df = df.copy()
+    num_cols = df.select_dtypes(include=np.number).columns
+    df[num_cols] = StandardScaler().fit_transform(df[num_cols])
+    return df, raw_df
+
+
+def records(count, seed):
+    rows = generate_records(count, seed=seed)
+    for row in rows:
+        for column in ("id", "region_id", "created_at", "updated_at"):
+            row.pop(column, None)
+    return rows
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_preprocess_matches_json_normalize(seed):
+    rows = records(1000, seed)
+    expected_scaled, expected_raw = json_normalize_preprocess(rows)
+    scaled, raw = preprocess_data(flatten_records(rows))
+
+    columns = sorted(expected_raw.columns)
+    assert sorted(raw.columns) == columns
+    pd.testing.assert_frame_equal(raw[columns], expected_raw[columns], check_dtype=False)
+    pd.testing.assert_frame_equal(scaled[columns], expected_scaled[columns], check_dtype=False)
+
+
+def test_missing_and_null_values_match_json_normalize():
+    rows = [
+        {"blood_pressure": "120/80", "mental_health": {"sleep_quality": True, "emotional_state": "calm"}},
+        {"blood_pressure": None, "mental_health": {"sleep_quality": None, "emotional_state": None}},
+        {"blood_pressure": "130/85", "mental_health": {}},
+        {"blood_pressure": "125/82", "mental_health": None},
+    ]
+    flat = flatten_records(rows)
+    expected = pd.json_normalize(pd.Series([row["mental_health"] for row in rows]))
+    for key in ("sleep_quality", "emotional_state"):
+        assert flat[f"mental_health_{key}"].dtype == expected[key].dtype
+        assert flat[f"mental_health_{key}"].tolist() == pytest.approx(expected[key].tolist(), nan_ok=True)
@@ -0,0 +1,47 @@
+import os
+import numpy as np
+import pytest
+from heart.src.feature_encoder import HeartFeatureEncoder, load_records
+from heart.src.utils import save_model
+from heart_registry import HeartModelRegistry, ARTIFACTS, ONNX_ARTIFACTS
+
+for module in ("xgboost", "onnx", "skl2onnx", "onnxmltools", "onnxruntime"):
+    pytest.importorskip(module)
+import heart_onnx  # noqa: E402 - needs the exporters above
+
+MEMBERS = ["xgboost", "random_forest"]
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """Small tree members published as the current run, as train_all.py lays them out"""
+    from xgboost import XGBClassifier
+    from sklearn.ensemble import RandomForestClassifier
+    X, y = HeartFeatureEncoder.from_schema().transform_target(load_records(heart_onnx.PARITY_DATA_PATH))
+    run_dir = tmp_path / "runs" / "r1"
+    run_dir.mkdir(parents=True)
+    save_model(XGBClassifier(n_estimators=10, max_depth=3).fit(X, y), str(run_dir / ARTIFACTS["xgboost"]))
+    save_model(RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y),
+               str(run_dir / ARTIFACTS["random_forest"]))
+    (tmp_path / "current").write_text("r1")
+    return tmp_path
+
+
+def test_export_matches_native_and_is_served(model_dir):
+    report = heart_onnx.export(MEMBERS, str(model_dir))
+    assert set(report) == set(MEMBERS)
+    assert all(difference <= heart_onnx.PARITY_TOLERANCE for difference in report.values())
+    assert all((model_dir / "runs" / "r1" / ONNX_ARTIFACTS[name]).exists() for name in MEMBERS)
+
+    record = "40, male, ata, 140, 289, 0, normal, 172, no, 0, up"
+    native = HeartModelRegistry(str(model_dir), MEMBERS, runtime="native").predict(record)
+    exported = HeartModelRegistry(str(model_dir), MEMBERS, runtime="auto")
+    assert exported.load().runtime == "onnx"
+    assert np.isclose(exported.predict(record)["probability"], native["probability"],
+                      atol=heart_onnx.PARITY_TOLERANCE + 1e-4)
+
+
+def test_export_outside_tolerance_is_removed(model_dir):
+    with pytest.raises(ValueError, match="differs from the original"):
+        heart_onnx.export(["random_forest"], str(model_dir), tolerance=-1)
+    assert not (model_dir / "runs" / "r1" / ONNX_ARTIFACTS["random_forest"]).exists()
@@ -0,0 +1,65 @@
+import io
+import os
+import csv
+import numpy as np
+import pytest
+from heart.src.feature_encoder import HeartFeatureEncoder, load_records
+from heart.src.utils import save_model
+from heart_registry import HeartModelRegistry, ARTIFACTS
+
+HEART_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "heart", "data", "heart.csv")
+MEMBERS = ["xgboost", "random_forest"]
+
+
+@pytest.fixture(scope="module")
+def registry(tmp_path_factory):
+    pytest.importorskip("xgboost")
+    from xgboost import XGBClassifier
+    from sklearn.ensemble import RandomForestClassifier
+    model_dir = tmp_path_factory.mktemp("heart_models")
+    X, y = HeartFeatureEncoder.from_schema().transform_target(load_records(HEART_CSV))
+    save_model(XGBClassifier(n_estimators=10, max_depth=3).fit(X, y), str(model_dir / ARTIFACTS["xgboost"]))
+    save_model(RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y),
+               str(model_dir / ARTIFACTS["random_forest"]))
+    return HeartModelRegistry(str(model_dir), MEMBERS, check_interval=3600, runtime="native")
+
+
+def sample_rows():
+    """Rows of heart.csv with bad rows either side of the 4-row chunk boundary, as CSV text and as records"""
+    records = load_records(HEART_CSV)[:9]
+    records.insert(3, {**records[0], "Sex": "X"})
+    records.insert(4, {**records[1], "Cholesterol": ""})
+    records.append({**records[2], "ST_Slope": "Sideways"})
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(records[0]))
+    writer.writeheader()
+    writer.writerows(records)
+    return out.getvalue(), records
+
+
+@pytest.mark.parametrize("chunk_rows", [4, 5000])
+def test_csv_and_batch_scores_match_single_predictions(registry, chunk_rows):
+    text, records = sample_rows()
+    version, header, chunks = registry.iter_csv_scores(io.StringIO(text), chunk_rows)
+    rows = [row for chunk in chunks for row in chunk]
+    batch = registry.predict_batch(records, chunk_rows)
+
+    assert header == ["row", "probability", "prediction", "xgboost_probability", "random_forest_probability",
+                      "error"]
+    assert version == batch["version"]
+    assert [row[0] for row in rows] == list(range(len(records)))
+    assert [error["row"] for error in batch["errors"]] == [3, 4, 11]
+    assert batch["errors"][0]["error"] == "Unrecognised values for: Sex"
+    assert batch["errors"][1]["error"] == "Missing values for: Cholesterol"
+    assert (batch["rows"], batch["scored"]) == (len(records), len(records) - 3)
+
+    results = {result["row"]: result for result in batch["results"]}
+    for row in rows:
+        if row[0] in (3, 4, 11):
+            assert row[1:5] == ["", "", "", ""] and row[5]
+            continue
+        single = registry.predict(records[row[0]])
+        assert results[row[0]]["probability"] == single["probability"]
+        assert results[row[0]]["prediction"] == single["prediction"] == row[2]
+        assert results[row[0]]["models"] == {name: model["probability"] for name, model in single["models"].items()}
+        assert np.isclose(row[1], single["probability"], atol=5e-5) and row[5] == ""
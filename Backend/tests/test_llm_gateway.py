@@ -0,0 +1,49 @@
+import os
+import threading
+import time
+
+from llm_gateway import LLMGateway, MicroBatcher
+
+
+def test_group_followers_wait_for_leader():
+    events = []
+    lock = threading.Lock()
+
+    def send(model, messages, timeout):
+        with lock:
+            events.append(("start", messages[0]["content"], time.monotonic()))
+        time.sleep(0.1)
+        with lock:
+            events.append(("end", messages[0]["content"], time.monotonic()))
+        return messages[0]["content"]
+
+    batcher = MicroBatcher(send, window=0.05, max_batch=8, prefix_chars=40, leader_wait=5)
+    prompts = ["shared-prefix-a", "shared-prefix-b", "shared-prefix-c", "other-prompt"]
+    results = {}
+    threads = [threading.Thread(target=lambda p=p: results.update(
+        {p: batcher.submit("model", [{"role": "user", "content": p}], timeout=5)})) for p in prompts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {p: p for p in prompts}
+    starts = {content: at for kind, content, at in events if kind == "start"}
+    ends = {content: at for kind, content, at in events if kind == "end"}
+    shared = sorted(p for p in prompts if p.startswith("shared"))
+    leader = min(shared, key=starts.get)
+    # Followers start only after the leader of their group has answered
+    assert all(starts[p] >= ends[leader] for p in shared if p != leader)
+    # Another prefix group does not wait for that leader
+    assert starts["other-prompt"] < ends[leader]
+
+
+def test_local_route_only_built_when_configured(monkeypatch):
+    for name in list(os.environ):
+        if name.startswith("LLM_MODEL_") or name == "LOCAL_LLM_BASE_URL":
+            monkeypatch.delenv(name)
+    monkeypatch.setenv("LLM_BACKEND", "groq")
+    assert "local" not in LLMGateway.from_env().routes
+
+    monkeypatch.setenv("LLM_MODEL_CHAT_A", "local:llama3")
+    assert "local" in LLMGateway.from_env().routes
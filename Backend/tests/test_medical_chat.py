@@ -0,0 +1,63 @@
+import medical_chat
+
+
+class FakeResponse:
+    def __init__(self, body, status=200, headers=None):
+        self.body = body
+        self.status_code = status
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+class FakeBucket:
+    def __init__(self, downloads):
+        self.downloads = downloads
+
+    def download(self, path):
+        self.downloads.append(path)
+        return b"from-storage-api"
+
+
+def patch_fetches(monkeypatch, response):
+    requested, downloads = [], []
+
+    def fake_get(url, **kwargs):
+        requested.append(url)
+        return response
+
+    monkeypatch.setattr(medical_chat.requests, "get", fake_get)
+    monkeypatch.setattr(medical_chat.supabase.storage, "from_", lambda bucket: FakeBucket(downloads))
+    return requested, downloads
+
+
+def test_foreign_hosts_are_never_fetched_directly(monkeypatch):
+    requested, downloads = patch_fetches(monkeypatch, FakeResponse(b"x"))
+    image, _, _ = medical_chat._fetch_image("http://169.254.169.254/latest/public/bucket/a.png", None)
+    assert requested == []
+    assert downloads == ["a.png"]
+    assert image.data == b"from-storage-api"
+
+
+def test_storage_urls_are_fetched_directly(monkeypatch):
+    requested, downloads = patch_fetches(monkeypatch, FakeResponse(b"png-bytes", headers={"ETag": "v1"}))
+    url = f"{medical_chat.SUPABASE_STORAGE_PREFIX}bucket/a.png"
+    image, etag, not_modified = medical_chat._fetch_image(url, None)
+    assert requested == [url] and downloads == []
+    assert (image.data, etag, not_modified) == (b"png-bytes", "v1", False)
+
+
+def test_oversized_downloads_are_abandoned(monkeypatch):
+    monkeypatch.setattr(medical_chat, "IMAGE_MAX_BYTES", 100)
+    requested, downloads = patch_fetches(monkeypatch, FakeResponse(b"x" * 1000))
+    image, _, _ = medical_chat._fetch_image(f"{medical_chat.SUPABASE_STORAGE_PREFIX}bucket/big.png", None)
+    assert downloads == ["big.png"]
+    assert image.data == b"from-storage-api"
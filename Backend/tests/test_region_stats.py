@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import region_stats
+from region_stats import MomentAccumulator, RegionStatsStore, refresh_region_stats
+
+
+def test_undefined_correlations_are_json_null():
+    frame = pd.DataFrame({"heart_rate": [70.0, 80.0, 90.0], "constant": [1.0, 1.0, 1.0],
+                          "sparse": [np.nan, np.nan, 5.0]})
+    correlations = MomentAccumulator().update(frame).correlations()
+    assert correlations["heart_rate"]["heart_rate"] == 1.0
+    assert correlations["constant"]["heart_rate"] is None
+    assert correlations["sparse"]["heart_rate"] is None
+    json.loads(json.dumps(correlations, allow_nan=False))
+
+
+def test_refresh_rebuilds_after_deletion(tmp_path, monkeypatch):
+    table = [{"id": i, "heart_rate": 60.0 + i, "created_at": f"2026-01-0{i + 1}",
+              "updated_at": f"2026-01-0{i + 1}"} for i in range(4)]
+
+    def pages(region_id, extra_columns=(), updated_since=None, **kwargs):
+        rows = [dict(row) for row in table if updated_since is None or row["updated_at"] > updated_since]
+        return [rows] if rows else []
+
+    monkeypatch.setattr(region_stats, "region_stats_store", RegionStatsStore(str(tmp_path)))
+    monkeypatch.setattr(region_stats, "iter_health_record_pages", pages)
+    monkeypatch.setattr(region_stats, "fetch_region_row_count", lambda region_id: len(table))
+
+    assert refresh_region_stats("r1").statistics()["heart_rate"]["count"] == 4
+    del table[0]
+    stats = refresh_region_stats("r1").statistics()["heart_rate"]
+    assert stats["count"] == 3
+    assert stats["min"] == 61.0
+
+
+
+def test_refresh_rebuilds_when_rows_were_missed(tmp_path, monkeypatch):
+    table = [{"id": i, "heart_rate": 60.0 + i, "created_at": f"2026-01-0{i + 1}",
+              "updated_at": f"2026-01-0{i + 1}"} for i in range(4)]
+
+    def pages(region_id, extra_columns=(), updated_since=None, **kwargs):
+        rows = [dict(row) for row in table if updated_since is None or row["updated_at"] > updated_since]
+        return [rows] if rows else []
+
+    monkeypatch.setattr(region_stats, "region_stats_store", RegionStatsStore(str(tmp_path)))
+    monkeypatch.setattr(region_stats, "iter_health_record_pages", pages)
+    monkeypatch.setattr(region_stats, "fetch_region_row_count", lambda region_id: len(table))
+
+    refresh_region_stats("r1")
+    # The insert shares the watermark timestamp, so the incremental fetch does not return it
+    # and fewer rows are counted than the region holds
+    table.append({"id": 9, "heart_rate": 90.0, "created_at": "2026-01-04", "updated_at": "2026-01-04"})
+    stats = refresh_region_stats("r1").statistics()["heart_rate"]
+    assert stats["count"] == 5
+    assert stats["max"] == 90.0
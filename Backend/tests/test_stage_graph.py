@@ -0,0 +1,34 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import medical_chat
+from stage_graph import StageGraph
+
+
+def test_dependent_stage_gets_result_and_waits():
+    def fetch():
+        time.sleep(0.1)
+        return "image"
+
+    graph = StageGraph()
+    graph.add("fetch", fetch)
+    graph.add("analyze", lambda fetch: f"analysis of {fetch}", depends_on=("fetch",))
+    graph.add("routing", lambda: time.sleep(0.1) or "B")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results, timings = graph.run(executor)
+
+    assert results == {"fetch": "image", "analyze": "analysis of image", "routing": "B"}
+    assert timings["analyze"]["start"] >= timings["fetch"]["start"] + timings["fetch"]["seconds"]
+    # The independent stage ran alongside the fetch
+    assert timings["routing"]["start"] < timings["fetch"]["seconds"]
+
+
+def test_chat_image_fetch_and_vision_are_separate_stages(monkeypatch):
+    monkeypatch.setattr(medical_chat, "fetch_chat_image", lambda url: (None, "image", "etag"))
+    monkeypatch.setattr(medical_chat, "analyze_chat_image", lambda url, fetched: f"analysis of {fetched[1]}")
+    monkeypatch.setattr(medical_chat, "build_chat_context", lambda conversation, session_id: "context")
+    image_analysis, option, _, context, timings = medical_chat.prepare_chat_stages(
+        "question", [], option="A", img_url="https://example.com/a.png")
+
+    assert (image_analysis, option, context) == ("analysis of image", "A", "context")
+    assert {"image_fetch", "image_analysis", "context"} <= set(timings)
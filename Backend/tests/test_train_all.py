@@ -0,0 +1,55 @@
+import os
+import json
+import pytest
+import train_all
+
+HEART_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "heart", "data", "heart.csv")
+
+
+def write_run(output_dir, run_name, files, manifest):
+    run_dir = output_dir / "runs" / run_name
+    run_dir.mkdir(parents=True)
+    for filename, content in files.items():
+        (run_dir / filename).write_bytes(content)
+    (run_dir / "manifest.json").write_text(json.dumps(manifest))
+    (output_dir / "current").write_text(run_name)
+    return run_dir
+
+
+def test_merge_manifest_keeps_previous_entries(tmp_path):
+    write_run(tmp_path, "r0", {"randomforest_model.pkl": b"rf"}, {"artifacts": {
+        "random_forest": {"file": "randomforest_model.pkl", "accuracy": 0.87},
+        "xgboost": {"file": "xgboost_model.pkl", "accuracy": 0.85},
+        "ann": {"file": "ann_model.h5", "accuracy": 0.86}
+    }})
+    manifest = {"artifacts": {"xgboost": {"file": "xgboost_model.pkl", "accuracy": 0.9}}}
+    merged = train_all._merge_manifest(train_all.current_run_dir(str(tmp_path)), manifest)
+    # The ANN entry is dropped because its file is gone; the retrained xgboost entry wins
+    assert merged["artifacts"] == {
+        "random_forest": {"file": "randomforest_model.pkl", "accuracy": 0.87},
+        "xgboost": {"file": "xgboost_model.pkl", "accuracy": 0.9}
+    }
+
+
+def test_subset_run_publishes_new_run_with_previous_encoder(tmp_path):
+    pytest.importorskip("xgboost")
+    previous = write_run(tmp_path, "r0", {"ann_model.h5": b"ann", "heart_encoder.json": b"{}"}, {"artifacts": {
+        "ann": {"file": "ann_model.h5", "accuracy": 0.86}
+    }})
+    manifest = train_all.train_all(("xgboost",), str(tmp_path), HEART_CSV, workers=1)
+
+    run_dir = tmp_path / "runs" / manifest["run"]
+    assert (tmp_path / "current").read_text() == manifest["run"]
+    assert sorted(os.listdir(run_dir)) == ["ann_model.h5", "heart_encoder.json", "manifest.json", "xgboost_model.pkl"]
+    assert sorted(json.loads((run_dir / "manifest.json").read_text())["artifacts"]) == ["ann", "xgboost"]
+    # The kept ANN keeps the scaler it was trained with, and the previous run is left untouched
+    assert (run_dir / "heart_encoder.json").read_bytes() == b"{}"
+    assert manifest["encoder"]["sha256"] == train_all.sha256(str(previous / "heart_encoder.json"))
+    assert sorted(os.listdir(previous)) == ["ann_model.h5", "heart_encoder.json", "manifest.json"]
+
+
+def test_prune_runs_keeps_newest_and_staging(tmp_path):
+    for name in ("r1", "r2", "r3", "r4", ".staging-x"):
+        (tmp_path / "runs" / name).mkdir(parents=True)
+    train_all._prune_runs(str(tmp_path), keep=2)
+    assert sorted(os.listdir(tmp_path / "runs")) == [".staging-x", "r3", "r4"]
@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("xgboost")
+from sklearn.datasets import make_classification  # noqa: E402
+from xgb_search import successive_halving  # noqa: E402
+
+SPACE = {"max_depth": [2, 3, 4], "learning_rate": [0.05, 0.1, 0.3], "subsample": [0.8, 1.0]}
+BASE_PARAMS = {"objective": "binary:logistic", "eval_metric": "logloss", "random_state": 42}
+
+
+def search(journal_path, **kwargs):
+    X, y = make_classification(n_samples=240, n_features=8, random_state=0)
+    return successive_halving(X, y, SPACE, BASE_PARAMS, n_candidates=9, min_rounds=10, max_rounds=90, eta=3,
+                              journal_path=journal_path, **kwargs)
+
+
+def test_rerun_reuses_the_journal(tmp_path):
+    journal_path = str(tmp_path / "trials.jsonl")
+    first = search(journal_path)
+    assert first["fits"] == 3 * (9 + 3 + 1) and not first["partial"]
+
+    rerun = search(journal_path)
+    assert rerun["fits"] == 0
+    assert (rerun["params"], rerun["n_estimators"], rerun["scores"], rerun["rounds"]) == \
+        (first["params"], first["n_estimators"], first["scores"], first["rounds"])
+
+
+def test_budget_cut_rung_is_flagged_partial(tmp_path):
+    # Room for the 9 first-rung configurations and 2 of the 3 second-rung ones
+    result = search(str(tmp_path / "trials.jsonl"), max_fits=3 * 11)
+    assert result["fits"] == 33
+    assert result["partial"] and result["rounds"] == 30